@@ -0,0 +1,83 @@
+"""Micro-benchmark of the download write loop: 8KiB aiofiles writes vs BlockWriter.
+
+The file server runs in a subprocess so CPU time measured here belongs to the
+client only. Usage: python benchmarks/bench_download_writer.py [--size-mb 512]
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+async def legacy_download(session, url: str, filename: str):
+    """The original download_file_async inner loop"""
+    import aiofiles
+    
+    async with session.get(url) as response:
+        async with aiofiles.open(filename, 'wb') as file:
+            async for chunk in response.content.iter_chunked(8192):
+                await file.write(chunk)
+
+
+async def run(size_mb: int, rounds: int):
+    import aiohttp
+    from main import HttpClient, SegmentedDownloader
+    
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'benchmarks', 'range_server.py'), '--size-mb', str(size_mb)],
+        stdout=subprocess.PIPE, text=True
+    )
+    base_url = server.stdout.readline().strip()
+    http = HttpClient()
+    await http.start()
+    
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            target = os.path.join(workdir, 'out.bin')
+            downloader = SegmentedDownloader(http)
+            cases = [
+                ('8KiB chunks + aiofiles', lambda: legacy_download(http.session, f"{base_url}/norange", target)),
+                ('BlockWriter + pwrite', lambda: downloader.download(f"{base_url}/norange", target))
+            ]
+            
+            print(f"{size_mb}MB over loopback, best of {rounds}")
+            for name, factory in cases:
+                best = None
+                for _ in range(rounds):
+                    cpu_before, wall_before = cpu_seconds(), time.perf_counter()
+                    await factory()
+                    cpu, wall = cpu_seconds() - cpu_before, time.perf_counter() - wall_before
+                    assert os.path.getsize(target) == size_mb * 1024 * 1024
+                    os.remove(target)
+                    if best is None or wall < best[0]:
+                        best = (wall, cpu)
+                wall, cpu = best
+                print(f"  {name:<24} {size_mb / wall:8.1f}MB/s  {cpu / (size_mb / 1024):6.2f} CPU-s/GB")
+    finally:
+        await http.close()
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size-mb', type=int, default=512)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.size_mb, args.rounds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Micro-benchmark of snapdownloader page parsing: BeautifulSoup/regex vs the lxml pull extractors.
+
+Fixtures in benchmarks/fixtures are saved (synthetic, anonymised) result pages.
+Reports time per page and peak Python allocations for each implementation.
+Usage: python benchmarks/bench_extractors.py [--rounds 200]
+"""
+import argparse
+import html
+import os
+import re
+import sys
+import timeit
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+
+
+def legacy_reel(html_content: str):
+    """The original get_reel_data parsing"""
+    video_match = re.search(r'<a[^>]+href="([^"]+\.mp4[^"]*)"[^>]*>', html_content)
+    if video_match:
+        return html.unescape(video_match.group(1))
+    return ""
+
+
+def legacy_photo(html_content: str):
+    """The original get_photo_data parsing"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for res in ['1080 x 1080', '750 x 750', '640 x 640']:
+        links = []
+        for link in soup.find_all('a', class_=lambda x: x and 'btn-download' in x):
+            text = link.get_text(strip=True)
+            href = link.get('href', '')
+            if (f"Download ({res})" in text or res.replace(' x ', 'x') in href) and href:
+                links.append(html.unescape(href))
+        if links:
+            return links
+    return []
+
+
+def measure(func, page, rounds: int):
+    seconds = timeit.timeit(lambda: func(page), number=rounds) / rounds
+    tracemalloc.start()
+    func(page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    from main import extract_page
+
+    cases = [
+        ('reel', 'snapdownloader_reel.html', legacy_reel, 'snapdownloader_reel'),
+        ('photo', 'snapdownloader_photo.html', legacy_photo, 'snapdownloader_photo'),
+    ]
+
+    for label, fixture, legacy, extractor_name in cases:
+        with open(os.path.join(FIXTURES, fixture), 'rb') as file:
+            raw = file.read()
+        text = raw.decode('utf-8')
+
+        def extractor(page, name=extractor_name):
+            return extract_page(name, page)
+
+        expected = legacy(text)
+        actual = extractor(raw)
+        if expected != actual:
+            raise SystemExit(f"{label}: extractor output differs from legacy parser\n{expected}\n{actual}")
+
+        print(f"{label} ({len(raw) / 1024:.0f} KiB):")
+        for name, func, page in (('legacy', legacy, text), ('extractor', extractor, raw)):
+            seconds, peak = measure(func, page, args.rounds)
+            print(f"  {name:10s} {seconds * 1000:8.3f} ms/page  peak alloc {peak / 1024:8.1f} KiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark single-stream vs segmented downloads against a throttled local server.
+
+Usage: python benchmarks/bench_segmented_download.py [--size-mb 64] [--bandwidth-mb 4]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from range_server import RangeFileServer, payload_slice
+
+
+def matches_payload(path: str, size: int, block: int = 4 * 1024 * 1024):
+    """Whether the whole file at ``path`` is the server's ``size``-byte payload"""
+    if os.path.getsize(path) != size:
+        return False
+    with open(path, 'rb') as f:
+        for start in range(0, size, block):
+            data = f.read(block)
+            if data != payload_slice(start, start + len(data) - 1):
+                return False
+    return True
+
+
+async def run(size_mb: int, bandwidth_mb: float, segments: int, max_segments: int):
+    from main import HttpClient, SegmentedDownloader
+    
+    size = size_mb * 1024 * 1024
+    server = await RangeFileServer(size, bandwidth_per_connection=int(bandwidth_mb * 1024 * 1024)).start()
+    http = HttpClient(limit_per_host=max_segments + 2)
+    await http.start()
+    
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            cases = [
+                ('single stream', f"{server.url}/norange", SegmentedDownloader(http)),
+                (f'segmented ({segments}->{max_segments})', f"{server.url}/file",
+                 SegmentedDownloader(http, initial_segments=segments, max_segments=max_segments))
+            ]
+            for name, url, downloader in cases:
+                target = os.path.join(workdir, 'out.bin')
+                started = time.perf_counter()
+                ok = await downloader.download(url, target)
+                elapsed = time.perf_counter() - started
+                
+                valid = ok and matches_payload(target, size)
+                results.append((name, elapsed, size / elapsed / 1024 / 1024, valid))
+                os.remove(target)
+    finally:
+        await http.close()
+        await server.stop()
+    
+    print(f"{size_mb}MB file, {bandwidth_mb}MB/s per connection")
+    for name, elapsed, rate, valid in results:
+        print(f"  {name:<24} {elapsed:7.2f}s {rate:8.1f}MB/s  {'ok' if valid else 'INVALID'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--bandwidth-mb', type=float, default=4)
+    parser.add_argument('--segments', type=int, default=4)
+    parser.add_argument('--max-segments', type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(run(args.size_mb, args.bandwidth_mb, args.segments, args.max_segments))
+
+
+if __name__ == '__main__':
+    main()
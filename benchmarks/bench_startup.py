@@ -0,0 +1,129 @@
+"""Cold-start benchmark: import cost of main.py and time until the bot can serve requests.
+
+Each run starts a fresh interpreter in an empty work directory with dummy
+credentials, so nothing is cached between runs except bytecode.
+- ``import``: ``python -X importtime -c "import main"``. Reports the total
+  and the heaviest top-level imports.
+- ``ready``: time from process spawn until ``startup()`` returns, i.e. the
+  point where handlers can answer /start once the Telegram client is
+  connected. Telegram itself is not contacted. The browser warm-up that
+  continues in the background is timed separately.
+
+Usage: python benchmarks/bench_startup.py [--runs 5] [--top 10]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+READY_SCRIPT = """
+import asyncio, sys, time
+sys.path.insert(0, %r)
+import main
+
+async def boot():
+    bot = main.InstagramDownloaderBot()
+    await bot.startup()
+    print("READY", flush=True)
+    started = time.monotonic()
+    await bot.browser_pool.ready()
+    print("WARM", time.monotonic() - started, bot.browser_pool.available, flush=True)
+    await bot.shutdown()
+
+asyncio.run(boot())
+""" % ROOT
+
+
+def environment(workdir: str):
+    env = dict(os.environ)
+    env.update({
+        'API_ID': '1',
+        'API_HASH': 'startup-bench',
+        'BOT_TOKEN': '1:startup-bench',
+        'METRICS_PORT': '0',
+        'BOT_WORKERS': '0',
+        'FILE_ID_CACHE_PATH': os.path.join(workdir, 'cache', 'file_ids.db'),
+        'PYTHONPATH': ROOT
+    })
+    return env
+
+
+def measure_import(workdir: str):
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        cwd=workdir, env=environment(workdir), capture_output=True, text=True, check=True
+    )
+    modules = []
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)', line)
+        if match:
+            modules.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3))))
+    total = next(cumulative for name, _, cumulative, _ in modules if name == 'main')
+    # main is reported at depth 1, its direct imports at depth 3
+    direct = [(name, cumulative) for name, _, cumulative, depth in modules if depth == 3]
+    return total / 1e6, direct
+
+
+def measure_ready(workdir: str):
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, '-c', READY_SCRIPT],
+        cwd=workdir, env=environment(workdir), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    ready = warm = None
+    available = False
+    for line in process.stdout:
+        if line.startswith('READY'):
+            ready = time.monotonic() - started
+        elif line.startswith('WARM'):
+            _, seconds, available = line.split()
+            warm = float(seconds)
+            available = available == 'True'
+    process.wait()
+    return ready, warm, available
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args()
+
+    imports, readies, warms = [], [], []
+    heaviest = {}
+    available = False
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory(prefix='bot-startup-') as workdir:
+            total, direct = measure_import(workdir)
+            imports.append(total)
+            for name, cumulative in direct:
+                heaviest.setdefault(name, []).append(cumulative / 1e6)
+
+        with tempfile.TemporaryDirectory(prefix='bot-startup-') as workdir:
+            ready, warm, available = measure_ready(workdir)
+            readies.append(ready)
+            if warm is not None:
+                warms.append(warm)
+
+    print(f"{args.runs} runs, median (min)")
+    print(f"  import main      {statistics.median(imports):7.3f}s ({min(imports):.3f}s)")
+    print(f"  spawn to ready   {statistics.median(readies):7.3f}s ({min(readies):.3f}s)")
+    if available and warms:
+        print(f"  browser warm-up  {statistics.median(warms):7.3f}s after ready, in the background")
+    else:
+        print("  browser warm-up  skipped, Playwright is not available")
+
+    print(f"\nheaviest direct imports of main (median cumulative):")
+    ranked = sorted(((statistics.median(times), name) for name, times in heaviest.items()), reverse=True)
+    for seconds, name in ranked[:args.top]:
+        print(f"  {name:32s} {seconds * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
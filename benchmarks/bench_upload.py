@@ -0,0 +1,102 @@
+"""Benchmark the parallel part uploader against simulated MTProto media sessions.
+
+Each fake session models one connection: payloads are serialized over a link
+of fixed bandwidth, and every request also pays a round trip. Optional FloodWait
+injection exercises the adaptive back-off.
+
+Usage: python benchmarks/bench_upload.py [--size-mb 100] [--rtt-ms 80] [--session-mb 4]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeSession:
+    """Stand-in for pyrogram.session.Session that records uploaded parts"""
+    
+    def __init__(self, recorder: dict, rtt: float, bandwidth: float, flood_rate: float):
+        self.recorder = recorder
+        self.rtt = rtt
+        self.bandwidth = bandwidth
+        self.flood_rate = flood_rate
+        self._link = asyncio.Lock()
+    
+    async def start(self):
+        await asyncio.sleep(self.rtt * 2)
+    
+    async def stop(self):
+        pass
+    
+    async def invoke(self, query):
+        from pyrogram.errors import FloodWait
+        
+        if self.flood_rate and random.random() < self.flood_rate:
+            await asyncio.sleep(self.rtt)
+            raise FloodWait(value=1)
+        
+        async with self._link:
+            await asyncio.sleep(len(query.bytes) / self.bandwidth)
+        await asyncio.sleep(self.rtt)
+        self.recorder[query.file_part] = len(query.bytes)
+        return True
+
+
+class FakeClient:
+    def rnd_id(self):
+        return random.getrandbits(63)
+
+
+async def run_case(size: int, workers: int, sessions: int, rtt: float, bandwidth: float, flood_rate: float):
+    from main import StreamingUploader
+    
+    recorder = {}
+    uploader = StreamingUploader(
+        FakeClient(), workers=workers, sessions=sessions,
+        session_factory=lambda: _session(recorder, rtt, bandwidth, flood_rate)
+    )
+    block = bytes(1024 * 1024)
+    
+    async def chunks():
+        for offset in range(0, size, len(block)):
+            yield block[:min(len(block), size - offset)]
+    
+    started = time.perf_counter()
+    input_file = await uploader.upload(chunks(), size, 'bench.bin')
+    elapsed = time.perf_counter() - started
+    assert sum(recorder.values()) == size and len(recorder) == input_file.parts
+    return elapsed, uploader.flood_waits
+
+
+async def _session(recorder, rtt, bandwidth, flood_rate):
+    return FakeSession(recorder, rtt, bandwidth, flood_rate)
+
+
+async def run(size_mb: int, rtt_ms: float, session_mb: float, flood_rate: float):
+    size = size_mb * 1024 * 1024
+    rtt = rtt_ms / 1000
+    bandwidth = session_mb * 1024 * 1024
+    cases = [(1, 1), (4, 1), (4, 2), (4, 4), (8, 4)]
+    
+    print(f"{size_mb}MB, {rtt_ms:.0f}ms RTT, {session_mb}MB/s per session, flood rate {flood_rate}")
+    for workers, sessions in cases:
+        elapsed, flood_waits = await run_case(size, workers, sessions, rtt, bandwidth, flood_rate)
+        print(f"  {workers} workers x {sessions} sessions  {elapsed:7.2f}s {size_mb / elapsed:7.1f}MB/s  floodwaits={flood_waits}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--size-mb', type=int, default=100)
+    parser.add_argument('--rtt-ms', type=float, default=80)
+    parser.add_argument('--session-mb', type=float, default=4)
+    parser.add_argument('--flood-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.size_mb, args.rtt_ms, args.session_mb, args.flood_rate))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""Fuzz and throughput check of UrlRouter against the original per-pattern extraction.
+
+The fuzz pass checks, on randomly generated messages, that:
+- the router never raises;
+- it finds every link the old patterns found;
+- every route it returns routes back to itself;
+- links pasted without a separator are still split apart.
+
+The benchmark then times both implementations on large messages.
+Usage: python benchmarks/bench_url_router.py [--messages 2000] [--size-kb 64]
+"""
+import argparse
+import os
+import random
+import re
+import string
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def legacy_extract(text: str):
+    """The original extract_all_urls followed by the handle_message dedup"""
+    from main import normalize_url
+
+    instagram_urls = re.findall(r'https?://(?:www\.)?instagram\.com/(?:reel|p)/[a-zA-Z0-9_-]+/?', text)
+    terabox_patterns = [
+        r'https?://(?:www\.)?terabox\.com/s/[a-zA-Z0-9_-]+/?',
+        r'https?://(?:www\.)?terabox\.com/sharing/link\?surl=[a-zA-Z0-9_-]+',
+        r'https?://(?:www\.)?1024tera\.com/s/[a-zA-Z0-9_-]+/?'
+    ]
+    terabox_urls = []
+    for pattern in terabox_patterns:
+        terabox_urls.extend(re.findall(pattern, text))
+
+    urls = []
+    seen = set()
+    for url in terabox_urls + instagram_urls:
+        key = normalize_url(url)
+        if key not in seen:
+            seen.add(key)
+            urls.append(url)
+    return urls
+
+
+def random_id(rng):
+    return ''.join(rng.choice(string.ascii_letters + string.digits + '_-') for _ in range(rng.randint(6, 24)))
+
+
+def random_link(rng, domains):
+    scheme = rng.choice(['http', 'https'])
+    prefix = rng.choice(['', 'www.', 'm.'])
+    domain = rng.choice(domains)
+    if 'instagram' in domain:
+        path = rng.choice(['/reel/', '/p/', '/reels/', '/stories/', '/explore/']) + random_id(rng)
+    else:
+        path = rng.choice(['/s/' + random_id(rng), '/sharing/link?surl=' + random_id(rng), '/main?category=all'])
+    return f"{scheme}://{prefix}{domain}{path}{rng.choice(['', '/', '?igsh=abc', ')', '.'])}"
+
+
+def random_noise(rng, size: int):
+    alphabet = string.ascii_letters + string.digits + ' \n\t.,:/?&=()[]<>"\'' + 'привет🎬'
+    return ''.join(rng.choice(alphabet) for _ in range(size))
+
+
+def random_message(rng, domains, size: int, links: int):
+    parts = []
+    for _ in range(links):
+        parts.append(random_noise(rng, rng.randint(0, max(1, size // max(links, 1)))))
+        parts.append(random_link(rng, domains + ['example.com', 'terabox.com.evil.net', 'notinstagram.com']))
+    parts.append(random_noise(rng, rng.randint(0, 64)))
+    return rng.choice([' ', '\n', ' | ']).join(parts)
+
+
+def fuzz(router, domains, messages: int, seed: int):
+    rng = random.Random(seed)
+    for index in range(messages):
+        text = random_message(rng, domains, rng.randint(0, 2048), rng.randint(0, 12))
+        routes = router.routes(text)
+
+        keys = {route.key for route in routes}
+        for url in legacy_extract(text):
+            route = router.route(url)
+            if route is None or route.key not in keys:
+                raise SystemExit(f"message {index}: router missed {url!r}")
+
+        for route in routes:
+            if router.route(route.url) != route:
+                raise SystemExit(f"message {index}: {route.url!r} does not route back to itself")
+
+        first, second = random_link(rng, domains), random_link(rng, domains)
+        expected = [route.url for route in router.routes(f"{first} {second}")]
+        glued = [route.url for route in router.routes(first + second)]
+        if [url.rstrip('/') for url in glued] != [url.rstrip('/') for url in expected]:
+            raise SystemExit(f"glued links {first + second!r} routed to {glued}, expected {expected}")
+    print(f"fuzz: {messages} messages ok")
+
+
+def bench(router, domains, size_kb: int, rounds: int):
+    rng = random.Random(1)
+    messages = (
+        ('with links', random_message(rng, domains, size_kb * 1024, size_kb // 4)),
+        ('no links', random_noise(rng, size_kb * 1024)),
+    )
+
+    for label, text in messages:
+        print(f" {label}:")
+        for name, func in (('legacy', legacy_extract), ('router', router.routes)):
+            start = time.perf_counter()
+            for _ in range(rounds):
+                found = func(text)
+            elapsed = (time.perf_counter() - start) / rounds
+            rate = len(text) / elapsed / 1024 / 1024
+            print(f"  {name:7s} {elapsed * 1000:8.3f} ms/message  {rate:8.1f} MB/s  {len(found)} links")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--size-kb', type=int, default=64)
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    from main import URL_PROVIDERS, UrlRouter
+
+    router = UrlRouter()
+    domains = [domain for provider in URL_PROVIDERS for domain in provider['domains']]
+
+    fuzz(router, domains, args.messages, args.seed)
+    print(f"throughput on a {args.size_kb} KiB message:")
+    bench(router, domains, args.size_kb, args.rounds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+"""End-to-end load test of InstagramDownloaderBot against local stand-ins.
+
+Runs the real bot pipeline: routing, scheduler, resolvers, downloader and
+uploader. Everything it talks to is replaced:
+- standins.py, in a subprocess, serves the fastbox stub, the snapdownloader
+  fixture pages and the file server;
+- a fake Telegram records every message and upload, and charges upload time
+  at a fixed bandwidth.
+
+Synthetic users send links drawn from a configurable mix and size range. The
+report covers throughput, p50/p95/p99 per pipeline stage, peak RSS and peak
+spool disk use.
+
+Usage: python benchmarks/load_test.py [--users 20] [--messages 5] [--mix terabox=4,reel=4,photo=2] [--batch-size 1]
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import logging
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT)
+
+MB = 1024 * 1024
+
+
+class FakeTelegram:
+    """Records what the bot sends, charging uploads ``rtt + size / bandwidth``"""
+
+    def __init__(self, bandwidth: float, rtt: float):
+        self.bandwidth = bandwidth
+        self.rtt = rtt
+        self.deliveries = collections.defaultdict(list)
+        self.texts = 0
+        self.edits = 0
+        self._ids = itertools.count(1)
+
+    def message(self, user_id: int, text: str = None, root=None):
+        return FakeMessage(self, next(self._ids), user_id, text, root)
+
+    @staticmethod
+    def media_size(media):
+        if hasattr(media, 'getbuffer'):
+            return media.getbuffer().nbytes
+        if isinstance(media, str) and os.path.exists(media):
+            return os.path.getsize(media)
+        return 0
+
+    async def deliver(self, original, kind: str, size: int, simulate: bool = True):
+        if simulate:
+            await asyncio.sleep(self.rtt + size / self.bandwidth)
+        self.deliveries[original.root.id].append((kind, size, time.monotonic()))
+        sent = self.message(original.user_id, root=original.root)
+        setattr(sent, kind, SimpleNamespace(file_id=f"bench-{kind}-{sent.id}"))
+        return sent
+
+
+class FakeMessage:
+    """The subset of pyrogram.types.Message the bot uses"""
+
+    def __init__(self, telegram: FakeTelegram, message_id: int, user_id: int, text: str = None, root=None):
+        self.telegram = telegram
+        self.id = message_id
+        self.user_id = user_id
+        self.text = text
+        self.root = root or self
+        self.chat = SimpleNamespace(id=user_id)
+        self.from_user = SimpleNamespace(id=user_id)
+        self.video = self.document = self.photo = None
+        self.sent_at = time.monotonic()
+
+    async def reply_text(self, text, **kwargs):
+        self.telegram.texts += 1
+        return self.telegram.message(self.user_id, text, root=self.root)
+
+    async def edit_text(self, text, **kwargs):
+        self.telegram.edits += 1
+        self.text = text
+        return self
+
+    async def delete(self):
+        return True
+
+    async def reply_video(self, video, **kwargs):
+        return await self.telegram.deliver(self, 'video', self.telegram.media_size(video))
+
+    async def reply_document(self, document, **kwargs):
+        return await self.telegram.deliver(self, 'document', self.telegram.media_size(document))
+
+    async def reply_photo(self, photo, **kwargs):
+        return await self.telegram.deliver(self, 'photo', self.telegram.media_size(photo))
+
+    async def reply_media_group(self, media, **kwargs):
+        return [await self.telegram.deliver(self, 'photo', self.telegram.media_size(item.media)) for item in media]
+
+
+def parse_mix(text: str):
+    mix = {}
+    for part in text.split(','):
+        kind, weight = part.split('=')
+        mix[kind.strip()] = float(weight)
+    return mix
+
+
+def parse_sizes(text: str, unit: int):
+    return [int(float(value) * unit) for value in text.split(',')]
+
+
+def make_link(rng, kind: str, sizes: dict, serial: int):
+    size = rng.choice(sizes[kind])
+    if kind == 'terabox':
+        return f"https://terabox.com/s/1lt_{size}_{serial}"
+    if kind == 'reel':
+        return f"https://www.instagram.com/reel/lt_{size}_{serial}/"
+    return f"https://www.instagram.com/p/lt_{size}_{serial}/"
+
+
+def percentile(values: list, q: float):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def disk_usage(path: str):
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.stat(os.path.join(dirpath, name)).st_blocks * 512
+            except OSError:
+                pass
+    return total
+
+
+def start_standins(args):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, 'standins.py'),
+         '--bandwidth-mb', str(args.source_mb), '--failure-rate', str(args.failure_rate),
+         '--resolve-latency-ms', str(args.resolve_latency_ms),
+         '--resolve-error-rate', str(args.resolve_error_rate), '--resolve-stall-rate', str(args.resolve_stall_rate),
+         '--resolve-stall-seconds', str(args.resolve_stall_seconds)],
+        stdout=subprocess.PIPE, text=True, cwd=BENCH_DIR
+    )
+    return process, process.stdout.readline().strip()
+
+
+async def run(args, base_url: str):
+    import main
+    from bench_upload import FakeSession
+    from main import InstagramDownloaderBot, metrics
+
+    main.setup_logging('bot.log')
+    if not args.verbose:
+        main.logger.setLevel(logging.WARNING)
+
+    stage_samples = collections.defaultdict(list)
+    stage_misses = collections.Counter()
+    job_samples = []
+    record_stage, observe = metrics.record_stage, metrics.observe
+
+    def capture_stage(stage, seconds, outcome):
+        if outcome == 'ok':
+            stage_samples[stage].append(seconds)
+        else:
+            stage_misses[stage] += 1
+        record_stage(stage, seconds, outcome)
+
+    def capture_observe(name, value, **labels):
+        if name == 'bot_job_seconds':
+            job_samples.append(value)
+        observe(name, value, **labels)
+
+    metrics.record_stage = capture_stage
+    metrics.observe = capture_observe
+
+    telegram = FakeTelegram(args.upload_mb * MB, args.rtt_ms / 1000)
+    bot = InstagramDownloaderBot()
+    bot.terabox_api_url = f"{base_url}/fastbox.php"
+    bot.snapdownloader_url = base_url
+
+    async def fake_session():
+        return FakeSession({}, args.rtt_ms / 1000, args.upload_mb * MB, 0.0)
+
+    async def fake_send(original_message, input_file, file_name, is_video, caption):
+        size = input_file.parts * bot.uploader.PART_SIZE
+        return await telegram.deliver(original_message, 'video' if is_video else 'document', size, simulate=False)
+
+    bot.uploader.session_factory = fake_session
+    bot.uploader.send = fake_send
+
+    await bot.startup()
+    if not bot.browser_pool.available:
+        print("Playwright unavailable: challenge cookie pre-seeded, the 'challenge' stage is not exercised")
+        bot.challenge_cookies.store([{'name': 'bench_challenge', 'value': 'ok', 'expires': -1}])
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    sizes = {
+        'terabox': parse_sizes(args.terabox_sizes_mb, MB),
+        'reel': parse_sizes(args.reel_sizes_mb, MB),
+        'photo': parse_sizes(args.photo_sizes_kb, 1024)
+    }
+    serial = itertools.count()
+    sent_links = []
+    messages = []
+
+    peak = {'disk': 0}
+    sampling = True
+
+    async def sample_disk():
+        while sampling:
+            peak['disk'] = max(peak['disk'], disk_usage('./downloads'))
+            await asyncio.sleep(0.1)
+
+    async def user(user_id: int):
+        for _ in range(args.messages):
+            await asyncio.sleep(rng.expovariate(1000 / args.think_ms) if args.think_ms else 0)
+            links = []
+            for _ in range(args.batch_size):
+                if sent_links and rng.random() < args.repeat_rate:
+                    link = rng.choice(sent_links)
+                else:
+                    kind = rng.choices(list(mix), weights=list(mix.values()))[0]
+                    link = make_link(rng, kind, sizes, next(serial))
+                    sent_links.append(link)
+                links.append(link)
+            message = telegram.message(user_id, ' '.join(links))
+            messages.append(message)
+            await bot.handle_message(message)
+
+    sampler = asyncio.create_task(sample_disk())
+    started = time.monotonic()
+    await asyncio.gather(*(user(1000 + index) for index in range(args.users)))
+    while bot.scheduler.depth or bot.scheduler.stats()['active_jobs']:
+        await asyncio.sleep(0.05)
+    elapsed = time.monotonic() - started
+    sampling = False
+    await sampler
+    await bot.shutdown()
+
+    transferred = metrics._counters.get('bot_transfer_bytes_total', {})
+    downloaded = transferred.get((('direction', 'download'),), 0)
+    uploaded = transferred.get((('direction', 'upload'),), 0)
+    delivered = [message for message in messages if telegram.deliveries.get(message.id)]
+    latencies = [telegram.deliveries[message.id][-1][2] - message.sent_at for message in delivered]
+
+    print(f"\n{len(messages)} messages from {args.users} users in {elapsed:.1f}s")
+    print(f"  delivered      {len(delivered)}/{len(messages)}  ({len(messages) / elapsed:.2f} msg/s)")
+    print(f"  downloaded     {downloaded / MB:10.1f} MB  {downloaded / MB / elapsed:8.1f} MB/s")
+    print(f"  uploaded       {uploaded / MB:10.1f} MB  {uploaded / MB / elapsed:8.1f} MB/s")
+    print(f"  peak RSS       {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:10.1f} MB")
+    print(f"  peak disk      {peak['disk'] / MB:10.1f} MB")
+    print(f"  status edits   {telegram.edits}")
+    for name, upstream in bot.upstreams.items():
+        stats = upstream.stats()
+        print(f"  {name:14s} {stats['calls']} calls, {stats['retries']} retries, {stats['hedges']} hedges "
+              f"({stats['hedge_wins']} won), {stats['opens']} circuit opens, {stats['rejected']} rejected")
+
+    print(f"\n  {'stage (ok, seconds)':20s} {'count':>6s} {'not ok':>6s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>8s}")
+    stages = sorted(set(stage_samples) | set(stage_misses))
+    rows = [(stage, stage_samples[stage]) for stage in stages] + [('job run', job_samples), ('message e2e', latencies)]
+    for stage, values in rows:
+        print(f"  {stage:20s} {len(values):6d} {stage_misses[stage]:6d} {percentile(values, 50):8.3f} "
+              f"{percentile(values, 95):8.3f} {percentile(values, 99):8.3f} {max(values, default=0):8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--messages', type=int, default=5, help="messages per user")
+    parser.add_argument('--mix', default='terabox=4,reel=4,photo=2', help="link kind weights")
+    parser.add_argument('--batch-size', type=int, default=1, help="links per message, above 1 each message is a batch")
+    parser.add_argument('--terabox-sizes-mb', default='5,20,60')
+    parser.add_argument('--reel-sizes-mb', default='2,8')
+    parser.add_argument('--photo-sizes-kb', default='150,400')
+    parser.add_argument('--repeat-rate', type=float, default=0.1, help="share of messages resending an earlier link")
+    parser.add_argument('--think-ms', type=float, default=200, help="mean pause between a user's messages")
+    parser.add_argument('--source-mb', type=float, default=8, help="source bandwidth per connection")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="share of source responses cut short")
+    parser.add_argument('--resolve-latency-ms', type=float, default=150)
+    parser.add_argument('--resolve-error-rate', type=float, default=0.0, help="share of resolver answers that are 503")
+    parser.add_argument('--resolve-stall-rate', type=float, default=0.0, help="share of resolver answers held back")
+    parser.add_argument('--resolve-stall-seconds', type=float, default=30)
+    parser.add_argument('--upload-mb', type=float, default=10, help="Telegram bandwidth per session")
+    parser.add_argument('--rtt-ms', type=float, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--keep', action='store_true', help="keep the work directory")
+    parser.add_argument('--verbose', action='store_true', help="show the bot's info logging")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bot-load-')
+    os.environ.setdefault('API_ID', '1')
+    os.environ.setdefault('API_HASH', 'load-test')
+    os.environ.setdefault('BOT_TOKEN', '1:load-test')
+    os.environ['METRICS_PORT'] = '0'
+    os.environ['BOT_WORKERS'] = '0'
+    os.environ['FILE_ID_CACHE_PATH'] = os.path.join(workdir, 'cache', 'file_ids.db')
+    os.chdir(workdir)
+
+    process, base_url = start_standins(args)
+    try:
+        asyncio.run(run(args, base_url))
+    finally:
+        process.terminate()
+        process.wait()
+        if args.keep:
+            print(f"\nWork directory kept at {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
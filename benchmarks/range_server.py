@@ -0,0 +1,144 @@
+"""Local HTTP stand-in for TeraBox/CDN file hosts used by the benchmarks.
+
+Serves deterministic payloads with optional Range support, a per-connection
+bandwidth cap (TeraBox throttles each connection) and injected failures.
+"""
+import asyncio
+import random
+import re
+
+from aiohttp import web
+
+PATTERN = bytes(range(256)) * 4096
+
+
+def payload_slice(start: int, end: int):
+    """Return bytes ``start..end`` (inclusive) of the deterministic payload"""
+    out = bytearray()
+    position = start
+    while position <= end:
+        offset = position % len(PATTERN)
+        take = min(len(PATTERN) - offset, end - position + 1)
+        out += PATTERN[offset:offset + take]
+        position += take
+    return bytes(out)
+
+
+class RangeFileServer:
+    """aiohttp server exposing ``/file`` (range-capable), ``/norange`` and ``/files/{size}/{name}`` endpoints"""
+    
+    def __init__(self, size: int, bandwidth_per_connection: int = 0, failure_rate: float = 0.0,
+                 host: str = '127.0.0.1', port: int = 0):
+        self.size = size
+        self.bandwidth_per_connection = bandwidth_per_connection
+        self.failure_rate = failure_rate
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.bytes_sent = 0
+        self._runner = None
+    
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+    
+    async def start(self):
+        app = web.Application()
+        self.add_routes(app)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+    
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+    
+    def add_routes(self, app):
+        app.router.add_route('*', '/file', self.handle_file)
+        app.router.add_route('*', '/norange', self.handle_norange)
+        app.router.add_route('*', '/files/{size:\\d+}/{name}', self.handle_sized)
+    
+    async def handle_file(self, request):
+        return await self._serve(request, allow_ranges=True)
+    
+    async def handle_norange(self, request):
+        return await self._serve(request, allow_ranges=False)
+    
+    async def handle_sized(self, request):
+        return await self._serve(request, allow_ranges=True, size=int(request.match_info['size']))
+    
+    async def _serve(self, request, allow_ranges: bool, size: int = None):
+        self.requests += 1
+        size = self.size if size is None else size
+        start, end, status = 0, size - 1, 200
+        
+        range_header = request.headers.get('Range')
+        if allow_ranges and range_header:
+            match = re.match(r'bytes=(\d+)-(\d*)', range_header)
+            if match:
+                start = int(match.group(1))
+                end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+                status = 206
+        
+        headers = {
+            'Content-Length': str(end - start + 1),
+            'Content-Type': 'application/octet-stream',
+            'ETag': f'"bench-{size}"'
+        }
+        if allow_ranges:
+            headers['Accept-Ranges'] = 'bytes'
+        if status == 206:
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        
+        response = web.StreamResponse(status=status, headers=headers)
+        await response.prepare(request)
+        if request.method == 'HEAD':
+            return response
+        
+        fail_at = None
+        if self.failure_rate and random.random() < self.failure_rate:
+            fail_at = random.randint(start, end)
+        
+        block = 64 * 1024
+        position = start
+        while position <= end:
+            chunk_end = min(position + block - 1, end)
+            if fail_at is not None and chunk_end >= fail_at:
+                request.transport.close()
+                return response
+            chunk = payload_slice(position, chunk_end)
+            try:
+                await response.write(chunk)
+            except ConnectionResetError:
+                return response
+            self.bytes_sent += len(chunk)
+            position = chunk_end + 1
+            if self.bandwidth_per_connection:
+                await asyncio.sleep(len(chunk) / self.bandwidth_per_connection)
+        
+        await response.write_eof()
+        return response
+
+
+async def serve_forever(size: int, bandwidth_per_connection: int, failure_rate: float, port: int):
+    server = await RangeFileServer(size, bandwidth_per_connection, failure_rate, port=port).start()
+    print(server.url, flush=True)
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Run the benchmark file server standalone")
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--bandwidth-mb', type=float, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--port', type=int, default=0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve_forever(args.size_mb * 1024 * 1024, int(args.bandwidth_mb * 1024 * 1024), args.failure_rate, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,175 @@
+"""Local stand-ins for every upstream the bot talks to, served from one aiohttp app.
+
+- ``/fastbox.php``: TeraBox resolver stub. Without the challenge cookie it
+  returns a JS challenge page that sets the cookie and reloads with ``&i=1``.
+  With the cookie it returns the resolver JSON.
+- ``/tools/instagram-{reels,photo}-downloader/download``: snapdownloader
+  result pages built from the saved fixtures, with links pointing back here.
+- ``/files/{size}/{name}``: the range-capable file server from range_server.py.
+
+Resolver incidents are simulated with ``--resolve-error-rate`` (503 answers)
+and ``--resolve-stall-rate`` (answers held for ``--resolve-stall-seconds``).
+
+Load-test links carry their file size: TeraBox share IDs look like
+``1lt_<bytes>_<n>`` and Instagram shortcodes like ``lt_<bytes>_<n>``.
+Usage: python benchmarks/standins.py [--bandwidth-mb 8] [--failure-rate 0.01] [--resolve-error-rate 0.3]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+
+from aiohttp import web
+
+from range_server import RangeFileServer
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+FIXTURE_CDN = 'https://scontent.cdninstagram.com/v/t51.2885-15'
+CHALLENGE_COOKIE = 'bench_challenge'
+
+CHALLENGE_PAGE = """<!DOCTYPE html><html><head><title>Checking your browser</title></head>
+<body><noscript>Please enable JavaScript</noscript>
+<script>
+document.cookie = "%s=ok; path=/";
+location.href = location.href + (location.href.indexOf('?') < 0 ? '?' : '&') + 'i=1';
+</script></body></html>""" % CHALLENGE_COOKIE
+
+
+def link_size(url: str, default: int):
+    match = re.search(r'lt_(\d+)_', url)
+    return int(match.group(1)) if match else default
+
+
+def size_formatted(size: int):
+    if size >= 1024 * 1024 * 1024:
+        return f"{size / 1024 / 1024 / 1024:.2f} GB"
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.2f} MB"
+    return f"{size / 1024:.2f} KB"
+
+
+class StandinServer:
+    """Fastbox stub, snapdownloader fixture pages and file server on one port"""
+
+    def __init__(self, bandwidth_per_connection: int = 0, failure_rate: float = 0.0,
+                 resolve_latency: float = 0.0, host: str = '127.0.0.1', port: int = 0,
+                 resolve_error_rate: float = 0.0, resolve_stall_rate: float = 0.0, resolve_stall: float = 30.0):
+        self.files = RangeFileServer(0, bandwidth_per_connection, failure_rate, host=host)
+        self.resolve_latency = resolve_latency
+        self.resolve_error_rate = resolve_error_rate
+        self.resolve_stall_rate = resolve_stall_rate
+        self.resolve_stall = resolve_stall
+        self.host = host
+        self.port = port
+        self.challenges = 0
+        self.resolves = 0
+        self.pages = 0
+        self.errors = 0
+        self.stalls = 0
+        self._runner = None
+
+        with open(os.path.join(FIXTURES, 'snapdownloader_reel.html')) as file:
+            self.reel_page = file.read()
+        with open(os.path.join(FIXTURES, 'snapdownloader_photo.html')) as file:
+            self.photo_page = file.read()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/fastbox.php', self.handle_fastbox)
+        app.router.add_get('/tools/instagram-reels-downloader/download', self.handle_reel)
+        app.router.add_get('/tools/instagram-photo-downloader/download', self.handle_photo)
+        self.files.add_routes(app)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def _resolver_delay(self):
+        """Sleep the resolver latency, returning an error response for injected incidents"""
+        roll = random.random()
+        if roll < self.resolve_error_rate:
+            self.errors += 1
+            return web.Response(status=503, text="Service Unavailable")
+        if roll < self.resolve_error_rate + self.resolve_stall_rate:
+            self.stalls += 1
+            await asyncio.sleep(self.resolve_stall)
+        if self.resolve_latency:
+            await asyncio.sleep(self.resolve_latency)
+        return None
+
+    async def handle_fastbox(self, request):
+        if request.cookies.get(CHALLENGE_COOKIE) != 'ok' or request.query.get('i') != '1':
+            self.challenges += 1
+            return web.Response(text=CHALLENGE_PAGE, content_type='text/html')
+
+        self.resolves += 1
+        error = await self._resolver_delay()
+        if error:
+            return error
+
+        share_url = request.query.get('url', '')
+        size = link_size(share_url, 20 * 1024 * 1024)
+        share_id = re.sub(r'[^A-Za-z0-9_]', '_', share_url.rstrip('/').split('/')[-1].split('=')[-1])
+        payload = {
+            "status": "success",
+            "data": [{
+                "name": f"{share_id}.mp4",
+                "fast_stream_url": f"{self.url}/files/{size}/{share_id}.mp4",
+                "thumbnail": "",
+                "size_formatted": size_formatted(size)
+            }]
+        }
+        return web.Response(text=json.dumps(payload), content_type='text/html')
+
+    async def _page(self, template: str, request):
+        self.pages += 1
+        error = await self._resolver_delay()
+        if error:
+            return error
+        size = link_size(request.query.get('url', ''), 1024 * 1024)
+        return web.Response(text=template.replace(FIXTURE_CDN, f"{self.url}/files/{size}"), content_type='text/html')
+
+    async def handle_reel(self, request):
+        if '/p/' in request.query.get('url', ''):
+            return await self._page(self.photo_page, request)
+        return await self._page(self.reel_page, request)
+
+    async def handle_photo(self, request):
+        return await self._page(self.photo_page, request)
+
+
+async def serve_forever(args):
+    server = await StandinServer(
+        int(args.bandwidth_mb * 1024 * 1024), args.failure_rate, args.resolve_latency_ms / 1000, port=args.port,
+        resolve_error_rate=args.resolve_error_rate, resolve_stall_rate=args.resolve_stall_rate,
+        resolve_stall=args.resolve_stall_seconds
+    ).start()
+    print(server.url, flush=True)
+    await asyncio.Event().wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bandwidth-mb', type=float, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--resolve-latency-ms', type=float, default=0)
+    parser.add_argument('--resolve-error-rate', type=float, default=0.0, help="share of resolver answers that are 503")
+    parser.add_argument('--resolve-stall-rate', type=float, default=0.0, help="share of resolver answers held back")
+    parser.add_argument('--resolve-stall-seconds', type=float, default=30)
+    parser.add_argument('--port', type=int, default=0)
+    try:
+        asyncio.run(serve_forever(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -1,51 +1,2986 @@
 import logging
 import json
-import requests
 import re
 import html
 import os
-import tempfile
+import io
 import asyncio
-from datetime import datetime
-from bs4 import BeautifulSoup
-from pyrogram import Client, filters
-from pyrogram.types import Message
+import multiprocessing
+import time
+import hashlib
+import math
+import random
+import sqlite3
+import shutil
+import fcntl
+import itertools
+import atexit
+import copy
+import queue
+import uuid
+import bisect
+import functools
+import contextvars
+from collections import Counter, OrderedDict, deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from contextlib import asynccontextmanager, contextmanager, AsyncExitStack
+from typing import NamedTuple
+from pyrogram import Client, filters, idle, raw, utils
+from pyrogram.session import Session
+from pyrogram.types import Message, InputMediaPhoto, InputMediaVideo
 from pyrogram.errors import FloodWait, BadRequest, RPCError
 from pyrogram.enums import ParseMode
 import aiohttp
-import aiofiles
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
-)
+
 logger = logging.getLogger(__name__)
+# Hot-path messages (per chunk, per edit, per lookup) go here and are rate limited per call site
+sampled_logger = logging.getLogger(f"{__name__}.sampled")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line carrying the job and worker context of the record"""
+    
+    def format(self, record):
+        entry = {
+            "ts": f"{self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}.{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process
+        }
+        for key in ('job_id', 'worker', 'suppressed'):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        exc = self.formatException(record.exc_info) if record.exc_info else record.exc_text
+        if exc:
+            entry["exc"] = exc
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class StructuredQueueHandler(QueueHandler):
+    """Queue handler that keeps a record's traceback in ``exc_text`` instead of folding it into the message
+    
+    The stock ``prepare`` formats the traceback into ``msg`` and drops ``exc_info``,
+    which would leave the JSON ``exc`` field always empty.
+    """
+    
+    exception_formatter = logging.Formatter()
+    
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info:
+            record.exc_text = self.exception_formatter.formatException(record.exc_info)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class LogContextFilter(logging.Filter):
+    """Stamps records with the current job ID and worker index while still on the calling task"""
+    
+    def __init__(self, worker: int = None):
+        super().__init__()
+        self.worker = worker
+    
+    def filter(self, record):
+        trace = _current_trace.get()
+        record.job_id = trace.id if trace else None
+        record.worker = self.worker
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Lets ``burst`` records per call site through each ``window`` seconds, errors always pass"""
+    
+    def __init__(self, burst: int = 10, window: float = 60.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._sites = {}
+    
+    def filter(self, record):
+        if record.levelno >= logging.ERROR:
+            return True
+        
+        key = (record.pathname, record.lineno)
+        site = self._sites.get(key)
+        if site is None or record.created - site[0] >= self.window:
+            if site and site[2]:
+                record.suppressed = site[2]
+            self._sites[key] = [record.created, 1, 0]
+            return True
+        
+        site[1] += 1
+        if site[1] > self.burst:
+            site[2] += 1
+            return False
+        return True
+
+
+sampled_logger.addFilter(SamplingFilter(
+    burst=int(os.getenv('LOG_SAMPLE_BURST', '10')),
+    window=float(os.getenv('LOG_SAMPLE_WINDOW', '60'))
+))
+
+
+def setup_logging(log_file: str = None, worker: int = None):
+    """Send every record through a queue to a listener thread that formats and writes it, returns a stop function"""
+    log_file = log_file or os.getenv('LOG_FILE', 'bot.log')
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=int(os.getenv('LOG_MAX_MB', '20')) * 1024 * 1024,
+        backupCount=int(os.getenv('LOG_BACKUPS', '5')),
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = StructuredQueueHandler(log_queue)
+    queue_handler.addFilter(LogContextFilter(worker))
+    
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    stopped = False
+    
+    def stop():
+        nonlocal stopped
+        if not stopped:
+            stopped = True
+            listener.stop()
+    
+    atexit.register(stop)
+    return stop
+
+
+CHROMIUM_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-accelerated-2d-canvas',
+    '--no-first-run',
+    '--no-zygote',
+    '--disable-gpu',
+    '--disable-background-timer-throttling',
+    '--disable-backgrounding-occluded-windows',
+    '--disable-renderer-backgrounding',
+    '--disable-features=TranslateUI',
+    '--disable-extensions'
+]
+
+BROWSER_USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+class BrowserPool:
+    """Long-lived Chromium instance that leases isolated contexts up to a concurrency limit"""
+    
+    def __init__(self, max_contexts: int = 2, max_uses: int = 50):
+        self.max_contexts = max(1, max_contexts)
+        self.max_uses = max(1, max_uses)
+        
+        self._playwright = None
+        self._browser = None
+        self._browser_uses = 0
+        self._leases = {}
+        self._semaphore = asyncio.Semaphore(self.max_contexts)
+        self._lock = asyncio.Lock()
+        self._warm_up_task = None
+        
+        self.in_use = 0
+        self.waiting = 0
+        self.total_leases = 0
+        self.recycles = 0
+        self.crashes = 0
+        self.saturated_events = 0
+    
+    @property
+    def available(self):
+        return self._playwright is not None
+    
+    def warm_up(self):
+        """Start the pool in the background so startup does not wait for Chromium"""
+        if self._warm_up_task is None:
+            self._warm_up_task = asyncio.create_task(self.start())
+    
+    async def ready(self):
+        """Wait for a background warm-up to finish, returns whether the pool is usable"""
+        if self._warm_up_task is not None and not self._warm_up_task.done():
+            await asyncio.shield(self._warm_up_task)
+        return self.available
+    
+    async def start(self):
+        """Start the Playwright driver and launch the first browser"""
+        try:
+            from playwright.async_api import async_playwright
+        except ImportError:
+            logger.error("Playwright not installed, browser pool disabled")
+            return False
+        
+        try:
+            self._playwright = await async_playwright().start()
+            async with self._lock:
+                await self._launch_browser()
+            logger.info("Browser pool started (%s contexts, recycle after %s uses)", self.max_contexts, self.max_uses)
+            return True
+        except Exception as e:
+            logger.error("Error starting browser pool: %s", e)
+            await self.stop()
+            return False
+    
+    async def stop(self):
+        """Close every browser and the Playwright driver"""
+        task = self._warm_up_task
+        if task is not None and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        
+        for browser in list(self._leases):
+            await self._close_browser(browser)
+        self._browser = None
+        
+        if self._playwright:
+            try:
+                await self._playwright.stop()
+            except Exception as e:
+                logger.warning("Error stopping Playwright: %s", e)
+            self._playwright = None
+    
+    async def _launch_browser(self):
+        browser = await self._playwright.chromium.launch(headless=True, args=CHROMIUM_ARGS)
+        browser.on("disconnected", self._on_disconnected)
+        self._browser = browser
+        self._browser_uses = 0
+        self._leases[browser] = 0
+        return browser
+    
+    def _on_disconnected(self, browser):
+        if browser is self._browser:
+            self.crashes += 1
+            logger.warning("Pooled browser disconnected, a new one will be launched on next lease")
+            self._browser = None
+        self._leases.pop(browser, None)
+    
+    async def _close_browser(self, browser):
+        self._leases.pop(browser, None)
+        try:
+            if browser.is_connected():
+                await browser.close()
+        except Exception as e:
+            logger.warning("Error closing browser: %s", e)
+    
+    async def _acquire_browser(self):
+        async with self._lock:
+            browser = self._browser
+            
+            if browser is not None and (not browser.is_connected() or self._browser_uses >= self.max_uses):
+                if browser.is_connected():
+                    self.recycles += 1
+                    logger.info("Recycling browser after %s uses", self._browser_uses)
+                else:
+                    self.crashes += 1
+                self._browser = None
+                if self._leases.get(browser, 0) == 0:
+                    await self._close_browser(browser)
+            
+            if self._browser is None:
+                await self._launch_browser()
+            
+            self._browser_uses += 1
+            self._leases[self._browser] = self._leases.get(self._browser, 0) + 1
+            return self._browser
+    
+    async def _release_browser(self, browser):
+        async with self._lock:
+            if browser not in self._leases:
+                return
+            self._leases[browser] -= 1
+            if browser is not self._browser and self._leases[browser] <= 0:
+                await self._close_browser(browser)
+    
+    @asynccontextmanager
+    async def page(self):
+        """Lease a page in a fresh, isolated browser context"""
+        if not self.available:
+            raise RuntimeError("Browser pool is not running")
+        
+        if self.in_use >= self.max_contexts:
+            self.saturated_events += 1
+            sampled_logger.warning("Browser pool saturated: %s/%s in use, %s waiting", self.in_use, self.max_contexts, self.waiting + 1)
+        
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        
+        self.in_use += 1
+        self.total_leases += 1
+        browser = None
+        context = None
+        try:
+            browser = await self._acquire_browser()
+            context = await browser.new_context(
+                user_agent=BROWSER_USER_AGENT,
+                viewport={'width': 1920, 'height': 1080}
+            )
+            page = await context.new_page()
+            yield page
+        finally:
+            if context:
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.warning("Error closing browser context: %s", e)
+            if browser:
+                await self._release_browser(browser)
+            self.in_use -= 1
+            self._semaphore.release()
+    
+    def stats(self):
+        """Return pool usage and saturation counters"""
+        return {
+            "running": self.available,
+            "max_contexts": self.max_contexts,
+            "in_use": self.in_use,
+            "waiting": self.waiting,
+            "saturated": self.in_use >= self.max_contexts,
+            "saturated_events": self.saturated_events,
+            "browser_uses": self._browser_uses,
+            "total_leases": self.total_leases,
+            "recycles": self.recycles,
+            "crashes": self.crashes
+        }
+
+
+class ChallengeCookieCache:
+    """Holds the cookies set by a solved anti-bot challenge until they expire"""
+    
+    def __init__(self, ttl: int = 3600):
+        self.ttl = ttl
+        self._cookies = {}
+        self._expires_at = 0
+        
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def store(self, cookies: list):
+        """Store cookies as returned by a Playwright browser context"""
+        if not cookies:
+            return
+        
+        now = time.time()
+        expires_at = now + self.ttl
+        for cookie in cookies:
+            expires = cookie.get('expires', -1)
+            if expires and expires > 0:
+                expires_at = min(expires_at, expires)
+        
+        if expires_at <= now:
+            return
+        
+        self._cookies = {cookie['name']: cookie['value'] for cookie in cookies}
+        self._expires_at = expires_at
+        logger.info("Cached %s challenge cookie(s) for %.0fs", len(self._cookies), expires_at - now)
+    
+    def get(self):
+        """Return the cached cookies, or None when missing or expired"""
+        if self._cookies and time.time() < self._expires_at:
+            self.hits += 1
+            return dict(self._cookies)
+        
+        self.misses += 1
+        return None
+    
+    def invalidate(self):
+        if self._cookies:
+            self.invalidations += 1
+        self._cookies = {}
+        self._expires_at = 0
+
+
+def normalize_url(url: str):
+    """Normalize a share URL so equivalent links map to the same cache key"""
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    path = parts.path.rstrip('/') or '/'
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query) if k == 'surl'))
+    return urlunsplit(('https', host, path, query, ''))
+
+
+URL_PROVIDERS = [
+    {
+        'name': 'terabox',
+        'domains': [
+            'terabox.com', 'terabox.app', 'teraboxapp.com', 'teraboxlink.com', 'terasharelink.com',
+            'terafileshare.com', 'freeterabox.com', '1024tera.com', '1024terabox.com', '4funbox.com',
+            'mirrobox.com', 'nephobox.com', 'momerybox.com', 'tibibox.com'
+        ],
+        # (kind, path pattern, canonical path the cache key is built from); /s/ share IDs are the surl with a leading 1
+        'routes': [
+            ('terabox', r'/s/1?{id}/?', '/sharing/link?surl={id}'),
+            ('terabox', r'/sharing/link\?surl={id}', '/sharing/link?surl={id}'),
+        ]
+    },
+    {
+        'name': 'instagram',
+        'domains': ['instagram.com'],
+        'routes': [
+            ('instagram_reel', r'/reels?/{id}/?', '/reel/{id}'),
+            ('instagram_mixed', r'/p/{id}/?', '/p/{id}'),
+        ]
+    },
+]
+
+
+class Route(NamedTuple):
+    kind: str
+    provider: str
+    url: str
+    key: str
+
+
+class UrlRouter:
+    """Finds supported links in message text with one precompiled pattern over every provider domain"""
+    
+    ID_PATTERN = r'(?:(?!https?://)[A-Za-z0-9_-])+'
+    
+    def __init__(self, providers: list = URL_PROVIDERS):
+        self._providers = {}
+        domains = []
+        for provider in providers:
+            routes = [
+                (kind, re.compile(pattern.replace('{id}', f"(?P<id>{self.ID_PATTERN})"), re.IGNORECASE), key_path)
+                for kind, pattern, key_path in provider['routes']
+            ]
+            canonical = provider['domains'][0]
+            for domain in provider['domains']:
+                self._providers[domain] = (provider['name'], canonical, routes)
+                domains.append(domain)
+        
+        alternation = '|'.join(re.escape(domain) for domain in sorted(domains, key=len, reverse=True))
+        self._pattern = re.compile(
+            rf'(https?)://((?i:[A-Za-z0-9-]+\.)?(?i:({alternation})))([/?][^\s<>"\'\]\)]*)'
+        )
+    
+    def _route(self, match):
+        """Route a pattern match, returns the route (or None) and where scanning should resume"""
+        scheme, host, domain, rest = match.groups()
+        provider, canonical, routes = self._providers[domain.lower()]
+        for kind, pattern, key_path in routes:
+            path = pattern.match(rest)
+            if path:
+                url = f"{scheme}://{host}{path.group(0)}"
+                # equivalent spellings of one share (mirror host, /reel vs /reels, /s/1ID vs surl=ID) share a key
+                key = normalize_url(f"https://{canonical}{key_path.format(id=path.group('id'))}")
+                return Route(kind, provider, url, key), match.start(4) + path.end()
+        return None, match.start(4)
+    
+    def routes(self, text: str):
+        """Every supported link in ``text`` in order of appearance, mirrors of one share are deduplicated"""
+        text = text or ''
+        found = []
+        seen = set()
+        position = 0
+        while True:
+            match = self._pattern.search(text, position)
+            if not match:
+                return found
+            route, position = self._route(match)
+            if route and route.key not in seen:
+                seen.add(route.key)
+                found.append(route)
+    
+    def route(self, url: str):
+        """Route a single URL, None if no provider handles it"""
+        match = self._pattern.match(url.strip())
+        return self._route(match)[0] if match else None
+    
+    def classify(self, url: str):
+        route = self.route(url)
+        return route.kind if route else 'unknown'
+
+
+_canonical_router = UrlRouter()
+
+
+def canonical_url(url: str):
+    """Key ``url`` on its provider's canonical domain so mirrors of one share map to the same entry"""
+    route = _canonical_router.route(url)
+    return route.key if route else normalize_url(url)
+
+
+class MemoryCacheBackend:
+    """In-process LRU store bounded by entry count and approximate size"""
+    
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.evictions = 0
+    
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        
+        value, size, expires_at = entry
+        if time.time() >= expires_at:
+            self.delete(key)
+            return None
+        
+        self._entries.move_to_end(key)
+        return json.loads(value)
+    
+    def set(self, key: str, value, ttl: int):
+        encoded = json.dumps(value)
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+        
+        self.delete(key)
+        self._entries[key] = (encoded, size, time.time() + ttl)
+        self._bytes += size
+        
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, old_size, _) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+            self.evictions += 1
+    
+    def delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry:
+            self._bytes -= entry[1]
+    
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """On-disk LRU store that survives restarts"""
+    
+    def __init__(self, path: str, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+        self._db.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+    
+    def get(self, key: str):
+        now = time.time()
+        row = self._db.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        
+        if now >= row[1]:
+            self.delete(key)
+            return None
+        
+        self._db.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+    
+    def set(self, key: str, value, ttl: int):
+        encoded = json.dumps(value)
+        size = len(encoded)
+        if size > self.max_bytes:
+            return
+        
+        now = time.time()
+        self._db.execute(
+            "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, encoded, size, now + ttl, now)
+        )
+        self._db.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+        while count > self.max_entries or total > self.max_bytes:
+            row = self._db.execute("SELECT key, size FROM cache ORDER BY accessed_at LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._db.execute("DELETE FROM cache WHERE key = ?", (row[0],))
+            count -= 1
+            total -= row[1]
+            self.evictions += 1
+    
+    def delete(self, key: str):
+        self._db.execute("DELETE FROM cache WHERE key = ?", (key,))
+    
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+    
+    def close(self):
+        self._db.close()
+
+
+class ResolutionCache:
+    """TTL cache of resolved metadata keyed by kind and canonical URL"""
+    
+    def __init__(self, backend, ttl: int = 600):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+    
+    def _key(self, kind: str, url: str):
+        return f"{kind}:{canonical_url(url)}"
+    
+    def get(self, kind: str, url: str):
+        try:
+            value = self.backend.get(self._key(kind, url))
+        except Exception as e:
+            logger.warning("Resolution cache read failed: %s", e)
+            value = None
+        
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            sampled_logger.info("Resolution cache hit for %s: %s", kind, url)
+        return value
+    
+    def set(self, kind: str, url: str, value):
+        try:
+            self.backend.set(self._key(kind, url), value, self.ttl)
+        except Exception as e:
+            logger.warning("Resolution cache write failed: %s", e)
+    
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.backend.evictions
+        }
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one, later callers share its result"""
+    
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+    
+    def __len__(self):
+        return len(self._calls)
+    
+    def context(self, key):
+        """The context passed by the caller currently running ``key``, None when idle"""
+        call = self._calls.get(key)
+        return call[1] if call else None
+    
+    async def do(self, key, func, context=None):
+        """Run ``func()`` unless a call for ``key`` is running, returns ``(result, shared)``"""
+        call = self._calls.get(key)
+        if call:
+            self.followers += 1
+            future = call[0]
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+            # the leader was cancelled, not us: take over
+            return await self.do(key, func, context)
+        
+        future = asyncio.get_running_loop().create_future()
+        # followers may all be gone, keep asyncio from logging the unretrieved exception
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._calls[key] = (future, context)
+        self.leaders += 1
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            self._calls.pop(key, None)
+    
+    def stats(self):
+        return {"running": len(self._calls), "leaders": self.leaders, "followers": self.followers}
+
+
+class MediaFileIdCache:
+    """Persistent map from source content to the Telegram file_id it was delivered as"""
+    
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS file_ids ("
+            "key TEXT PRIMARY KEY, file_id TEXT NOT NULL, media_type TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(kind: str, url: str, *identity):
+        """Build a key from the source URL and content identity such as name and size"""
+        parts = [kind, canonical_url(url)] + [str(part) for part in identity]
+        return "|".join(parts)
+    
+    def get(self, key: str):
+        try:
+            row = self._db.execute("SELECT file_id, media_type FROM file_ids WHERE key = ?", (key,)).fetchone()
+        except Exception as e:
+            logger.warning("file_id cache read failed: %s", e)
+            row = None
+        
+        if row is None:
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        return {"file_id": row[0], "media_type": row[1]}
+    
+    def set(self, key: str, file_id: str, media_type: str):
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO file_ids (key, file_id, media_type, created_at) VALUES (?, ?, ?, ?)",
+                (key, file_id, media_type, time.time())
+            )
+        except Exception as e:
+            logger.warning("file_id cache write failed: %s", e)
+    
+    def delete(self, key: str):
+        try:
+            self._db.execute("DELETE FROM file_ids WHERE key = ?", (key,))
+        except Exception as e:
+            logger.warning("file_id cache delete failed: %s", e)
+    
+    def close(self):
+        self._db.close()
+
+
+class HttpClient:
+    """Application-wide pooled aiohttp session with per-call-type timeout policies"""
+    
+    def __init__(self, limit: int = 100, limit_per_host: int = 10, dns_ttl: int = 300, keepalive: int = 30):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.timeouts = {
+            'scrape': aiohttp.ClientTimeout(total=30, connect=10),
+            'download': aiohttp.ClientTimeout(total=None, connect=15, sock_read=60)
+        }
+        self.session = None
+    
+    async def start(self):
+        """Create the shared connector and session"""
+        if self.session and not self.session.closed:
+            return
+        
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            use_dns_cache=True,
+            keepalive_timeout=self.keepalive,
+            enable_cleanup_closed=True
+        )
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeouts['scrape'])
+        logger.info("HTTP client started (limit=%s, per_host=%s, dns_ttl=%ss)", self.limit, self.limit_per_host, self.dns_ttl)
+    
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+    
+    def request(self, method: str, url: str, kind: str = 'scrape', **kwargs):
+        """Issue a request on the shared session using the timeout policy for ``kind``"""
+        if self.session is None or self.session.closed:
+            raise RuntimeError("HTTP client is not running")
+        kwargs.setdefault('timeout', self.timeouts[kind])
+        return self.session.request(method, url, **kwargs)
+    
+    def get(self, url: str, kind: str = 'scrape', **kwargs):
+        return self.request('GET', url, kind, **kwargs)
+    
+    def head(self, url: str, kind: str = 'scrape', **kwargs):
+        return self.request('HEAD', url, kind, **kwargs)
+
+
+class UpstreamError(Exception):
+    """A transient upstream failure worth retrying, such as a 5xx or 429 answer"""
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the upstream while its circuit is open"""
+
+
+class UpstreamGuard:
+    """Circuit breaker, jittered retries and hedged requests for one upstream resolver"""
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, name: str, attempts: int = 3, backoff: float = 0.5, max_backoff: float = 4.0,
+                 attempt_timeout: float = 15.0, deadline: float = 40.0, hedge_delay: float = 2.0,
+                 min_hedge_delay: float = 0.25, failure_rate: float = 0.5, min_calls: int = 10,
+                 window: int = 50, cooldown: float = 30.0, max_cooldown: float = 300.0):
+        self.name = name
+        self.attempts = max(1, attempts)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.default_hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        
+        self.state = self.CLOSED
+        self.cooldown = cooldown
+        self.opened_at = 0.0
+        self._probing = False
+        self.outcomes = deque(maxlen=window)
+        self.latencies = deque(maxlen=200)
+        
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.rejected = 0
+        self.opens = 0
+    
+    def p95(self):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    
+    def hedge_delay(self):
+        """Send the hedged request once the first one is slower than the recent p95"""
+        if len(self.latencies) < 20:
+            return self.default_hedge_delay
+        return max(self.min_hedge_delay, self.p95())
+    
+    def allow(self):
+        """Whether a request may go out now; in half-open state only a single probe is let through"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+    
+    def record(self, ok: bool, latency: float = None):
+        self.outcomes.append(ok)
+        if ok and latency is not None:
+            self.latencies.append(latency)
+        if not ok:
+            self.failures += 1
+        
+        if self.state == self.HALF_OPEN:
+            self._probing = False
+            if ok:
+                logger.info("Upstream %s recovered, closing circuit", self.name)
+                self.state = self.CLOSED
+                self.cooldown = self.base_cooldown
+                self.outcomes.clear()
+            else:
+                self._open(min(self.cooldown * 2, self.max_cooldown))
+            return
+        
+        if not ok and self.state == self.CLOSED and len(self.outcomes) >= self.min_calls:
+            if self.outcomes.count(False) / len(self.outcomes) >= self.failure_rate:
+                self._open(self.base_cooldown)
+    
+    def _open(self, cooldown: float):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.cooldown = cooldown
+        self.opens += 1
+        logger.warning("Upstream %s is failing, opening circuit for %.0fs", self.name, cooldown)
+    
+    async def _attempt(self, func, timeout: float, track_latency: bool):
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(func(), timeout)
+        except asyncio.CancelledError:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+            raise
+        except Exception:
+            self.record(False)
+            raise
+        self.record(True, time.monotonic() - started if track_latency else None)
+        return result
+    
+    async def _hedged(self, func, timeout: float, hedge: bool):
+        pending = {asyncio.create_task(self._attempt(func, timeout, hedge))}
+        hedged = None
+        try:
+            if hedge:
+                done, pending = await asyncio.wait(pending, timeout=min(self.hedge_delay(), timeout))
+                if not done and self.state == self.CLOSED:
+                    self.hedges += 1
+                    sampled_logger.info("Upstream %s slower than %.2fs, hedging", self.name, self.hedge_delay())
+                    hedged = asyncio.create_task(self._attempt(func, timeout, hedge))
+                    pending.add(hedged)
+                pending |= done
+            
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedged:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+    
+    async def call(self, func, hedge: bool = True, attempts: int = None, timeout: float = None):
+        """Call ``func()`` through the breaker, retrying failures with jittered backoff
+        
+        ``func`` should raise on upstream failure; any returned value, None
+        included, counts as success. Raises CircuitOpenError while the
+        upstream is considered down.
+        """
+        attempts = attempts or self.attempts
+        timeout = timeout or self.attempt_timeout
+        deadline = time.monotonic() + max(self.deadline, timeout)
+        self.calls += 1
+        for attempt in range(attempts):
+            if not self.allow():
+                self.rejected += 1
+                raise CircuitOpenError(f"Upstream {self.name} is unavailable, circuit open")
+            
+            remaining = deadline - time.monotonic()
+            try:
+                return await self._hedged(func, min(timeout, remaining), hedge)
+            except Exception as e:
+                # full jitter keeps retries of many requests from arriving in lockstep
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                if attempt == attempts - 1 or deadline - time.monotonic() - delay < 1:
+                    raise
+                self.retries += 1
+                sampled_logger.warning("Upstream %s attempt %s failed (%r), retrying in %.1fs", self.name, attempt + 1, e, delay)
+                await asyncio.sleep(delay)
+    
+    def stats(self):
+        return {
+            "state": self.state,
+            "calls": self.calls,
+            "failures": self.failures,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "rejected": self.rejected,
+            "opens": self.opens,
+            "p95": self.p95()
+        }
+
+
+class BlockWriter:
+    """Coalesces network chunks into large positional writes with an adaptive block size"""
+    
+    MIN_BLOCK = 64 * 1024
+    MAX_BLOCK = 4 * 1024 * 1024
+    FLUSH_TARGET = 0.25
+    
+    def __init__(self, fd: int, offset: int = 0, on_flush=None, block_size: int = MIN_BLOCK):
+        self.fd = fd
+        self.offset = offset
+        self.on_flush = on_flush
+        self.block_size = min(max(block_size, self.MIN_BLOCK), self.MAX_BLOCK)
+        self.written = 0
+        
+        self._buffer = bytearray(self.block_size)
+        self._view = memoryview(self._buffer)
+        self._fill = 0
+        self._spare = None
+        self._inflight = None
+        self._last_flush = time.monotonic()
+    
+    def _pwrite_all(self, view: memoryview, offset: int):
+        while view:
+            written = os.pwrite(self.fd, view, offset)
+            view = view[written:]
+            offset += written
+    
+    async def _wait_inflight(self):
+        if self._inflight is None:
+            return
+        future, buffer, size = self._inflight
+        self._inflight = None
+        await future
+        self.written += size
+        self._spare = buffer
+        if self.on_flush:
+            self.on_flush(size)
+    
+    def _adapt(self, size: int):
+        now = time.monotonic()
+        elapsed = max(now - self._last_flush, 1e-3)
+        self._last_flush = now
+        target = int(size / elapsed * self.FLUSH_TARGET)
+        block = self.MIN_BLOCK
+        while block < target and block < self.MAX_BLOCK:
+            block *= 2
+        self.block_size = block
+    
+    async def write(self, chunk):
+        data = memoryview(chunk)
+        while data:
+            take = min(len(data), self.block_size - self._fill)
+            self._view[self._fill:self._fill + take] = data[:take]
+            self._fill += take
+            data = data[take:]
+            if self._fill >= self.block_size:
+                await self.flush()
+    
+    async def flush(self):
+        """Start writing the filled buffer in the background and switch to the spare one"""
+        if self._fill == 0:
+            return
+        
+        await self._wait_inflight()
+        size = self._fill
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, self._pwrite_all, self._view[:size], self.offset)
+        self._inflight = (future, self._buffer, size)
+        self.offset += size
+        self._adapt(size)
+        
+        spare = self._spare
+        self._spare = None
+        if spare is None or len(spare) < self.block_size:
+            spare = bytearray(self.block_size)
+        self._buffer = spare
+        self._view = memoryview(spare)
+        self._fill = 0
+    
+    async def close(self):
+        """Flush everything that is buffered and wait for it to reach the file"""
+        await self.flush()
+        await self._wait_inflight()
+    
+    async def abort(self):
+        """Wait for the in-flight write without flushing the rest"""
+        self._fill = 0
+        try:
+            await self._wait_inflight()
+        except Exception:
+            pass
+
+
+class SegmentedDownloader:
+    """Downloads a file over several concurrent byte-range connections when the server allows it"""
+    
+    def __init__(self, http: HttpClient, initial_segments: int = 4, max_segments: int = 8,
+                 piece_size: int = 8 * 1024 * 1024, min_split_size: int = 16 * 1024 * 1024):
+        self.http = http
+        self.initial_segments = max(1, initial_segments)
+        self.max_segments = max(self.initial_segments, max_segments)
+        self.piece_size = piece_size
+        self.min_split_size = min_split_size
+        self.max_piece_retries = 3
+    
+    async def probe(self, url: str, headers: dict = None):
+        """Return size, range support, content type and validators using a one-byte range request"""
+        request_headers = dict(headers or {})
+        request_headers['Range'] = 'bytes=0-0'
+        async with self.http.get(url, headers=request_headers) as response:
+            info = {
+                'size': 0,
+                'ranges': False,
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'content_type': response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            }
+            if response.status == 206:
+                content_range = response.headers.get('Content-Range', '')
+                match = re.match(r'bytes \d+-\d+/(\d+)', content_range)
+                if match:
+                    info['size'] = int(match.group(1))
+                    info['ranges'] = True
+                    return info
+            if response.status == 200:
+                info['size'] = int(response.headers.get('Content-Length', 0))
+                return info
+            raise aiohttp.ClientResponseError(
+                response.request_info, response.history, status=response.status, message="Probe failed"
+            )
+    
+    @staticmethod
+    def journal_path(filename: str):
+        return f"{filename}.journal"
+    
+    def has_journal(self, filename: str):
+        """Whether a partial download of ``filename`` can be resumed"""
+        return os.path.exists(self.journal_path(filename)) and os.path.exists(filename)
+    
+    def load_journal(self, filename: str, info: dict):
+        """Return completed ranges from a journal that matches the remote file, else None"""
+        try:
+            with open(self.journal_path(filename)) as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            return None
+        
+        if journal.get('size') != info['size'] or not os.path.exists(filename):
+            return None
+        if os.path.getsize(filename) != info['size']:
+            return None
+        for validator in ('etag', 'last_modified'):
+            if journal.get(validator) and info.get(validator) and journal[validator] != info[validator]:
+                logger.info("Remote file changed (%s mismatch), restarting download", validator)
+                return None
+        
+        return [tuple(r) for r in journal.get('completed', [])]
+    
+    def _write_journal(self, filename: str, journal: dict):
+        path = self.journal_path(filename)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(journal, f)
+        os.replace(f"{path}.tmp", path)
+    
+    def remove_journal(self, filename: str):
+        try:
+            os.remove(self.journal_path(filename))
+        except FileNotFoundError:
+            pass
+    
+    async def download(self, url: str, filename: str, progress=None, headers: dict = None, info: dict = None):
+        """Download ``url`` to ``filename``, calling ``progress(downloaded, total)`` as bytes reach disk
+        
+        ``info`` is a previous ``probe`` result, the probe is skipped when it is given.
+        """
+        if info is None:
+            try:
+                info = await self.probe(url, headers)
+            except Exception as e:
+                logger.warning("Range probe failed, using single stream: %s", e)
+                info = {'size': 0, 'ranges': False}
+        
+        if not info['ranges']:
+            self.remove_journal(filename)
+            return await self._download_single(url, filename, progress, headers)
+        
+        if info['size'] >= self.min_split_size:
+            logger.info("Segmented download of %.1fMB", info['size']/1024/1024)
+        return await self._download_segmented(url, filename, info, progress, headers)
+    
+    @staticmethod
+    def preallocate(fd: int, size: int):
+        if hasattr(os, 'posix_fallocate'):
+            try:
+                os.posix_fallocate(fd, 0, size)
+                return
+            except OSError:
+                pass
+        os.ftruncate(fd, size)
+    
+    async def _download_single(self, url: str, filename: str, progress=None, headers: dict = None):
+        async with self.http.get(url, kind='download', headers=headers) as response:
+            if response.status != 200:
+                logger.error("Download failed with status: %s", response.status)
+                return False
+            
+            file_size = int(response.headers.get('content-length', 0))
+            logger.info("Downloading file of size: %.1fMB", file_size/1024/1024)
+            
+            fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                if file_size:
+                    self.preallocate(fd, file_size)
+                
+                def on_flush(size: int):
+                    metrics.inc('bot_transfer_bytes_total', size, direction='download')
+                    if progress:
+                        progress(writer.written, file_size)
+                
+                writer = BlockWriter(fd, on_flush=on_flush)
+                try:
+                    async for chunk in response.content.iter_any():
+                        await writer.write(chunk)
+                    await writer.close()
+                except BaseException:
+                    await writer.abort()
+                    raise
+                
+                if writer.written != file_size:
+                    os.ftruncate(fd, writer.written)
+            finally:
+                os.close(fd)
+            
+            logger.info("Download completed: %.1fMB", writer.written/1024/1024)
+            return True
+    
+    async def _download_segmented(self, url: str, filename: str, info: dict, progress=None, headers: dict = None):
+        loop = asyncio.get_running_loop()
+        total_size = info['size']
+        completed = self.load_journal(filename, info)
+        resuming = completed is not None
+        
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT | (0 if resuming else os.O_TRUNC), 0o644)
+        try:
+            if not resuming:
+                completed = []
+                self.preallocate(fd, total_size)
+            
+            journal = {
+                'url': url,
+                'etag': info.get('etag'),
+                'last_modified': info.get('last_modified'),
+                'size': total_size,
+                'completed': completed
+            }
+            journal_lock = asyncio.Lock()
+            await loop.run_in_executor(None, self._write_journal, filename, journal)
+            
+            state = {
+                'downloaded': 0,
+                'failed': False,
+                'started_at': time.monotonic(),
+                'last_rate': 0.0,
+                'completed_pieces': 0,
+                'resumed': 0,
+                'block_size': BlockWriter.MIN_BLOCK
+            }
+            
+            pieces = asyncio.Queue()
+            for start in range(0, total_size, self.piece_size):
+                end = min(start + self.piece_size, total_size) - 1
+                if any(done_start <= start and end <= done_end for done_start, done_end in completed):
+                    state['downloaded'] += end - start + 1
+                    continue
+                pieces.put_nowait((start, end, 0))
+            
+            state['resumed'] = state['downloaded']
+            if resuming:
+                logger.info("Resuming download at %.1f/%.1fMB", state['downloaded']/1024/1024, total_size/1024/1024)
+            
+            async def mark_completed(start: int, end: int):
+                async with journal_lock:
+                    ranges = sorted(completed + [(start, end)])
+                    merged = [ranges[0]]
+                    for range_start, range_end in ranges[1:]:
+                        if range_start <= merged[-1][1] + 1:
+                            merged[-1] = (merged[-1][0], max(merged[-1][1], range_end))
+                        else:
+                            merged.append((range_start, range_end))
+                    completed[:] = merged
+                    await loop.run_in_executor(None, self._write_journal, filename, journal)
+            
+            if total_size < self.min_split_size:
+                initial_workers, max_workers = 1, 1
+            else:
+                initial_workers, max_workers = self.initial_segments, self.max_segments
+            workers = []
+            
+            def on_flush(size: int):
+                state['downloaded'] += size
+                metrics.inc('bot_transfer_bytes_total', size, direction='download')
+                if progress:
+                    progress(state['downloaded'], total_size)
+            
+            async def fetch_piece(start: int, end: int):
+                request_headers = dict(headers or {})
+                request_headers['Range'] = f'bytes={start}-{end}'
+                writer = BlockWriter(fd, offset=start, on_flush=on_flush, block_size=state['block_size'])
+                try:
+                    async with self.http.get(url, kind='download', headers=request_headers) as response:
+                        if response.status != 206:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history, status=response.status,
+                                message="Server ignored range request"
+                            )
+                        
+                        content_range = response.headers.get('Content-Range', '')
+                        match = re.match(r'bytes (\d+)-(\d+)/(\d+|\*)', content_range)
+                        if (not match or int(match.group(1)) != start or int(match.group(2)) > end
+                                or match.group(3) not in ('*', str(total_size))):
+                            raise aiohttp.ClientPayloadError(
+                                f"Range mismatch: asked for {start}-{end}/{total_size}, got {content_range!r}"
+                            )
+                        
+                        # never write past this piece, the next one may already be complete on disk
+                        remaining = end - start + 1
+                        async for chunk in response.content.iter_any():
+                            if len(chunk) > remaining:
+                                raise aiohttp.ClientPayloadError(f"Long range response: more than {end - start + 1} bytes")
+                            remaining -= len(chunk)
+                            await writer.write(chunk)
+                        await writer.close()
+                    
+                    if writer.offset != end + 1:
+                        raise aiohttp.ClientPayloadError(f"Short range response: got {writer.offset - start} of {end - start + 1} bytes")
+                    state['block_size'] = writer.block_size
+                except BaseException:
+                    await writer.abort()
+                    state['downloaded'] -= writer.written
+                    raise
+            
+            def maybe_scale_up():
+                elapsed = time.monotonic() - state['started_at']
+                if elapsed <= 0 or len(workers) >= max_workers:
+                    return
+                rate = (state['downloaded'] - state['resumed']) / elapsed
+                if rate > state['last_rate'] * 1.15 and not pieces.empty():
+                    state['last_rate'] = rate
+                    workers.append(asyncio.create_task(worker()))
+                    sampled_logger.info("Throughput %.1fMB/s, scaling to %s segments", rate/1024/1024, len(workers))
+            
+            async def worker():
+                while not state['failed']:
+                    try:
+                        start, end, attempts = pieces.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+                    
+                    try:
+                        await fetch_piece(start, end)
+                        await mark_completed(start, end)
+                        state['completed_pieces'] += 1
+                        if state['completed_pieces'] % len(workers) == 0:
+                            maybe_scale_up()
+                    except asyncio.CancelledError:
+                        raise
+                    except Exception as e:
+                        if attempts + 1 >= self.max_piece_retries:
+                            logger.error("Range %s-%s failed after %s attempts: %s", start, end, attempts + 1, e)
+                            state['failed'] = True
+                            return
+                        sampled_logger.warning("Range %s-%s failed, retrying: %s", start, end, e)
+                        pieces.put_nowait((start, end, attempts + 1))
+            
+            for _ in range(min(initial_workers, pieces.qsize())):
+                workers.append(asyncio.create_task(worker()))
+            
+            while True:
+                pending = [task for task in workers if not task.done()]
+                if not pending:
+                    break
+                await asyncio.gather(*pending)
+            
+            if state['failed'] or state['downloaded'] != total_size:
+                logger.warning("Download incomplete, journal kept for resume: %.1f/%.1fMB", state['downloaded']/1024/1024, total_size/1024/1024)
+                return False
+            
+            self.remove_journal(filename)
+            elapsed = time.monotonic() - state['started_at']
+            logger.info("Download completed: %.1fMB in %.1fs using %s segments", (total_size - state['resumed'])/1024/1024, elapsed, len(workers))
+            return True
+        finally:
+            os.close(fd)
+
+
+SIZE_UNITS = {'B': 1, 'BYTE': 1, 'BYTES': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4}
+
+
+def parse_size(text):
+    """Parse a human readable size such as ``"1.5 GB"``, 0 when unknown"""
+    match = re.match(r'\s*([\d.,]+)\s*(bytes?|[KMGT]?B)\b', str(text or ''), re.IGNORECASE)
+    if not match:
+        return 0
+    try:
+        return int(float(match.group(1).replace(',', '')) * SIZE_UNITS[match.group(2).upper()])
+    except ValueError:
+        return 0
+
+
+class SpoolFullError(Exception):
+    """Raised when a download cannot fit in the spool within its budget"""
+
+
+class SpoolLease:
+    """A reserved, exclusively owned spool path"""
+    
+    def __init__(self, path: str, lock_fd: int, size: int, area, group=None):
+        self.path = path
+        self.size = size
+        self.area = area
+        self.lock_fd = lock_fd
+        self.group = group
+
+
+class SpoolArea:
+    """One spool directory with an optional byte budget and a free-space floor
+    
+    The budget covers every process spooling into the directory: each lease
+    writes its size into the lock file it holds, and reservations total the
+    sizes of all held locks under a directory-wide flock.
+    """
+    
+    LEDGER_LOCK = '.spool-ledger'
+    
+    def __init__(self, path: str, budget: int = 0, min_free: int = 0):
+        self.path = path
+        self.budget = budget
+        self.min_free = min_free
+        self.leases = set()
+        self._lock_fd = None
+        self._lock_depth = 0
+        os.makedirs(path, exist_ok=True)
+    
+    @contextmanager
+    def locked(self):
+        """Hold the directory-wide lock that orders claims and ledger reads across processes
+        
+        It is only held for a directory scan, so blocking on it stays short.
+        """
+        if self._lock_depth == 0:
+            fd = os.open(os.path.join(self.path, self.LEDGER_LOCK), os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                raise
+            self._lock_fd = fd
+        self._lock_depth += 1
+        try:
+            yield
+        finally:
+            self._lock_depth -= 1
+            if self._lock_depth == 0:
+                os.close(self._lock_fd)
+                self._lock_fd = None
+    
+    def ledger(self):
+        """Data path and reserved size of every live lease in the directory, whichever process holds it"""
+        entries = []
+        with self.locked():
+            try:
+                names = os.listdir(self.path)
+            except OSError as e:
+                logger.warning("Spool ledger read failed for %s: %s", self.path, e)
+                return entries
+            
+            for name in names:
+                if not name.endswith('.lock'):
+                    continue
+                lock_path = os.path.join(self.path, name)
+                try:
+                    fd = os.open(lock_path, os.O_RDONLY)
+                except OSError:
+                    continue
+                try:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+                        # nobody holds it, a crashed job's lock the next sweep removes
+                        continue
+                    except BlockingIOError:
+                        pass
+                    try:
+                        size = int(os.pread(fd, 32, 0) or 0)
+                    except ValueError:
+                        size = 0
+                finally:
+                    os.close(fd)
+                entries.append((lock_path[:-len('.lock')], size))
+        return entries
+    
+    @property
+    def reserved(self):
+        return sum(size for _, size in self.ledger())
+    
+    @staticmethod
+    def allocated(path: str):
+        try:
+            return os.stat(path).st_blocks * 512
+        except OSError:
+            return 0
+    
+    def pending(self, entries: list = None):
+        """Reserved bytes not yet allocated on disk by their downloads"""
+        entries = self.ledger() if entries is None else entries
+        return sum(max(0, size - self.allocated(path)) for path, size in entries)
+    
+    def free(self):
+        return shutil.disk_usage(self.path).free
+    
+    def fits(self, size: int, credit: int = 0):
+        """Whether ``size`` more bytes fit, ``credit`` of which are already allocated on disk"""
+        entries = self.ledger()
+        if self.budget and sum(reserved for _, reserved in entries) + size > self.budget:
+            return False
+        return self.free() - self.pending(entries) - self.min_free >= size - credit
+    
+    def never_fits(self, size: int, group=None, credit: int = 0, path: str = None):
+        """Whether ``size`` would not fit even with every lease outside ``group`` released
+        
+        Leases of the caller's own ``group`` are only released after the caller
+        is done, so waiting on them would never end. ``path`` is the caller's
+        own claimed path, which is not released either.
+        """
+        own = [lease for lease in self.leases if group is not None and lease.group is group]
+        if self.budget and size + sum(lease.size for lease in own) > self.budget:
+            return True
+        own_paths = {lease.path for lease in own} | {path}
+        held = sum(self.allocated(path) for path, _ in self.ledger() if path not in own_paths)
+        own_pending = sum(max(0, lease.size - self.allocated(lease.path)) for lease in own)
+        return size - credit + self.min_free > self.free() - own_pending + held
+
+
+class SpoolManager:
+    """Admits downloads into the spool against disk budgets and hands out collision-free paths"""
+    
+    # releases by other workers are not signalled, waiters poll the shared ledger this often
+    RECHECK_SECONDS = 1.0
+    
+    def __init__(self, directory: str, budget: int = 0, min_free: int = 0, tmpfs_dir: str = None,
+                 tmpfs_max_file: int = 0, tmpfs_budget: int = 0, wait_timeout: float = 600,
+                 journal_max_age: float = 86400):
+        self.disk = SpoolArea(directory, budget, min_free)
+        self.tmpfs = None
+        if tmpfs_dir and tmpfs_max_file:
+            try:
+                self.tmpfs = SpoolArea(os.path.join(tmpfs_dir, 'bot-spool'), tmpfs_budget)
+            except OSError as e:
+                logger.warning("tmpfs spool unavailable at %s: %s", tmpfs_dir, e)
+        self.tmpfs_max_file = tmpfs_max_file
+        self.wait_timeout = wait_timeout
+        self.journal_max_age = journal_max_age
+        self._condition = asyncio.Condition()
+        self._sequence = itertools.count(1)
+        
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+    
+    @property
+    def areas(self):
+        return [area for area in (self.tmpfs, self.disk) if area]
+    
+    @staticmethod
+    def _lock_path(path: str):
+        return f"{path}.lock"
+    
+    def _try_lock(self, path: str):
+        """Take the flock guarding ``path``, returns its fd or None while another lease holds it
+        
+        flock is released by the kernel when its holder dies, so a lock file left
+        by a crash never blocks, even when the PID is reused (the bot is PID 1 in
+        Docker). flock also conflicts between two opens in the same process.
+        """
+        lock_path = self._lock_path(path)
+        while True:
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return None
+            try:
+                same_file = os.fstat(fd).st_ino == os.stat(lock_path).st_ino
+            except FileNotFoundError:
+                same_file = False
+            if same_file:
+                return fd
+            # the lock file was unlinked by its previous holder while we were opening it
+            os.close(fd)
+    
+    def _unlock(self, path: str, fd: int):
+        """Remove the lock file while still holding it, then release it"""
+        try:
+            os.remove(self._lock_path(path))
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+    
+    def _claim(self, area: SpoolArea, name: str, ext: str):
+        """Lock the stable path for ``name`` so a journaled partial can be resumed, else a unique one"""
+        path = os.path.join(area.path, f"{name}{ext}")
+        fd = self._try_lock(path)
+        while fd is None:
+            path = os.path.join(area.path, f"{name}_{os.getpid()}_{next(self._sequence)}{ext}")
+            fd = self._try_lock(path)
+        return path, fd
+    
+    def _area_for(self, size: int, exact: bool):
+        if exact and self.tmpfs and 0 < size <= self.tmpfs_max_file and self.tmpfs.fits(size):
+            return self.tmpfs
+        return self.disk
+    
+    def partial_area(self, name: str, ext: str):
+        """The area holding a resumable partial download of ``name``, if any"""
+        for area in self.areas:
+            path = os.path.join(area.path, f"{name}{ext}")
+            if os.path.exists(path) and os.path.exists(SegmentedDownloader.journal_path(path)):
+                return area
+        return None
+    
+    def has_partial(self, name: str, ext: str):
+        return self.partial_area(name, ext) is not None
+    
+    @asynccontextmanager
+    async def reserve(self, name: str, ext: str, size: int, exact: bool = True, on_wait=None, group=None):
+        """Reserve ``size`` bytes and an exclusive path, waiting for space when the budget is used up
+        
+        Callers holding several leases at once pass the same ``group`` so they
+        are rejected instead of waiting for space only they are holding.
+        """
+        partial = self.partial_area(name, ext)
+        area = partial or self._area_for(size, exact)
+        with area.locked():
+            path, fd = self._claim(area, name, ext)
+            # a lock file left by a crashed job still holds its size
+            os.ftruncate(fd, 0)
+        # a resumed partial is preallocated to full size already, only the rest needs free space;
+        # the unique path taken while another job holds the partial starts out empty
+        resumed = partial is not None and path == os.path.join(area.path, f"{name}{ext}")
+        credit = area.allocated(path) if resumed else 0
+        
+        try:
+            if area.never_fits(size, group, credit, path):
+                self.rejected += 1
+                raise SpoolFullError(f"{size/1024/1024:.1f}MB can never fit in {area.path}")
+            
+            async with self._condition:
+                if not self._admit(area, fd, size, credit):
+                    self.waiting += 1
+                    if on_wait:
+                        on_wait()
+                    logger.info("Waiting for %.1fMB of spool space in %s", size/1024/1024, area.path)
+                    deadline = time.monotonic() + self.wait_timeout
+                    try:
+                        while not self._admit(area, fd, size, credit):
+                            remaining = deadline - time.monotonic()
+                            if area.never_fits(size, group, credit, path):
+                                self.rejected += 1
+                                raise SpoolFullError(f"{size/1024/1024:.1f}MB is held up by leases of the same job in {area.path}")
+                            if remaining <= 0:
+                                self.rejected += 1
+                                raise SpoolFullError(f"Timed out waiting for {size/1024/1024:.1f}MB in {area.path}")
+                            try:
+                                # also re-check periodically, other workers and files outside the spool free space too
+                                await asyncio.wait_for(self._condition.wait(), min(remaining, self.RECHECK_SECONDS))
+                            except asyncio.TimeoutError:
+                                pass
+                    finally:
+                        self.waiting -= 1
+        except BaseException:
+            self._unlock(path, fd)
+            raise
+        
+        lease = SpoolLease(path, fd, size=size, area=area, group=group)
+        area.leases.add(lease)
+        self.admitted += 1
+        try:
+            yield lease
+        finally:
+            self._release(lease)
+            async with self._condition:
+                self._condition.notify_all()
+    
+    def _admit(self, area: SpoolArea, fd: int, size: int, credit: int):
+        """Record ``size`` in the claimed lock file, making it count in the shared ledger, if it fits"""
+        with area.locked():
+            if not area.fits(size, credit):
+                return False
+            os.pwrite(fd, str(size).encode(), 0)
+        return True
+    
+    def _release(self, lease: SpoolLease):
+        """Delete the spooled file unless a journal keeps it for resume, then drop the lock"""
+        lease.area.leases.discard(lease)
+        if os.path.exists(SegmentedDownloader.journal_path(lease.path)):
+            logger.info("Keeping partial download for resume: %s", lease.path)
+        else:
+            try:
+                os.remove(lease.path)
+                logger.info("Temp file cleaned up")
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning("Failed to clean up temp file: %s", e)
+        self._unlock(lease.path, lease.lock_fd)
+    
+    def sweep(self):
+        """Remove files left behind by crashed jobs, keeping recent journaled partials and live locks"""
+        removed = 0
+        freed = 0
+        now = time.time()
+        for area in self.areas:
+            with area.locked():
+                removed, freed = self._sweep_area(area, now, removed, freed)
+        
+        if removed:
+            logger.info("Spool sweep removed %s orphaned file(s), freed %.1fMB", removed, freed/1024/1024)
+        return removed
+    
+    def _sweep_area(self, area: SpoolArea, now: float, removed: int, freed: int):
+        try:
+            entries = list(os.scandir(area.path))
+        except OSError as e:
+            logger.warning("Spool sweep failed for %s: %s", area.path, e)
+            return removed, freed
+        
+        for entry in entries:
+            if not entry.is_file() or entry.name.endswith('.lock') or entry.name == SpoolArea.LEDGER_LOCK:
+                continue
+            
+            data_name = re.sub(r'\.journal(?:\.tmp)?$', '', entry.name)
+            data_path = os.path.join(area.path, data_name)
+            # locks are taken before the file is created, so a held lock always covers it
+            fd = self._try_lock(data_path)
+            if fd is None:
+                continue
+            try:
+                journal_path = SegmentedDownloader.journal_path(data_path)
+                if os.path.exists(journal_path) and os.path.exists(data_path):
+                    try:
+                        if now - os.path.getmtime(journal_path) < self.journal_max_age:
+                            continue
+                    except OSError:
+                        continue
+                
+                try:
+                    freed += entry.stat().st_blocks * 512
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError:
+                    pass
+            finally:
+                self._unlock(data_path, fd)
+        
+        for entry in entries:
+            if entry.name.endswith('.lock'):
+                data_path = entry.path[:-len('.lock')]
+                fd = self._try_lock(data_path)
+                if fd is not None:
+                    self._unlock(data_path, fd)
+        
+        return removed, freed
+    
+    def stats(self):
+        return {
+            area_name: {
+                "reserved": area.reserved,
+                "leases": len(area.leases),
+                "free": area.free(),
+                "budget": area.budget
+            }
+            for area_name, area in (('disk', self.disk), ('tmpfs', self.tmpfs)) if area
+        } | {"waiting": self.waiting, "admitted": self.admitted, "rejected": self.rejected}
+
+
+class AdaptiveLimit:
+    """Concurrency limit that halves on FloodWait and creeps back up after sustained success"""
+    
+    def __init__(self, limit: int):
+        self.max_limit = max(1, limit)
+        self.limit = self.max_limit
+        self.active = 0
+        self.successes = 0
+        self.backoffs = 0
+        self._condition = asyncio.Condition()
+    
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+    
+    async def release(self, success: bool = True):
+        async with self._condition:
+            self.active -= 1
+            if success:
+                self.successes += 1
+                if self.limit < self.max_limit and self.successes >= self.limit * 8:
+                    self.limit += 1
+                    self.successes = 0
+            self._condition.notify_all()
+    
+    def backoff(self):
+        self.backoffs += 1
+        self.successes = 0
+        self.limit = max(1, self.limit // 2)
+
+
+class StreamingUploader:
+    """Uploads file parts to Telegram in parallel across several media sessions"""
+    
+    PART_SIZE = 512 * 1024
+    MIN_SIZE = 10 * 1024 * 1024
+    MAX_SIZE = 2000 * 1024 * 1024
+    
+    def __init__(self, client: Client, workers: int = 4, sessions: int = 2, buffer_parts: int = 32,
+                 session_factory=None):
+        self.client = client
+        self.workers = max(1, workers)
+        self.sessions = max(1, sessions)
+        self.buffer_parts = max(1, buffer_parts)
+        self.session_factory = session_factory or self._create_session
+        self.flood_waits = 0
+    
+    async def _create_session(self):
+        return Session(
+            self.client, await self.client.storage.dc_id(), await self.client.storage.auth_key(),
+            await self.client.storage.test_mode(), is_media=True
+        )
+    
+    def supports(self, file_size: int):
+        """Part uploads need a known size and Telegram's big-file part API"""
+        return self.MIN_SIZE < file_size <= self.MAX_SIZE
+    
+    async def upload_path(self, path: str, progress=None):
+        """Upload a file from disk through the parallel part uploader"""
+        loop = asyncio.get_running_loop()
+        
+        async def chunks():
+            with open(path, 'rb') as f:
+                while True:
+                    block = await loop.run_in_executor(None, f.read, 4 * 1024 * 1024)
+                    if not block:
+                        return
+                    yield block
+        
+        return await self.upload(chunks(), os.path.getsize(path), os.path.basename(path), progress)
+    
+    async def upload(self, chunks, file_size: int, file_name: str, progress=None):
+        """Upload ``file_size`` bytes read from the async iterator ``chunks`` and return an InputFileBig"""
+        total_parts = math.ceil(file_size / self.PART_SIZE)
+        file_id = self.client.rnd_id()
+        queue = asyncio.Queue(self.buffer_parts)
+        limit = AdaptiveLimit(self.workers * self.sessions)
+        state = {'uploaded': 0, 'error': None}
+        
+        sessions = [await self.session_factory() for _ in range(self.sessions)]
+        
+        async def save_part(session, part: int, data: bytes):
+            attempts = 0
+            while True:
+                await limit.acquire()
+                try:
+                    await session.invoke(raw.functions.upload.SaveBigFilePart(
+                        file_id=file_id,
+                        file_part=part,
+                        file_total_parts=total_parts,
+                        bytes=data
+                    ))
+                except FloodWait as e:
+                    await limit.release(success=False)
+                    self.flood_waits += 1
+                    metrics.inc('bot_flood_waits_total', source='upload_part')
+                    metrics.inc('bot_flood_wait_seconds_total', e.value, source='upload_part')
+                    limit.backoff()
+                    sampled_logger.info("FloodWait on part upload: sleeping for %s seconds, parallelism now %s", e.value, limit.limit)
+                    await asyncio.sleep(e.value)
+                    continue
+                except Exception:
+                    await limit.release(success=False)
+                    attempts += 1
+                    if attempts >= 3:
+                        raise
+                    await asyncio.sleep(attempts)
+                    continue
+                await limit.release()
+                metrics.inc('bot_transfer_bytes_total', len(data), direction='upload')
+                return
+        
+        async def worker(session):
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                if state['error']:
+                    continue
+                
+                part, data = item
+                try:
+                    await save_part(session, part, data)
+                except Exception as e:
+                    state['error'] = e
+                    continue
+                
+                state['uploaded'] += len(data)
+                if progress:
+                    progress(state['uploaded'], file_size)
+        
+        tasks = []
+        try:
+            await asyncio.gather(*(session.start() for session in sessions))
+            tasks = [
+                asyncio.create_task(worker(sessions[index % len(sessions)]))
+                for index in range(self.workers * self.sessions)
+            ]
+            
+            part = 0
+            buffer = bytearray()
+            async for chunk in chunks:
+                buffer += chunk
+                while len(buffer) >= self.PART_SIZE:
+                    await queue.put((part, bytes(buffer[:self.PART_SIZE])))
+                    del buffer[:self.PART_SIZE]
+                    part += 1
+                if state['error']:
+                    raise state['error']
+            if buffer:
+                await queue.put((part, bytes(buffer)))
+                part += 1
+            
+            for _ in tasks:
+                await queue.put(None)
+            await asyncio.gather(*tasks)
+            
+            if state['error']:
+                raise state['error']
+            if part != total_parts:
+                raise ValueError(f"Stream ended after {part} of {total_parts} parts")
+            
+            return raw.types.InputFileBig(id=file_id, parts=total_parts, name=file_name)
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await asyncio.gather(*(session.stop() for session in sessions), return_exceptions=True)
+    
+    async def send(self, original_message: Message, input_file, file_name: str, is_video: bool, caption: str):
+        """Send an uploaded file as a reply and return the parsed Message"""
+        attributes = [raw.types.DocumentAttributeFilename(file_name=file_name)]
+        if is_video:
+            attributes.insert(0, raw.types.DocumentAttributeVideo(duration=0, w=0, h=0, supports_streaming=True))
+        
+        media = raw.types.InputMediaUploadedDocument(
+            mime_type=self.client.guess_mime_type(file_name) or "application/octet-stream",
+            file=input_file,
+            attributes=attributes
+        )
+        
+        while True:
+            try:
+                r = await self.client.invoke(
+                    raw.functions.messages.SendMedia(
+                        peer=await self.client.resolve_peer(original_message.chat.id),
+                        media=media,
+                        reply_to_msg_id=original_message.id,
+                        random_id=self.client.rnd_id(),
+                        **await utils.parse_text_entities(self.client, caption, None, None)
+                    )
+                )
+                break
+            except FloodWait as e:
+                metrics.inc('bot_flood_waits_total', source='send_media')
+                metrics.inc('bot_flood_wait_seconds_total', e.value, source='send_media')
+                logger.info("FloodWait: sleeping for %s seconds", e.value)
+                await asyncio.sleep(e.value)
+        
+        for update in r.updates:
+            if isinstance(update, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+                return await Message._parse(
+                    self.client, update.message,
+                    {u.id: u for u in r.users},
+                    {c.id: c for c in r.chats}
+                )
+        return None
+
+
+class QueueFullError(Exception):
+    """Raised when the scheduler cannot accept more work"""
+
+
+class JobScheduler:
+    """Bounded job queue served round-robin across users, with per-stage worker pools"""
+    
+    def __init__(self, workers: int = 4, max_queue: int = 100, per_user_active: int = 2,
+                 per_user_queue: int = 10, stage_limits: dict = None):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.per_user_active = max(1, per_user_active)
+        self.per_user_queue = per_user_queue
+        self.stage_limits = stage_limits or {'resolve': 2, 'challenge': 2, 'download': 4, 'upload': 2}
+        self._stages = {name: asyncio.Semaphore(limit) for name, limit in self.stage_limits.items()}
+        self._stage_busy = {name: 0 for name in self.stage_limits}
+        
+        self._pending = OrderedDict()
+        self._active = {}
+        self._condition = asyncio.Condition()
+        self._tasks = []
+        
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+    
+    @property
+    def depth(self):
+        return sum(len(jobs) for jobs in self._pending.values())
+    
+    async def start(self):
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info("Job scheduler started (%s workers, queue %s, %s active per user)", self.workers, self.max_queue, self.per_user_active)
+    
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+    
+    def position(self, user_id, index: int):
+        """Estimate how many jobs will start before the user's job at ``index`` under round-robin"""
+        ahead = index
+        for other_id, jobs in self._pending.items():
+            if other_id != user_id:
+                ahead += min(len(jobs), index + 1)
+        return ahead
+    
+    async def submit(self, user_id, job_factory):
+        """Queue ``job_factory()`` for ``user_id`` and return the number of jobs ahead of it"""
+        return await self.submit_many(user_id, [job_factory])
+    
+    async def submit_many(self, user_id, job_factories: list):
+        """Queue several jobs of one request for ``user_id``, returns the number of jobs ahead of the first
+        
+        The jobs are admitted all together or not at all and count as one
+        submission against the per-user queue limit; each one still runs in
+        its own slot under the per-user active limit.
+        """
+        async with self._condition:
+            user_jobs = self._pending.setdefault(user_id, deque())
+            if self.depth + len(job_factories) > self.max_queue or len(user_jobs) >= self.per_user_queue:
+                if not user_jobs:
+                    del self._pending[user_id]
+                self.rejected += 1
+                raise QueueFullError("Job queue is full")
+            
+            first = len(user_jobs)
+            user_jobs.extend(job_factories)
+            self.submitted += len(job_factories)
+            ahead = self.position(user_id, first)
+            if self._active.get(user_id, 0) >= self.per_user_active:
+                ahead += 1
+            self._condition.notify(len(job_factories))
+            return ahead
+    
+    def _next_job(self):
+        for user_id in list(self._pending):
+            if self._active.get(user_id, 0) >= self.per_user_active:
+                continue
+            
+            jobs = self._pending.pop(user_id)
+            job = jobs.popleft()
+            if jobs:
+                self._pending[user_id] = jobs
+            return user_id, job
+        return None
+    
+    async def _worker(self, index: int):
+        while True:
+            async with self._condition:
+                picked = self._next_job()
+                while picked is None:
+                    await self._condition.wait()
+                    picked = self._next_job()
+                user_id, job_factory = picked
+                self._active[user_id] = self._active.get(user_id, 0) + 1
+            
+            try:
+                await job_factory()
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                logger.error("Job for user %s failed: %s", user_id, e)
+            finally:
+                async with self._condition:
+                    self._active[user_id] -= 1
+                    if self._active[user_id] <= 0:
+                        del self._active[user_id]
+                    self._condition.notify_all()
+    
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """Hold a slot in the worker pool of pipeline stage ``name``"""
+        semaphore = self._stages[name]
+        async with semaphore:
+            self._stage_busy[name] += 1
+            try:
+                yield
+            finally:
+                self._stage_busy[name] -= 1
+    
+    def stats(self):
+        return {
+            "depth": self.depth,
+            "active_jobs": sum(self._active.values()),
+            "stages": {
+                name: {"busy": self._stage_busy[name], "limit": limit}
+                for name, limit in self.stage_limits.items()
+            },
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected
+        }
+
+
+class BatchStatus:
+    """Aggregates the status of every link in a batch into a single progress message
+    
+    Also collects the batch's Instagram media, which is sent as albums once the
+    last Instagram link is resolved.
+    """
+    
+    def __init__(self, message: Message, urls: list, reporter, album_links: int = 0):
+        self.message = message
+        self.urls = urls
+        self.reporter = reporter
+        self.lines = ["⏳ Waiting" for _ in urls]
+        self.album = []
+        self.album_links = album_links
+        self.remaining = len(urls)
+    
+    def item(self, index: int):
+        return BatchItemStatus(self, index)
+    
+    def update(self, index: int, text: str):
+        line = re.sub(r'<[^>]+>', '', text).strip().split('\n')[0]
+        self.lines[index] = line[:80]
+        self.reporter.status(self.message, self.render())
+    
+    def render(self):
+        done = sum(1 for line in self.lines if line.startswith(('✅', '❌')))
+        rows = [f"📦 <b>Batch:</b> {done}/{len(self.urls)} done"]
+        for index, line in enumerate(self.lines, 1):
+            rows.append(f"{index}. {html.escape(line)}")
+        return "\n".join(rows)
+    
+    async def flush(self):
+        await self.reporter.flush(self.message)
+
+
+class BatchItemStatus:
+    """Stands in for a per-link processing message inside a batch"""
+    
+    def __init__(self, batch: BatchStatus, index: int):
+        self.batch = batch
+        self.index = index
+    
+    def set_status(self, text: str):
+        self.batch.update(self.index, text)
+    
+    async def edit_text(self, text: str, *args, **kwargs):
+        self.set_status(text)
+    
+    async def delete(self, *args, **kwargs):
+        self.set_status("✅ Sent")
 
-class InstagramDownloaderBot:
+
+class TokenBucket:
+    """Global rate limiter shared by every progress edit"""
+    
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+    
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ProgressEntry:
+    """Coalesced progress state of one status message"""
+    
+    def __init__(self, message):
+        self.message = message
+        self.text = None
+        self.label = None
+        self.done = 0
+        self.total = 0
+        self.samples = deque()
+        self.dirty = False
+        self.last_edit = 0.0
+        self.last_rendered = None
+        self.touched_at = time.monotonic()
+
+
+class ProgressReporter:
+    """Central service that turns progress counters into rate-limited message edits"""
+    
+    def __init__(self, interval: float = 3.0, edits_per_second: float = 10.0, window: float = 10.0):
+        self.interval = interval
+        self.window = window
+        self.bucket = TokenBucket(edits_per_second, max(1, int(edits_per_second)))
+        self._entries = {}
+        self._followers = {}
+        self._task = None
+        
+        self.edits = 0
+        self.coalesced = 0
+        self.flood_waits = 0
+    
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    def _entry(self, message):
+        entry = self._entries.get(id(message))
+        if entry is None:
+            entry = ProgressEntry(message)
+            self._entries[id(message)] = entry
+        entry.touched_at = time.monotonic()
+        return entry
+    
+    def follow(self, leader, follower):
+        """Mirror status and progress updates of ``leader`` onto ``follower``"""
+        self._followers.setdefault(id(leader), []).append(follower)
+    
+    def unfollow(self, leader, follower):
+        followers = self._followers.get(id(leader), [])
+        if follower in followers:
+            followers.remove(follower)
+        if not followers:
+            self._followers.pop(id(leader), None)
+    
+    def status(self, message, text: str):
+        """Replace the status text of ``message``; the edit is sent later"""
+        if message is None:
+            return
+        for follower in self._followers.get(id(message), ()):
+            self.status(follower, text)
+        if isinstance(message, BatchItemStatus):
+            message.set_status(text)
+            return
+        
+        entry = self._entry(message)
+        entry.text = text
+        entry.label = None
+        entry.samples.clear()
+        if entry.dirty:
+            self.coalesced += 1
+        entry.dirty = True
+    
+    def progress(self, message, label: str, done: int, total: int):
+        """Record transfer counters for ``message``, cheap enough for hot loops"""
+        if message is None:
+            return
+        for follower in self._followers.get(id(message), ()):
+            self.progress(follower, label, done, total)
+        
+        entry = self._entry(message)
+        now = entry.touched_at
+        if entry.label != label:
+            entry.label = label
+            entry.samples.clear()
+        entry.done = done
+        entry.total = total
+        if not entry.samples or now - entry.samples[-1][0] >= 0.25:
+            entry.samples.append((now, done))
+            while entry.samples and now - entry.samples[0][0] > self.window:
+                entry.samples.popleft()
+        if entry.dirty:
+            self.coalesced += 1
+        entry.dirty = True
+    
+    def render(self, entry: ProgressEntry):
+        if entry.label is None:
+            return entry.text
+        
+        parts = [entry.label]
+        if entry.total > 0:
+            parts[0] += f" {entry.done / entry.total * 100:.1f}%"
+            parts.append(f"{entry.done/1024/1024:.1f}/{entry.total/1024/1024:.1f}MB")
+        else:
+            parts.append(f"{entry.done/1024/1024:.1f}MB")
+        
+        if len(entry.samples) >= 2:
+            (t0, d0), (t1, d1) = entry.samples[0], entry.samples[-1]
+            if t1 > t0:
+                rate = (d1 - d0) / (t1 - t0)
+                parts.append(f"{rate/1024/1024:.1f}MB/s")
+                if rate > 0 and entry.total > entry.done:
+                    eta = int((entry.total - entry.done) / rate)
+                    parts.append(f"ETA {eta // 60}:{eta % 60:02d}")
+        return parts[0] + "\n" + " • ".join(parts[1:])
+    
+    async def _edit(self, entry: ProgressEntry):
+        text = self.render(entry)
+        entry.dirty = False
+        if not text or text == entry.last_rendered:
+            return
+        
+        if isinstance(entry.message, BatchItemStatus):
+            entry.message.set_status(text)
+            entry.last_rendered = text
+            return
+        
+        await self.bucket.acquire()
+        entry.last_edit = time.monotonic()
+        try:
+            await entry.message.edit_text(text, parse_mode=ParseMode.HTML)
+            entry.last_rendered = text
+            self.edits += 1
+        except FloodWait as e:
+            self.flood_waits += 1
+            metrics.inc('bot_flood_waits_total', source='progress_edit')
+            metrics.inc('bot_flood_wait_seconds_total', e.value, source='progress_edit')
+            sampled_logger.warning("FloodWait on progress edit: pausing edits for %s seconds", e.value)
+            self.bucket.pause(e.value)
+            entry.dirty = True
+        except Exception as e:
+            sampled_logger.warning("Progress update failed: %s", e)
+    
+    async def flush(self, message):
+        """Send any pending edit for ``message`` right away"""
+        entry = self._entries.get(id(message))
+        if entry and entry.dirty:
+            await self._edit(entry)
+    
+    def discard(self, message):
+        """Drop pending edits for ``message``"""
+        self._entries.pop(id(message), None)
+    
+    async def delete(self, message):
+        """Drop pending edits and delete ``message``"""
+        self.discard(message)
+        try:
+            await message.delete()
+        except Exception as e:
+            sampled_logger.warning("Failed to delete status message: %s", e)
+    
+    async def _run(self):
+        while True:
+            await asyncio.sleep(0.5)
+            now = time.monotonic()
+            for key, entry in list(self._entries.items()):
+                if entry.dirty and now - entry.last_edit >= self.interval:
+                    await self._edit(entry)
+                elif not entry.dirty and now - entry.touched_at > 300:
+                    self._entries.pop(key, None)
+    
+    def stats(self):
+        return {
+            "tracked": len(self._entries),
+            "edits": self.edits,
+            "coalesced": self.coalesced,
+            "flood_waits": self.flood_waits
+        }
+
+
+class WorkerSupervisor:
+    """Shards jobs across worker processes over IPC queues and restarts workers that die"""
+    
+    def __init__(self, workers: int, check_interval: float = 5.0):
+        self.workers = workers
+        self.check_interval = check_interval
+        self._context = multiprocessing.get_context('spawn')
+        self.queues = [self._context.Queue() for _ in range(workers)]
+        self.processes = [None] * workers
+        self.restarts = 0
+        self.dispatched = 0
+        self._monitor_task = None
+    
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=run_worker, args=(index, self.queues[index]),
+            name=f"bot-worker-{index}", daemon=True
+        )
+        process.start()
+        self.processes[index] = process
+        logger.info("Started worker %s (pid %s)", index, process.pid)
+    
+    async def start(self):
+        for index in range(self.workers):
+            self._spawn(index)
+        self._monitor_task = asyncio.create_task(self._monitor())
+    
+    async def stop(self):
+        if self._monitor_task:
+            self._monitor_task.cancel()
+            await asyncio.gather(self._monitor_task, return_exceptions=True)
+        
+        for queue in self.queues:
+            queue.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            if process is None:
+                continue
+            await loop.run_in_executor(None, process.join, 30)
+            if process.is_alive():
+                process.terminate()
+    
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for index, process in enumerate(self.processes):
+                if process is not None and not process.is_alive():
+                    self.restarts += 1
+                    logger.error("Worker %s exited with code %s, restarting", index, process.exitcode)
+                    self._spawn(index)
+    
+    def shard(self, key):
+        return int(hashlib.sha1(str(key).encode()).hexdigest(), 16) % self.workers
+    
+    def dispatch(self, key, payload: dict):
+        """Send a job to the worker that owns ``key``"""
+        self.dispatched += 1
+        self.queues[self.shard(key)].put(payload)
+    
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "alive": sum(1 for process in self.processes if process is not None and process.is_alive()),
+            "dispatched": self.dispatched,
+            "restarts": self.restarts
+        }
+
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+class Histogram:
+    """Bucketed distribution of observed values"""
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+
+
+class JobTrace:
+    """Timings of the stages a single job went through"""
+    
+    def __init__(self, job: str, info: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.job = job
+        self.info = info
+        self.started = time.monotonic()
+        self.stages = []
+    
+    def summary(self, total: float):
+        stages = ", ".join(f"{stage}={seconds:.2f}s({outcome})" for stage, seconds, outcome in self.stages)
+        return f"{self.job} {self.id} took {total:.1f}s: {stages or 'no stages'}"
+
+
+_current_trace = contextvars.ContextVar('job_trace', default=None)
+
+
+class Metrics:
+    """Process-wide counters, histograms and gauge collectors rendered in the Prometheus text format"""
+    
+    def __init__(self, slow_job_seconds: float = 0, max_traces: int = 50):
+        self.slow_job_seconds = slow_job_seconds
+        self.slow_jobs = deque(maxlen=max_traces)
+        self._meta = {}
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+    
+    def _declare(self, name: str, kind: str, help_text: str, buckets=None):
+        self._meta[name] = (kind, help_text, buckets)
+    
+    def counter(self, name: str, help_text: str):
+        self._declare(name, 'counter', help_text)
+    
+    def gauge(self, name: str, help_text: str):
+        self._declare(name, 'gauge', help_text)
+    
+    def histogram(self, name: str, help_text: str, buckets=STAGE_BUCKETS):
+        self._declare(name, 'histogram', help_text, buckets)
+    
+    def add_collector(self, collector):
+        """Register ``collector()`` returning ``(name, labels, value)`` samples read at scrape time"""
+        self._collectors.append(collector)
+    
+    def inc(self, name: str, value: float = 1, **labels):
+        series = self._counters.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        series[key] = series.get(key, 0) + value
+    
+    def observe(self, name: str, value: float, **labels):
+        series = self._histograms.setdefault(name, {})
+        key = tuple(sorted(labels.items()))
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self._meta[name][2])
+        histogram.observe(value)
+    
+    def record_stage(self, stage: str, seconds: float, outcome: str):
+        self.observe('bot_stage_seconds', seconds, stage=stage, outcome=outcome)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.stages.append((stage, seconds, outcome))
+    
+    def timed(self, stage: str):
+        """Decorate a coroutine function so each call is timed as ``stage``, falsy results count as failed"""
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                started = time.monotonic()
+                outcome = 'error'
+                try:
+                    result = await func(*args, **kwargs)
+                    outcome = 'ok' if result else 'failed'
+                    return result
+                finally:
+                    self.record_stage(stage, time.monotonic() - started, outcome)
+            return wrapper
+        return decorator
+    
+    async def traced(self, job: str, job_factory, queued_at: float = None, **info):
+        """Run ``job_factory()`` with a stage trace, keeping it when the job turns out slow"""
+        trace = JobTrace(job, info)
+        token = _current_trace.set(trace)
+        if queued_at is not None:
+            self.record_stage('queue_wait', trace.started - queued_at, 'ok')
+        try:
+            await job_factory()
+        finally:
+            _current_trace.reset(token)
+            total = time.monotonic() - trace.started
+            self.observe('bot_job_seconds', total, job=job)
+            if self.slow_job_seconds and total >= self.slow_job_seconds:
+                logger.warning("Slow job: %s", trace.summary(total))
+                self.slow_jobs.append({
+                    "job": job,
+                    "job_id": trace.id,
+                    "info": info,
+                    "finished_at": time.time(),
+                    "total_seconds": round(total, 3),
+                    "stages": [
+                        {"stage": stage, "seconds": round(seconds, 3), "outcome": outcome}
+                        for stage, seconds, outcome in trace.stages
+                    ]
+                })
+    
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = []
+        for key, value in pairs:
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            escaped.append(f'{key}="{value}"')
+        return '{' + ','.join(escaped) + '}'
+    
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        collected = {}
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    collected.setdefault(name, []).append((tuple(sorted(labels.items())), value))
+            except Exception as e:
+                logger.warning("Metrics collector failed: %s", e)
+        
+        lines = []
+        for name, (kind, help_text, _) in self._meta.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for labels, histogram in self._histograms.get(name, {}).items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {histogram.count}")
+                    lines.append(f"{name}_sum{self._labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+                continue
+            
+            samples = list(self._counters.get(name, {}).items()) + collected.get(name, [])
+            for labels, value in samples:
+                lines.append(f"{name}{self._labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.histogram('bot_stage_seconds', 'Time spent in each pipeline stage')
+metrics.histogram('bot_job_seconds', 'End-to-end time of a queued job')
+metrics.counter('bot_transfer_bytes_total', 'Bytes downloaded from sources and uploaded to Telegram')
+metrics.counter('bot_flood_waits_total', 'FloodWait errors returned by Telegram')
+metrics.counter('bot_flood_wait_seconds_total', 'Seconds Telegram asked us to wait')
+metrics.gauge('bot_browser_contexts', 'Browser pool contexts by state')
+metrics.counter('bot_browser_events_total', 'Browser pool leases, saturation, recycles and crashes')
+metrics.counter('bot_cache_lookups_total', 'Cache lookups by cache and result')
+metrics.gauge('bot_cache_hit_ratio', 'Share of cache lookups that hit')
+metrics.gauge('bot_cache_entries', 'Entries held by a cache')
+metrics.gauge('bot_queue_depth', 'Jobs waiting in the scheduler queue')
+metrics.gauge('bot_active_jobs', 'Jobs currently running')
+metrics.counter('bot_jobs_total', 'Jobs by outcome')
+metrics.gauge('bot_stage_workers', 'Busy and configured workers per stage pool')
+metrics.counter('bot_transfer_plans_total', 'Transfer strategies chosen by the preflight probe')
+metrics.counter('bot_progress_edits_total', 'Progress message edits sent or coalesced away')
+metrics.gauge('bot_workers', 'Worker processes in supervisor mode')
+metrics.counter('bot_worker_restarts_total', 'Worker processes restarted by the supervisor')
+metrics.counter('bot_dispatched_jobs_total', 'Messages dispatched to worker processes')
+metrics.gauge('bot_upstream_circuit_open', 'Whether the circuit of an upstream resolver is open or half-open')
+metrics.gauge('bot_upstream_latency_p95_seconds', 'Recent p95 latency of an upstream resolver, the hedging threshold')
+metrics.counter('bot_upstream_events_total', 'Upstream resolver calls, failures, retries, hedges and circuit events')
+metrics.gauge('bot_inflight_calls', 'Resolves and transfers currently running for coalesced requests')
+metrics.counter('bot_inflight_calls_total', 'Coalesced calls that ran the work or joined a running one')
+metrics.gauge('bot_spool_bytes', 'Spool bytes reserved, free and budgeted per area')
+metrics.gauge('bot_spool_leases', 'Downloads currently holding spool space')
+metrics.gauge('bot_spool_waiting', 'Downloads waiting for spool space')
+metrics.counter('bot_spool_admissions_total', 'Spool reservations admitted or rejected')
+
+
+class MetricsServer:
+    """Local HTTP endpoint serving /metrics and the recent slow-job traces on /traces"""
+    
+    def __init__(self, registry: Metrics, host: str = '127.0.0.1', port: int = 9464):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._runner = None
+    
+    async def _metrics(self, request):
+        from aiohttp import web
+        return web.Response(text=self.registry.render(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+    
+    async def _traces(self, request):
+        from aiohttp import web
+        return web.json_response(list(self.registry.slow_jobs))
+    
+    async def start(self):
+        from aiohttp import web
+        
+        app = web.Application()
+        app.router.add_get('/metrics', self._metrics)
+        app.router.add_get('/traces', self._traces)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+        except OSError as e:
+            logger.error("Metrics endpoint unavailable on %s:%s: %s", self.host, self.port, e)
+            await self._runner.cleanup()
+            self._runner = None
+            return
+        logger.info("Metrics available at http://%s:%s/metrics", self.host, self.port)
+    
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+PAGE_EXTRACTORS = {}
+
+
+def register_extractor(name: str):
+    """Register a page extractor class under ``name``"""
+    def decorator(cls):
+        PAGE_EXTRACTORS[name] = cls
+        return cls
+    return decorator
+
+
+def create_extractor(name: str):
+    return PAGE_EXTRACTORS[name]()
+
+
+def extract_page(name: str, content):
+    """Run the extractor ``name`` over a complete page"""
+    extractor = create_extractor(name)
+    extractor.feed(content)
+    return extractor.close()
+
+
+@register_extractor('snapdownloader_reel')
+class SnapdownloaderReelExtractor:
+    """First anchor pointing at an .mp4 file, matched incrementally as chunks arrive"""
+    
+    PATTERN = re.compile(rb'<a[^>]+href="([^"]+\.mp4[^"]*)"[^>]*>')
+    LOOKBEHIND = 8192
+    
+    def __init__(self):
+        self._buffer = bytearray()
+        self._scanned = 0
+        self.video_url = ""
+        self.done = False
+    
+    def feed(self, chunk):
+        if self.done:
+            return True
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        
+        self._buffer += chunk
+        match = self.PATTERN.search(self._buffer, max(0, self._scanned - self.LOOKBEHIND))
+        if match:
+            self.video_url = html.unescape(match.group(1).decode('utf-8', 'replace'))
+            self.done = True
+        self._scanned = len(self._buffer)
+        return self.done
+    
+    def close(self):
+        return self.video_url
+
+
+@register_extractor('snapdownloader_photo')
+class SnapdownloaderPhotoExtractor:
+    """Download buttons of the best resolution tier, parsed in one lxml pull pass that stops once the download box closes"""
+    
+    RESOLUTIONS = ['1080 x 1080', '750 x 750', '640 x 640']
+    CONTAINER_CLASS = 'download-box'
+    
     def __init__(self):
+        from lxml import etree
+        
+        self._parser = etree.HTMLPullParser(events=('start', 'end'), tag=('a', 'div'), encoding='utf-8')
+        self._container_depth = 0
+        self.tiers = {res: [] for res in self.RESOLUTIONS}
+        self.done = False
+    
+    def feed(self, chunk):
+        """Feed a chunk of the page, returns True once no more input is needed"""
+        if self.done:
+            return True
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        
+        self._parser.feed(chunk)
+        self._read_events()
+        return self.done
+    
+    def _read_events(self):
+        for event, element in self._parser.read_events():
+            if element.tag == 'div':
+                self._handle_div(event, element)
+            elif event == 'end':
+                self._handle_anchor(element)
+                element.clear(keep_tail=True)
+            if self.done:
+                break
+    
+    def _handle_div(self, event, element):
+        if event == 'start':
+            if self._container_depth or self.CONTAINER_CLASS in (element.get('class') or '').split():
+                self._container_depth += 1
+        elif self._container_depth:
+            self._container_depth -= 1
+            # the buttons all live in the download box, nothing after it can change the result
+            if not self._container_depth and any(self.tiers.values()):
+                self.done = True
+    
+    def _handle_anchor(self, element):
+        if 'btn-download' not in (element.get('class') or ''):
+            return
+        
+        href = element.get('href', '')
+        if not href:
+            return
+        
+        text = ''.join(part.strip() for part in element.itertext())
+        for res in self.RESOLUTIONS:
+            if f"Download ({res})" in text or res.replace(' x ', 'x') in href:
+                self.tiers[res].append(href)
+    
+    def close(self):
+        if not self.done:
+            try:
+                self._parser.close()
+            except Exception:
+                pass
+            self._read_events()
+        return self.result()
+    
+    def result(self):
+        for res in self.RESOLUTIONS:
+            if self.tiers[res]:
+                return self.tiers[res]
+        return []
+
+
+class InstagramDownloaderBot:
+    MEDIA_GROUP_LIMIT = 10
+    
+    def __init__(self, worker_index: int = None):
+        self.worker_index = worker_index
         self.api_id = int(os.getenv('API_ID'))
         self.api_hash = os.getenv('API_HASH')
         self.bot_token = os.getenv('BOT_TOKEN')
         
-        self.terabox_api_url = "http://smex.unaux.com/fastbox.php"
+        self.terabox_api_url = os.getenv('TERABOX_API_URL', "http://smex.unaux.com/fastbox.php")
+        self.snapdownloader_url = os.getenv('SNAPDOWNLOADER_URL', "https://snapdownloader.com")
+        
+        self.browser_pool = BrowserPool(
+            max_contexts=int(os.getenv('BROWSER_POOL_SIZE', '2')),
+            max_uses=int(os.getenv('BROWSER_MAX_USES', '50'))
+        )
+        self.challenge_cookies = ChallengeCookieCache(ttl=int(os.getenv('TERABOX_COOKIE_TTL', '3600')))
+        self.http = HttpClient(
+            limit=int(os.getenv('HTTP_POOL_LIMIT', '100')),
+            limit_per_host=int(os.getenv('HTTP_POOL_LIMIT_PER_HOST', '10')),
+            dns_ttl=int(os.getenv('HTTP_DNS_TTL', '300'))
+        )
+        
+        if os.getenv('RESOLVE_CACHE_BACKEND', 'memory') == 'sqlite':
+            cache_backend = SQLiteCacheBackend(
+                os.getenv('RESOLVE_CACHE_PATH', './cache/resolve.db'),
+                max_entries=int(os.getenv('RESOLVE_CACHE_MAX_ENTRIES', '10000'))
+            )
+        else:
+            cache_backend = MemoryCacheBackend(max_entries=int(os.getenv('RESOLVE_CACHE_MAX_ENTRIES', '1000')))
+        self.resolution_cache = ResolutionCache(cache_backend, ttl=int(os.getenv('RESOLVE_CACHE_TTL', '600')))
+        self.router = UrlRouter()
+        self.inflight = SingleFlight()
+        self.upstreams = {
+            name: UpstreamGuard(
+                name,
+                attempts=int(os.getenv('UPSTREAM_ATTEMPTS', '3')),
+                attempt_timeout=float(os.getenv('UPSTREAM_TIMEOUT', '15')),
+                deadline=float(os.getenv('UPSTREAM_DEADLINE', '40')),
+                hedge_delay=float(os.getenv('UPSTREAM_HEDGE_DELAY', '2')),
+                failure_rate=float(os.getenv('CIRCUIT_FAILURE_RATE', '0.5')),
+                min_calls=int(os.getenv('CIRCUIT_MIN_CALLS', '10')),
+                cooldown=float(os.getenv('CIRCUIT_COOLDOWN', '30'))
+            )
+            for name in ('fastbox', 'snapdownloader')
+        }
+        self.downloader = SegmentedDownloader(
+            self.http,
+            initial_segments=int(os.getenv('DOWNLOAD_SEGMENTS', '4')),
+            max_segments=int(os.getenv('DOWNLOAD_MAX_SEGMENTS', '8'))
+        )
+        self.stream_uploads = os.getenv('STREAM_UPLOADS', '1') == '1'
+        # files above Telegram's upload limit would only fail after downloading in full
+        self.max_file_size = min(
+            int(float(os.getenv('MAX_FILE_SIZE_MB', '2000')) * 1024 * 1024), StreamingUploader.MAX_SIZE
+        )
+        self.file_id_cache = MediaFileIdCache(os.getenv('FILE_ID_CACHE_PATH', './cache/file_ids.db'))
         
+        session_name = "instagram_bot" if worker_index is None else f"instagram_bot_worker_{worker_index}"
         self.app = Client(
-            "instagram_bot",
+            session_name,
             api_id=self.api_id,
             api_hash=self.api_hash,
             bot_token=self.bot_token,
             workdir="./sessions",
             sleep_threshold=60,
-            max_concurrent_transmissions=1
+            max_concurrent_transmissions=int(os.getenv('MAX_CONCURRENT_TRANSMISSIONS', '2')),
+            no_updates=worker_index is not None
         )
         
+        worker_count = int(os.getenv('BOT_WORKERS', '0'))
+        self.supervisor = WorkerSupervisor(worker_count) if worker_count > 1 and worker_index is None else None
+        
         os.makedirs("./sessions", exist_ok=True)
-        os.makedirs("./downloads", exist_ok=True)
+        self.spool = SpoolManager(
+            os.getenv('SPOOL_DIR', './downloads'),
+            budget=int(float(os.getenv('SPOOL_BUDGET_MB', '0')) * 1024 * 1024),
+            min_free=int(float(os.getenv('SPOOL_MIN_FREE_MB', '512')) * 1024 * 1024),
+            tmpfs_dir=os.getenv('SPOOL_TMPFS_DIR', '/dev/shm'),
+            tmpfs_max_file=int(float(os.getenv('SPOOL_TMPFS_MAX_MB', '0')) * 1024 * 1024),
+            tmpfs_budget=int(float(os.getenv('SPOOL_TMPFS_BUDGET_MB', '256')) * 1024 * 1024),
+            wait_timeout=float(os.getenv('SPOOL_WAIT_SECONDS', '600')),
+            journal_max_age=float(os.getenv('SPOOL_JOURNAL_MAX_AGE', '86400'))
+        )
+        self.spool_default_reserve = int(float(os.getenv('SPOOL_DEFAULT_RESERVE_MB', '64')) * 1024 * 1024)
+        
+        self.scheduler = JobScheduler(
+            workers=int(os.getenv('JOB_WORKERS', '4')),
+            max_queue=int(os.getenv('JOB_QUEUE_SIZE', '100')),
+            per_user_active=int(os.getenv('JOB_PER_USER', '2')),
+            per_user_queue=int(os.getenv('JOB_PER_USER_QUEUE', '10')),
+            stage_limits={
+                'resolve': int(os.getenv('STAGE_RESOLVE_WORKERS', '2')),
+                'challenge': int(os.getenv('STAGE_CHALLENGE_WORKERS', os.getenv('BROWSER_POOL_SIZE', '2'))),
+                'download': int(os.getenv('STAGE_DOWNLOAD_WORKERS', '4')),
+                'upload': int(os.getenv('STAGE_UPLOAD_WORKERS', '2'))
+            }
+        )
+        self.progress = ProgressReporter(
+            interval=float(os.getenv('PROGRESS_INTERVAL', '3')),
+            edits_per_second=float(os.getenv('PROGRESS_EDITS_PER_SEC', '10'))
+        )
+        self.batch_concurrency = int(os.getenv('BATCH_CONCURRENCY', '4'))
+        self.batch_max_urls = int(os.getenv('BATCH_MAX_URLS', '50'))
+        
+        metrics.slow_job_seconds = float(os.getenv('SLOW_JOB_SECONDS', '120'))
+        metrics_port = int(os.getenv('METRICS_PORT', '9464'))
+        if metrics_port and worker_index is not None:
+            metrics_port += worker_index + 1
+        self.metrics_server = MetricsServer(
+            metrics, host=os.getenv('METRICS_HOST', '127.0.0.1'), port=metrics_port
+        ) if metrics_port else None
+        metrics.add_collector(self.collect_metrics)
+        self.uploader = StreamingUploader(
+            self.app,
+            workers=int(os.getenv('UPLOAD_WORKERS', '4')),
+            sessions=int(os.getenv('UPLOAD_SESSIONS', '2')),
+            buffer_parts=int(os.getenv('STREAM_BUFFER_MB', '16')) * 2
+        )
         
         self.setup_handlers()
     
@@ -101,7 +3036,7 @@ Type /help for more information.
         try:
             await message.reply_text(welcome_text, parse_mode=ParseMode.HTML)
         except Exception as e:
-            logger.error(f"Error sending start message: {e}")
+            logger.error("Error sending start message: %s", e)
             await message.reply_text("Bot started successfully!")
     
     async def help_command(self, message: Message):
@@ -131,107 +3066,132 @@ Type /help for more information.
         try:
             await message.reply_text(help_text, parse_mode=ParseMode.HTML)
         except Exception as e:
-            logger.error(f"Error sending help message: {e}")
-    
-    def extract_all_urls(self, text: str):
-        """Extract all supported URLs from message text"""
-        instagram_urls = re.findall(r'https?://(?:www\.)?instagram\.com/(?:reel|p)/[a-zA-Z0-9_-]+/?', text)
-        
-        terabox_patterns = [
-            r'https?://(?:www\.)?terabox\.com/s/[a-zA-Z0-9_-]+/?',
-            r'https?://(?:www\.)?terabox\.com/sharing/link\?surl=[a-zA-Z0-9_-]+',
-            r'https?://(?:www\.)?1024tera\.com/s/[a-zA-Z0-9_-]+/?'
-        ]
-        
-        terabox_urls = []
-        for pattern in terabox_patterns:
-            matches = re.findall(pattern, text)
-            terabox_urls.extend(matches)
-        
-        return {
-            'instagram': instagram_urls,
-            'terabox': terabox_urls
-        }
+            logger.error("Error sending help message: %s", e)
     
+    @metrics.timed('challenge')
     async def solve_js_challenge_with_playwright(self, url: str):
-        """Solve JavaScript challenge using Playwright"""
+        """Solve JavaScript challenge on a warm pooled browser"""
         try:
-            from playwright.async_api import async_playwright
+            if not await self.browser_pool.ready():
+                logger.error("Browser pool not available")
+                return None
             
             target_url = f"{self.terabox_api_url}?url={url}"
-            logger.info(f"Solving JS challenge for: {target_url}")
-            
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(
-                    headless=True,
-                    args=[
-                        '--no-sandbox',
-                        '--disable-setuid-sandbox',
-                        '--disable-dev-shm-usage',
-                        '--disable-accelerated-2d-canvas',
-                        '--no-first-run',
-                        '--no-zygote',
-                        '--disable-gpu',
-                        '--disable-background-timer-throttling',
-                        '--disable-backgrounding-occluded-windows',
-                        '--disable-renderer-backgrounding',
-                        '--disable-features=TranslateUI',
-                        '--disable-extensions'
-                    ]
-                )
-                
-                context = await browser.new_context(
-                    user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    viewport={'width': 1920, 'height': 1080}
-                )
-                
-                page = await context.new_page()
-                await page.goto(target_url, wait_until='domcontentloaded', timeout=30000)
-                
+            logger.info("Solving JS challenge for: %s", target_url)
+            
+            async with self.browser_pool.page() as page:
+                # navigation failures are the upstream's, raise them so the breaker counts the solve as failed
                 try:
-                    await page.wait_for_function(
-                        "() => document.body.innerText.includes('{') || window.location.href.includes('&i=1')",
-                        timeout=15000
-                    )
-                except:
-                    logger.warning("Timeout waiting for JS challenge")
-                
-                content = await page.content()
-                final_url = page.url
-                await browser.close()
-                
-                logger.info(f"Final URL: {final_url}")
-                
-                if '{' in content and '"status"' in content:
-                    json_match = re.search(r'\{[^<>]*"status"[^<>]*\}', content)
-                    if json_match:
-                        try:
-                            json_data = json.loads(json_match.group())
-                            logger.info("Successfully extracted JSON from page content")
-                            return json_data
-                        except json.JSONDecodeError:
-                            pass
+                    response = await page.goto(target_url, wait_until='domcontentloaded', timeout=30000)
+                    if response:
+                        self.check_upstream_status('fastbox', response)
+                    
+                    solved = True
+                    try:
+                        await page.wait_for_function(
+                            "() => document.body.innerText.includes('{') || window.location.href.includes('&i=1')",
+                            timeout=15000
+                        )
+                    except Exception:
+                        logger.warning("Timeout waiting for JS challenge")
+                        solved = False
+                    
+                    content = await page.content()
+                    final_url = page.url
+                except UpstreamError:
+                    raise
+                except Exception as e:
+                    raise UpstreamError(f"JS challenge page failed: {e}") from e
                 
-                return None
+                json_data = self.extract_challenge_json(content)
+                if json_data:
+                    self.challenge_cookies.store(await page.context.cookies())
+                elif not solved:
+                    raise UpstreamError("JS challenge did not complete")
+            
+            logger.info("Final URL: %s", final_url)
+            
+            if json_data:
+                logger.info("Successfully extracted JSON from page content")
+            return json_data
                 
-        except ImportError:
-            logger.error("Playwright not installed")
+        except UpstreamError:
+            raise
+        except Exception as e:
+            logger.error("Error solving JS challenge: %s", e)
+            return None
+    
+    def extract_challenge_json(self, content: str):
+        """Extract the API JSON payload from a solved challenge page"""
+        if '{' in content and '"status"' in content:
+            json_match = re.search(r'\{[^<>]*"status"[^<>]*\}', content)
+            if json_match:
+                try:
+                    return json.loads(json_match.group())
+                except json.JSONDecodeError:
+                    pass
+        
+        return None
+    
+    async def fetch_terabox_with_cookies(self, url: str):
+        """Query the TeraBox API over plain HTTP using cached challenge cookies"""
+        cookies = self.challenge_cookies.get()
+        if not cookies:
             return None
+        
+        try:
+            headers = {'User-Agent': BROWSER_USER_AGENT}
+            params = {'url': url, 'i': '1'}
+            
+            async def fetch():
+                async with self.http.get(self.terabox_api_url, params=params, headers=headers, cookies=cookies) as response:
+                    self.check_upstream_status('fastbox', response)
+                    if response.status != 200:
+                        logger.warning("Cookie request failed with status: %s", response.status)
+                        return None
+                    return await response.text()
+            
+            content = await self.upstreams['fastbox'].call(fetch)
+            if content is None:
+                return None
+            
+            json_data = self.extract_challenge_json(content)
+            if json_data is None:
+                logger.info("Challenge page returned again, dropping cached cookies")
+                self.challenge_cookies.invalidate()
+            return json_data
+            
+        except CircuitOpenError:
+            raise
         except Exception as e:
-            logger.error(f"Error solving JS challenge: {str(e)}")
+            logger.warning("Error fetching TeraBox data with cookies: %s", e)
             return None
     
+    @metrics.timed('terabox_api')
     async def get_terabox_data(self, url: str):
-        """Get TeraBox file data with Playwright"""
-        logger.info(f"Attempting to fetch TeraBox data for URL: {url}")
+        """Get TeraBox file data, reusing challenge cookies before falling back to Playwright"""
+        logger.info("Attempting to fetch TeraBox data for URL: %s", url)
         
         try:
-            data = await self.solve_js_challenge_with_playwright(url)
+            async with self.scheduler.stage('resolve'):
+                data = await self.fetch_terabox_with_cookies(url)
+            if data is None:
+                # browser solves get their own pool so they never hold up plain HTTP resolves;
+                # a solve is too heavy to hedge or retry, it only goes through the breaker
+                async with self.scheduler.stage('challenge'):
+                    data = await self.upstreams['fastbox'].call(
+                        lambda: self.solve_js_challenge_with_playwright(url), hedge=False, attempts=1, timeout=60
+                    )
             if data and data.get('status') == 'success':
                 logger.info("TeraBox data extraction successful!")
-                return self.process_terabox_response(data)
+                result = self.process_terabox_response(data)
+                if result:
+                    self.resolution_cache.set('terabox', url, result)
+                return result
+        except CircuitOpenError as e:
+            sampled_logger.warning(str(e))
         except Exception as e:
-            logger.error(f"Error in TeraBox data extraction: {e}")
+            logger.error("Error in TeraBox data extraction: %s", e)
         
         return None
     
@@ -248,57 +3208,77 @@ Type /help for more information.
                     "direct_link": file_info.get('fast_stream_url', ''),
                     "thumb": file_info.get('thumbnail', ''),
                     "size": file_info.get('size_formatted', 'Unknown'),
-                    "sizebytes": 0,
+                    "sizebytes": parse_size(file_info.get('size_formatted')),
                     "dev": "@medusaXD"
                 }
             else:
-                logger.error(f"TeraBox API unsuccessful response: {data}")
+                logger.error("TeraBox API unsuccessful response: %s", data)
                 return None
                 
         except Exception as e:
-            logger.error(f"Error processing TeraBox response: {str(e)}")
+            logger.error("Error processing TeraBox response: %s", e)
             return None
     
+    async def extract_response(self, extractor_name: str, response):
+        """Stream a response body through a page extractor, stopping once it has its result"""
+        extractor = create_extractor(extractor_name)
+        async for chunk in response.content.iter_any():
+            if extractor.feed(chunk):
+                break
+        return extractor.close()
+    
+    @staticmethod
+    def check_upstream_status(name: str, response):
+        """Raise UpstreamError for answers that mean the upstream is struggling rather than the link is bad"""
+        if response.status >= 500 or response.status == 429:
+            raise UpstreamError(f"{name} answered with status {response.status}")
+    
+    @metrics.timed('reel_scrape')
     async def get_reel_data(self, url: str):
         """Get Instagram reel data"""
-        target_url = "https://snapdownloader.com/tools/instagram-reels-downloader/download"
+        target_url = f"{self.snapdownloader_url}/tools/instagram-reels-downloader/download"
         
         try:
             headers = {
                 'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             }
             
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                params = {'url': url}
-                async with session.get(target_url, params=params, headers=headers) as response:
+            params = {'url': url}
+            
+            async def fetch():
+                async with self.http.get(target_url, params=params, headers=headers) as response:
+                    self.check_upstream_status('snapdownloader', response)
                     if response.status != 200:
                         return None
-                    
-                    html_content = await response.text()
+                    return await self.extract_response('snapdownloader_reel', response)
             
-            video_match = re.search(r'<a[^>]+href="([^"]+\.mp4[^"]*)"[^>]*>', html_content)
-            video_url = video_match.group(1) if video_match else ""
+            async with self.scheduler.stage('resolve'):
+                video_url = await self.upstreams['snapdownloader'].call(fetch)
             
             if video_url:
-                video_url = html.unescape(video_url)
-                return {
+                result = {
                     "status": "success",
                     "type": "video",
                     "video": video_url,
                     "thumbnail": "",
                     "dev": "@medusaXD"
                 }
+                self.resolution_cache.set('reel', url, result)
+                return result
             
             return None
                 
+        except CircuitOpenError as e:
+            sampled_logger.warning(str(e))
+            return None
         except Exception as e:
-            logger.error(f"Error getting reel data: {str(e)}")
+            logger.error("Error getting reel data: %s", e)
             return None
     
+    @metrics.timed('photo_scrape')
     async def get_photo_data(self, url: str):
         """Get Instagram photo data"""
-        target_url = "https://snapdownloader.com/tools/instagram-photo-downloader/download"
+        target_url = f"{self.snapdownloader_url}/tools/instagram-photo-downloader/download"
         
         try:
             headers = {
@@ -311,105 +3291,298 @@ Type /help for more information.
                 'user-agent': 'Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36'
             }
             
-            timeout = aiohttp.ClientTimeout(total=30)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                params = {'url': url}
-                async with session.get(target_url, params=params, headers=headers) as response:
+            params = {'url': url}
+            
+            async def fetch():
+                async with self.http.get(target_url, params=params, headers=headers) as response:
+                    self.check_upstream_status('snapdownloader', response)
                     if response.status != 200:
                         return None
-                    
-                    html_content = await response.text()
-            
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            resolutions = ['1080 x 1080', '750 x 750', '640 x 640']
-            links = []
-            
-            for res in resolutions:
-                download_links = soup.find_all('a', class_=lambda x: x and 'btn-download' in x)
-                for a in download_links:
-                    text = a.get_text(strip=True)
-                    href = a.get('href', '')
-                    if href:
-                        href = html.unescape(href)
-                        if f"Download ({res})" in text or res.replace(' x ', 'x') in href:
-                            links.append(href)
-                if links:
-                    break
+                    return await self.extract_response('snapdownloader_photo', response)
+            
+            async with self.scheduler.stage('resolve'):
+                links = await self.upstreams['snapdownloader'].call(fetch)
             
             if links:
-                return {
+                result = {
                     "status": "success",
                     "type": "photos", 
                     "total_image": len(links),
                     "images": [{"image": link} for link in links],
                     "dev": "@medusaXD"
                 }
+                self.resolution_cache.set('photo', url, result)
+                return result
+            else:
+                return None
+                
+        except CircuitOpenError as e:
+            sampled_logger.warning(str(e))
+            return None
+        except Exception as e:
+            logger.error("Error getting photo data: %s", e)
+            return None
+    
+    @metrics.timed('download')
+    async def download_file_async(self, url: str, filename: str, progress_message: Message = None, info: dict = None):
+        """Download file asynchronously with progress tracking"""
+        def report_progress(downloaded: int, file_size: int):
+            self.progress.progress(progress_message, "⏬ <b>Downloading...</b>", downloaded, file_size)
+        
+        max_retries = 3
+        for attempt in range(max_retries):
+            try:
+                async with self.scheduler.stage('download'):
+                    # retries probe again, the remote file may have changed since
+                    if await self.downloader.download(url, filename, report_progress, info=info if attempt == 0 else None):
+                        return True
+            except Exception as e:
+                logger.error("Error downloading file: %s", e)
+            
+            if not self.downloader.has_journal(filename) or attempt == max_retries - 1:
+                return False
+            
+            logger.info("Resuming download, attempt %s/%s", attempt + 2, max_retries)
+            await asyncio.sleep(2 ** attempt)
+        
+        return False
+    
+    @metrics.timed('download')
+    async def download_to_memory(self, url: str, name: str, max_size: int = 20 * 1024 * 1024):
+        """Download a small file into an in-memory buffer named ``name``"""
+        try:
+            async with self.scheduler.stage('download'):
+                async with self.http.get(url, kind='download') as response:
+                    if response.status != 200:
+                        logger.error("Download failed with status: %s", response.status)
+                        return None
+                    
+                    buffer = io.BytesIO()
+                    async for chunk in response.content.iter_chunked(64 * 1024):
+                        buffer.write(chunk)
+                        metrics.inc('bot_transfer_bytes_total', len(chunk), direction='download')
+                        if buffer.tell() > max_size:
+                            logger.error("In-memory download exceeded %.0fMB", max_size/1024/1024)
+                            return None
+            
+            buffer.name = name
+            buffer.seek(0)
+            return buffer
+        except Exception as e:
+            logger.error("Error downloading to memory: %s", e)
+            return None
+    
+    @metrics.timed('upload')
+    async def send_media_group_paced(self, original_message: Message, media_group: list, max_attempts: int = 3):
+        """Send a media group, sleeping only as long as Telegram's FloodWait asks"""
+        for attempt in range(max_attempts):
+            try:
+                if len(media_group) == 1:
+                    media = media_group[0]
+                    sender = original_message.reply_video if isinstance(media, InputMediaVideo) else original_message.reply_photo
+                    sent = [await sender(media.media, caption=media.caption, parse_mode=media.parse_mode)]
+                else:
+                    sent = await original_message.reply_media_group(media_group)
+                uploaded = sum(media.media.getbuffer().nbytes for media in media_group if hasattr(media.media, 'getbuffer'))
+                metrics.inc('bot_transfer_bytes_total', uploaded, direction='upload')
+                return sent
+            except FloodWait as e:
+                metrics.inc('bot_flood_waits_total', source='media_group')
+                metrics.inc('bot_flood_wait_seconds_total', e.value, source='media_group')
+                if attempt == max_attempts - 1:
+                    raise
+                logger.info("FloodWait: sleeping for %s seconds", e.value)
+                await asyncio.sleep(e.value)
+                for media in media_group:
+                    if hasattr(media.media, 'seek'):
+                        media.media.seek(0)
+    
+    @metrics.timed('upload')
+    async def upload_from_disk(self, path: str, original_message: Message, file_name: str, is_video: bool,
+                               caption: str, progress_message: Message = None):
+        """Send a downloaded file, using parallel part uploads when it is big enough"""
+        file_size = os.path.getsize(path)
+        if not self.uploader.supports(file_size):
+            if is_video:
+                sent = await original_message.reply_video(path, caption=caption)
             else:
+                sent = await original_message.reply_document(path, caption=caption)
+            metrics.inc('bot_transfer_bytes_total', file_size, direction='upload')
+            return sent
+        
+        def report_progress(uploaded: int, file_size: int):
+            self.progress.progress(progress_message, "📤 <b>Uploading...</b>", uploaded, file_size)
+        
+        input_file = await self.uploader.upload_path(path, report_progress)
+        return await self.uploader.send(original_message, input_file, file_name, is_video, caption)
+    
+    @metrics.timed('preflight')
+    async def plan_transfer(self, url: str, size_hint: int = 0, resumable: bool = False):
+        """Probe ``url`` before downloading and pick how to transfer it
+        
+        Returns the probe info with ``strategy`` set to ``stream``, ``segmented``
+        or ``single``, or ``reject`` together with a ``reason``.
+        """
+        try:
+            info = await self.downloader.probe(url)
+        except Exception as e:
+            logger.warning("Preflight probe failed, using size hint: %s", e)
+            info = {'size': 0, 'ranges': False, 'content_type': ''}
+        # streaming needs the exact length up front, resolver hints are only approximate
+        exact = info['size'] > 0
+        if not exact:
+            info['size'] = size_hint
+        
+        if info['size'] > self.max_file_size:
+            info.update(strategy='reject', reason='too_large')
+        elif info.get('content_type') in ('text/html', 'application/json'):
+            # resolvers hand out expired links that answer with an error page
+            info.update(strategy='reject', reason='not_media')
+        elif self.stream_uploads and exact and not resumable and self.uploader.supports(info['size']):
+            info['strategy'] = 'stream'
+        elif info['ranges']:
+            info['strategy'] = 'segmented'
+        else:
+            info['strategy'] = 'single'
+        
+        metrics.inc('bot_transfer_plans_total', strategy=info['strategy'])
+        logger.info("Transfer plan: %s for %.1fMB", info['strategy'], info['size']/1024/1024)
+        return info
+    
+    def reject_transfer(self, processing_msg: Message, plan: dict):
+        """Tell the user why a file was rejected before downloading it"""
+        if plan['reason'] == 'too_large':
+            self.progress.status(
+                processing_msg,
+                f"❌ <b>File too large!</b>\n\n<b>File size:</b> {plan['size']/1024/1024:.1f}MB\n"
+                f"<b>Maximum allowed:</b> {self.max_file_size/1024/1024:.0f}MB"
+            )
+        else:
+            self.progress.status(processing_msg, "❌ <b>The download link did not return a media file</b>")
+    
+    @metrics.timed('stream_transfer')
+    async def stream_transfer(self, url: str, original_message: Message, file_name: str, is_video: bool,
+                              caption: str, progress_message: Message = None, info: dict = None):
+        """Pipe a download straight into a Telegram upload, returns the sent Message or None"""
+        if info is None:
+            try:
+                info = await self.downloader.probe(url)
+            except Exception as e:
+                logger.warning("Stream probe failed: %s", e)
                 return None
-                
+        
+        if not self.uploader.supports(info['size']):
+            return None
+        
+        def report_progress(transferred: int, file_size: int):
+            self.progress.progress(progress_message, "🔄 <b>Transferring...</b>", transferred, file_size)
+        
+        async def chunks():
+            async with self.http.get(url, kind='download') as response:
+                if response.status != 200:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info, response.history, status=response.status, message="Stream download failed"
+                    )
+                async for chunk in response.content.iter_chunked(256 * 1024):
+                    metrics.inc('bot_transfer_bytes_total', len(chunk), direction='download')
+                    yield chunk
+        
+        try:
+            logger.info("Streaming %.1fMB from download to upload", info['size']/1024/1024)
+            async with self.scheduler.stage('download'), self.scheduler.stage('upload'):
+                input_file = await self.uploader.upload(chunks(), info['size'], file_name, report_progress)
+            return await self.uploader.send(original_message, input_file, file_name, is_video, caption)
         except Exception as e:
-            logger.error(f"Error getting photo data: {str(e)}")
+            logger.warning("Streaming transfer failed, falling back to disk: %s", e)
             return None
     
-    def detect_url_type(self, url: str):
-        """Detect the type of URL"""
-        if 'instagram.com' in url:
-            if '/reel/' in url:
-                return 'instagram_reel'
-            elif '/p/' in url:
-                return 'instagram_mixed'
-        elif 'terabox.com' in url or '1024tera.com' in url:
-            return 'terabox'
-        return 'unknown'
-    
-    async def download_file_async(self, url: str, filename: str, progress_message: Message = None):
-        """Download file asynchronously with progress tracking"""
+    async def send_cached_media(self, cache_key: str, original_message: Message, caption: str, parse_mode=None):
+        """Resend previously delivered media by file_id, returns True when it was sent"""
+        cached = self.file_id_cache.get(cache_key)
+        if not cached:
+            return False
+        
+        senders = {
+            'video': original_message.reply_video,
+            'document': original_message.reply_document,
+            'photo': original_message.reply_photo
+        }
+        sender = senders.get(cached['media_type'])
+        if not sender:
+            self.file_id_cache.delete(cache_key)
+            return False
+        
+        kwargs = {'caption': caption}
+        if parse_mode:
+            kwargs['parse_mode'] = parse_mode
+        
         try:
-            timeout = aiohttp.ClientTimeout(total=600)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(url) as response:
-                    if response.status != 200:
-                        logger.error(f"Download failed with status: {response.status}")
-                        return False
-                    
-                    file_size = int(response.headers.get('content-length', 0))
-                    logger.info(f"Downloading file of size: {file_size/1024/1024:.1f}MB")
-                    
-                    async with aiofiles.open(filename, 'wb') as file:
-                        downloaded = 0
-                        last_update = 0
-                        
-                        async for chunk in response.content.iter_chunked(8192):
-                            await file.write(chunk)
-                            downloaded += len(chunk)
-                            
-                            if file_size > 0 and progress_message:
-                                progress = (downloaded / file_size) * 100
-                                if progress - last_update >= 10:
-                                    try:
-                                        await progress_message.edit_text(
-                                            f"⏬ <b>Downloading...</b> {progress:.1f}%",
-                                            parse_mode=ParseMode.HTML
-                                        )
-                                        last_update = progress
-                                    except Exception as e:
-                                        logger.warning(f"Progress update failed: {e}")
-                    
-                    logger.info(f"Download completed: {downloaded/1024/1024:.1f}MB")
-                    return True
-                    
+            await sender(cached['file_id'], **kwargs)
+        except FloodWait as e:
+            metrics.inc('bot_flood_waits_total', source='cached_media')
+            metrics.inc('bot_flood_wait_seconds_total', e.value, source='cached_media')
+            await asyncio.sleep(e.value)
+            await sender(cached['file_id'], **kwargs)
+        except (BadRequest, RPCError) as e:
+            logger.warning("Cached file_id rejected, falling back to download: %s", e)
+            self.file_id_cache.delete(cache_key)
+            return False
+        
+        logger.info("Delivered from file_id cache: %s", cache_key)
+        return True
+    
+    def cached_photo_keys(self, url: str):
+        """file_id cache keys of a photo post whose images were all delivered before, else None"""
+        marker = self.file_id_cache.get(self.file_id_cache.make_key('photo', url, 'album'))
+        if not marker or marker['media_type'] != 'album':
+            return None
+        
+        keys = [self.file_id_cache.make_key('photo', url, idx) for idx in range(1, int(marker['file_id']) + 1)]
+        for key in keys:
+            cached = self.file_id_cache.get(key)
+            if not cached or cached['media_type'] != 'photo':
+                return None
+        return keys
+    
+    async def send_cached_photos(self, url: str, original_message: Message):
+        """Resend a photo post from the file_id cache without resolving it, returns True when it was sent"""
+        keys = self.cached_photo_keys(url)
+        if not keys:
+            return False
+        
+        media_group = []
+        for idx, key in enumerate(keys, 1):
+            caption = f"📸 <b>Image {idx}/{len(keys)}</b>\n\n<b>Downloaded by Multi-Platform Bot</b>\n<b>Developer:</b> @medusaXD"
+            media_group.append(InputMediaPhoto(self.file_id_cache.get(key)['file_id'], caption=caption, parse_mode=ParseMode.HTML))
+        
+        try:
+            for start in range(0, len(media_group), self.MEDIA_GROUP_LIMIT):
+                async with self.scheduler.stage('upload'):
+                    await self.send_media_group_paced(original_message, media_group[start:start + self.MEDIA_GROUP_LIMIT])
         except Exception as e:
-            logger.error(f"Error downloading file: {str(e)}")
+            logger.warning("Cached photo file_ids rejected, falling back to download: %s", e)
+            self.file_id_cache.delete(self.file_id_cache.make_key('photo', url, 'album'))
             return False
+        
+        logger.info("Delivered photo post from file_id cache: %s", url)
+        return True
+    
+    def remember_sent_media(self, cache_key: str, sent_message: Message):
+        """Store the file_id of a successfully delivered media message"""
+        if not sent_message:
+            return
+        
+        for media_type in ('video', 'document', 'photo'):
+            media = getattr(sent_message, media_type, None)
+            if media:
+                self.file_id_cache.set(cache_key, media.file_id, media_type)
+                return
     
     async def handle_message(self, message: Message):
         """Handle incoming messages with enhanced error handling"""
         try:
-            message_text = message.text
-            urls = self.extract_all_urls(message_text)
-            
-            all_urls = urls['instagram'] + urls['terabox']
+            routes = self.router.routes(message.text)
+            all_urls = [route.url for route in routes]
             
             if not all_urls:
                 await message.reply_text(
@@ -418,21 +3591,269 @@ Type /help for more information.
                 )
                 return
             
-            if urls['terabox']:
-                url = urls['terabox'][0]
-                await self.process_terabox_url(url, message)
-            elif urls['instagram']:
-                url = urls['instagram'][0]
-                url_type = self.detect_url_type(url)
-                await self.process_instagram_url(url, url_type, message)
+            if self.supervisor:
+                shard_key = routes[0].key if len(routes) == 1 else message.chat.id
+                self.supervisor.dispatch(shard_key, {
+                    'chat_id': message.chat.id,
+                    'message_id': message.id,
+                    'urls': all_urls
+                })
+                return
+            
+            await self.enqueue_urls(all_urls, message)
             
         except Exception as e:
-            logger.error(f"Error handling message: {str(e)}")
+            logger.error("Error handling message: %s", e)
             try:
                 await message.reply_text("❌ <b>An error occurred. Please try again.</b>", parse_mode=ParseMode.HTML)
             except:
                 await message.reply_text("An error occurred. Please try again.")
     
+    async def enqueue_urls(self, all_urls: list, message: Message):
+        """Submit the jobs for a message's URLs to the scheduler and report the queue position"""
+        user_id = message.from_user.id if message.from_user else message.chat.id
+        queued_at = time.monotonic()
+        
+        def traced(job_name: str, job):
+            return lambda: metrics.traced(job_name, job, queued_at=queued_at, urls=1)
+        
+        batch = None
+        if len(all_urls) > 1:
+            # every link is its own job, so a batch gets no more slots than the user's other messages
+            batch = await self.start_batch(all_urls[:self.batch_max_urls], message)
+            jobs = [
+                traced('batch', functools.partial(self.process_batch_item, batch, index, url, message))
+                for index, url in enumerate(batch.urls)
+            ]
+        else:
+            url = all_urls[0]
+            url_type = self.router.classify(url)
+            if url_type == 'terabox':
+                jobs = [traced(url_type, lambda: self.process_terabox_url(url, message))]
+            else:
+                jobs = [traced(url_type, lambda: self.process_instagram_url(url, url_type, message))]
+        
+        try:
+            ahead = await self.scheduler.submit_many(user_id, jobs)
+        except QueueFullError:
+            busy = "⏳ <b>The bot is busy right now.</b>\n\nPlease try again in a few minutes."
+            if batch:
+                self.progress.status(batch.message, busy)
+                await batch.flush()
+            else:
+                await message.reply_text(busy, parse_mode=ParseMode.HTML)
+            return
+        
+        if ahead > 0:
+            await message.reply_text(
+                f"⏳ <b>Queued</b> - position {ahead} in line",
+                parse_mode=ParseMode.HTML
+            )
+    
+    async def start_batch(self, urls: list, message: Message):
+        """Post the aggregated status message of a batch"""
+        status_msg = await message.reply_text(
+            f"📦 <b>Processing {len(urls)} links...</b>",
+            parse_mode=ParseMode.HTML
+        )
+        album_links = sum(1 for url in urls if self.router.classify(url) != 'terabox')
+        return BatchStatus(status_msg, urls, self.progress, album_links)
+    
+    async def process_batch_item(self, batch: BatchStatus, index: int, url: str, message: Message):
+        """Process one link of a batch, sending the album once the batch's last Instagram link is resolved"""
+        url_type = self.router.classify(url)
+        try:
+            if url_type == 'terabox':
+                await self.process_batch_terabox(batch.item(index), url, message)
+                return
+            
+            try:
+                await self.collect_album_items(batch, index, url, url_type)
+            finally:
+                batch.album_links -= 1
+            if batch.album_links == 0 and batch.album:
+                album = sorted(batch.album, key=lambda item: item[0])
+                batch.album = []
+                await self.send_album(album, message, batch)
+        finally:
+            batch.remaining -= 1
+            if batch.remaining == 0:
+                await batch.flush()
+    
+    async def process_batch_terabox(self, item_status: BatchItemStatus, url: str, message: Message):
+        try:
+            await item_status.edit_text("🔄 Resolving...")
+            data = await self.resolve('terabox', url)
+            if data and data.get('status') == 'success':
+                await self.process_terabox_file(data, message, item_status, url)
+            else:
+                await item_status.edit_text("❌ Failed to fetch TeraBox content")
+        except Exception as e:
+            logger.error("Error processing batch link %s: %s", url, e)
+            await item_status.edit_text("❌ Processing failed")
+    
+    async def collect_album_items(self, batch: BatchStatus, index: int, url: str, url_type: str):
+        """Resolve an Instagram link of a batch and add its media to the batch album"""
+        item_status = batch.item(index)
+        try:
+            await item_status.edit_text("🔄 Resolving...")
+            
+            reel_key = self.file_id_cache.make_key('reel', url)
+            cached = self.file_id_cache.get(reel_key)
+            if cached and cached['media_type'] == 'video':
+                batch.album.append((index, url, 'video', None, reel_key))
+                await item_status.edit_text("📥 Queued for album")
+                return
+            photo_keys = self.cached_photo_keys(url) if url_type == 'instagram_mixed' else None
+            if photo_keys:
+                batch.album.extend((index, url, 'photo', None, key) for key in photo_keys)
+                await item_status.edit_text("📥 Queued for album")
+                return
+            
+            data = await self.resolve('reel', url)
+            if data and data.get('status') == 'success':
+                batch.album.append((index, url, 'video', data['video'], reel_key))
+                await item_status.edit_text("📥 Queued for album")
+                return
+            
+            if url_type == 'instagram_mixed':
+                data = await self.resolve('photo', url)
+                if data and data.get('status') == 'success':
+                    for idx, img_data in enumerate(data.get('images', []), 1):
+                        cache_key = self.file_id_cache.make_key('photo', url, idx)
+                        batch.album.append((index, url, 'photo', img_data.get('image', ''), cache_key))
+                    await item_status.edit_text("📥 Queued for album")
+                    return
+            
+            await item_status.edit_text("❌ Failed to fetch Instagram content")
+        except Exception as e:
+            logger.error("Error processing batch link %s: %s", url, e)
+            await item_status.edit_text("❌ Processing failed")
+    
+    async def send_album(self, items: list, original_message: Message, batch: BatchStatus):
+        """Download album items concurrently and send them as media groups"""
+        # the album is sent from a single job, keep its fan-out within the user's share of workers
+        limit = asyncio.Semaphore(min(self.batch_concurrency, self.scheduler.per_user_active))
+        leases = AsyncExitStack()
+        
+        async def prepare(item):
+            index, url, media_type, media_url, cache_key = item
+            cached = self.file_id_cache.get(cache_key)
+            if cached and cached['media_type'] == media_type:
+                return cached['file_id']
+            
+            if not media_url:
+                return None
+            
+            content_id = hashlib.sha1(cache_key.encode()).hexdigest()[:16]
+            async with limit:
+                if media_type == 'photo':
+                    return await self.download_to_memory(media_url, f"album_{content_id}.jpg")
+                
+                try:
+                    lease = await leases.enter_async_context(
+                        self.reserve_spool(f"album_{content_id}", '.mp4', 0, group=leases)
+                    )
+                except SpoolFullError as e:
+                    logger.warning("Skipping album video: %s", e)
+                    return None
+                if await self.download_file_async(media_url, lease.path):
+                    return lease.path
+            return None
+        
+        async with leases:
+            prepared = await asyncio.gather(*(prepare(item) for item in items))
+            
+            ready = []
+            photos_sent = {}
+            for item, media in zip(items, prepared):
+                if media:
+                    ready.append((item, media))
+                else:
+                    batch.update(item[0], "❌ Failed to download media")
+            
+            for start in range(0, len(ready), self.MEDIA_GROUP_LIMIT):
+                chunk = ready[start:start + self.MEDIA_GROUP_LIMIT]
+                media_group = []
+                for (index, url, media_type, media_url, cache_key), media in chunk:
+                    caption = f"🔗 Original URL: {url}"
+                    if media_type == 'video':
+                        media_group.append(InputMediaVideo(media, caption=caption))
+                    else:
+                        media_group.append(InputMediaPhoto(media, caption=caption))
+                
+                try:
+                    async with self.scheduler.stage('upload'):
+                        sent = await self.send_media_group_paced(original_message, media_group)
+                except Exception as e:
+                    logger.error("Error sending media group: %s", e)
+                    for (index, *_), _ in chunk:
+                        batch.update(index, "❌ Failed to send media")
+                    continue
+                
+                for ((index, url, media_type, media_url, cache_key), _), sent_message in zip(chunk, sent):
+                    self.remember_sent_media(cache_key, sent_message)
+                    if media_type == 'photo':
+                        photos_sent[url] = photos_sent.get(url, 0) + 1
+                    batch.update(index, "✅ Sent")
+                await batch.flush()
+            
+            photos_total = Counter(url for _, url, media_type, _, _ in items if media_type == 'photo')
+            for url, total in photos_total.items():
+                if photos_sent.get(url) == total:
+                    self.file_id_cache.set(self.file_id_cache.make_key('photo', url, 'album'), str(total), 'album')
+    
+    async def resolve(self, kind: str, url: str):
+        """Resolve ``url`` once for all concurrent requests of the same link"""
+        resolvers = {'terabox': self.get_terabox_data, 'reel': self.get_reel_data, 'photo': self.get_photo_data}
+        
+        # cache hits never wait for a resolver slot, the resolvers take their own stage slots
+        cached = self.resolution_cache.get(kind, url)
+        if cached:
+            return cached
+        
+        data, _ = await self.inflight.do(('resolve', kind, canonical_url(url)), lambda: resolvers[kind](url))
+        return data
+    
+    async def coalesce_transfer(self, cache_key: str, original_message: Message, processing_msg: Message,
+                                caption: str, transfer):
+        """Run ``transfer()`` once for concurrent requests of the same content
+        
+        Later requests mirror the running transfer's status onto their own
+        message and are then delivered from the file_id it was sent as.
+        """
+        while True:
+            if await self.send_cached_media(cache_key, original_message, caption):
+                await self.progress.delete(processing_msg)
+                return True
+            
+            key = ('transfer', cache_key)
+            leader_msg = self.inflight.context(key)
+            if leader_msg is None:
+                delivered, _ = await self.inflight.do(key, transfer, context=processing_msg)
+                return delivered
+            
+            sampled_logger.info("Joining in-flight transfer for %s", cache_key)
+            self.progress.status(processing_msg, "⏳ <b>Same file is being fetched for another request, waiting...</b>")
+            self.progress.follow(leader_msg, processing_msg)
+            try:
+                delivered, shared = await self.inflight.do(key, transfer, context=processing_msg)
+            finally:
+                self.progress.unfollow(leader_msg, processing_msg)
+            if not shared or not delivered:
+                # our own run, or the shared failure already mirrored onto our message
+                return delivered
+    
+    def reserve_spool(self, name: str, ext: str, size_hint: int, processing_msg: Message = None, group=None):
+        """Reserve spool space for a download, using a default estimate when the size is unknown"""
+        def on_wait():
+            if processing_msg:
+                self.progress.status(processing_msg, "⏳ <b>Waiting for disk space...</b>")
+        
+        return self.spool.reserve(
+            name, ext, size_hint or self.spool_default_reserve, exact=bool(size_hint), on_wait=on_wait, group=group
+        )
+    
     async def process_terabox_url(self, url: str, message: Message):
         """Process TeraBox URLs"""
         processing_msg = None
@@ -442,262 +3863,505 @@ Type /help for more information.
                 parse_mode=ParseMode.HTML
             )
             
-            data = await self.get_terabox_data(url)
+            data = await self.resolve('terabox', url)
             
             if data and data.get('status') == 'success':
                 await self.process_terabox_file(data, message, processing_msg, url)
             else:
-                await processing_msg.edit_text(
-                    "❌ <b>Failed to fetch TeraBox content</b>\n\nThe file might be private or the URL is invalid.",
-                    parse_mode=ParseMode.HTML
+                self.progress.status(
+                    processing_msg,
+                    "❌ <b>Failed to fetch TeraBox content</b>\n\nThe file might be private or the URL is invalid."
                 )
                 
         except Exception as e:
-            logger.error(f"Error processing TeraBox URL: {e}")
+            logger.error("Error processing TeraBox URL: %s", e)
             if processing_msg:
-                try:
-                    await processing_msg.edit_text("❌ <b>Processing failed</b>", parse_mode=ParseMode.HTML)
-                except:
-                    pass
+                self.progress.status(processing_msg, "❌ <b>Processing failed</b>")
     
     async def process_terabox_file(self, data: dict, original_message: Message, processing_msg: Message, original_url: str):
         """Process and send TeraBox files with enhanced stability"""
-        temp_filename = None
+        try:
+            cache_key = self.file_id_cache.make_key(
+                'terabox', original_url, data.get('file_name', 'terabox_file'), data.get('size', 'Unknown')
+            )
+            await self.coalesce_transfer(
+                cache_key, original_message, processing_msg, f"🔗 Original URL: {original_url}",
+                lambda: self.transfer_terabox_file(data, original_message, processing_msg, original_url, cache_key)
+            )
+        except Exception as e:
+            logger.error("Error processing TeraBox file: %s", e)
+            if processing_msg:
+                self.progress.status(processing_msg, "❌ <b>Processing failed</b>")
+    
+    async def transfer_terabox_file(self, data: dict, original_message: Message, processing_msg: Message,
+                                    original_url: str, cache_key: str):
+        """Download and send a TeraBox file, returns True once it was delivered"""
         try:
             direct_link = data.get('direct_link', '')
             file_name = data.get('file_name', 'terabox_file')
             size_text = data.get('size', 'Unknown')
             
             if not direct_link:
-                await processing_msg.edit_text("❌ <b>No download link found</b>", parse_mode=ParseMode.HTML)
+                self.progress.status(processing_msg, "❌ <b>No download link found</b>")
                 return
             
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             file_extension = os.path.splitext(file_name)[1] if '.' in file_name else '.mp4'
-            temp_filename = f"./downloads/terabox_{timestamp}{file_extension}"
+            content_id = hashlib.sha1(cache_key.encode()).hexdigest()[:16]
+            spool_name = f"terabox_{content_id}"
             
-            await processing_msg.edit_text(
-                f"⏬ <b>Downloading TeraBox file...</b>\n📁 <b>File:</b> {file_name}\n📊 <b>Size:</b> {size_text}", 
-                parse_mode=ParseMode.HTML
-            )
+            video_extensions = ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm']
+            is_video = any(file_extension.lower().endswith(ext) for ext in video_extensions)
             
-            logger.info(f"Starting download from: {direct_link}")
-            success = await self.download_file_async(direct_link, temp_filename, processing_msg)
+            self.progress.status(
+                processing_msg,
+                f"⏬ <b>Downloading TeraBox file...</b>\n📁 <b>File:</b> {file_name}\n📊 <b>Size:</b> {size_text}"
+            )
             
-            if not success:
-                await processing_msg.edit_text("❌ <b>Failed to download file</b>", parse_mode=ParseMode.HTML)
+            size_hint = data.get('sizebytes') or parse_size(size_text)
+            if size_hint > self.max_file_size:
+                self.reject_transfer(processing_msg, {'size': size_hint, 'reason': 'too_large'})
                 return
             
-            actual_file_size = os.path.getsize(temp_filename)
-            logger.info(f"Downloaded file size: {actual_file_size/1024/1024:.1f}MB")
-            
-            if actual_file_size > 2 * 1024 * 1024 * 1024:
-                await processing_msg.edit_text(
-                    f"❌ <b>File too large!</b>\n\nSize: {actual_file_size/1024/1024:.1f}MB",
-                    parse_mode=ParseMode.HTML
-                )
+            plan = await self.plan_transfer(direct_link, size_hint, self.spool.has_partial(spool_name, file_extension))
+            if plan['strategy'] == 'reject':
+                self.reject_transfer(processing_msg, plan)
                 return
             
-            await processing_msg.edit_text("📤 <b>Uploading file...</b>", parse_mode=ParseMode.HTML)
-            
-            video_extensions = ['.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm']
-            is_video = any(file_extension.lower().endswith(ext) for ext in video_extensions)
-            
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    if is_video:
-                        await original_message.reply_video(
-                            temp_filename,
-                            caption=f"🔗 Original URL: {original_url}"
-                        )
-                    else:
-                        await original_message.reply_document(
-                            temp_filename,
-                            caption=f"🔗 Original URL: {original_url}"
-                        )
-                    
-                    logger.info("File sent successfully!")
-                    break
-                    
-                except RPCError as e:
-                    logger.warning(f"Upload attempt {attempt + 1} failed: {e}")
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(5)
-                    else:
-                        await processing_msg.edit_text("❌ <b>Upload failed after multiple attempts</b>", parse_mode=ParseMode.HTML)
-                        return
-                except FloodWait as e:
-                    logger.info(f"FloodWait: sleeping for {e.value} seconds")
-                    await asyncio.sleep(e.value)
-                    continue
+            if plan['strategy'] == 'stream':
+                sent = await self.stream_transfer(
+                    direct_link, original_message, file_name, is_video,
+                    f"🔗 Original URL: {original_url}", processing_msg, info=plan
+                )
+                if sent:
+                    self.remember_sent_media(cache_key, sent)
+                    logger.info("File streamed successfully!")
+                    await self.progress.delete(processing_msg)
+                    return True
             
-            try:
-                await processing_msg.delete()
-            except:
-                pass
+            async with self.reserve_spool(spool_name, file_extension, plan['size'], processing_msg) as lease:
+                temp_filename = lease.path
+                logger.info("Starting download from: %s", direct_link)
+                success = await self.download_file_async(direct_link, temp_filename, processing_msg, info=plan)
+                
+                if not success:
+                    self.progress.status(processing_msg, "❌ <b>Failed to download file</b>")
+                    return
+                
+                actual_file_size = os.path.getsize(temp_filename)
+                logger.info("Downloaded file size: %.1fMB", actual_file_size/1024/1024)
                 
+                if actual_file_size > self.max_file_size:
+                    self.progress.status(
+                        processing_msg,
+                        f"❌ <b>File too large!</b>\n\nSize: {actual_file_size/1024/1024:.1f}MB"
+                    )
+                    return
+                
+                self.progress.status(processing_msg, "📤 <b>Uploading file...</b>")
+                
+                async with self.scheduler.stage('upload'):
+                    max_retries = 3
+                    for attempt in range(max_retries):
+                        try:
+                            sent = await self.upload_from_disk(
+                                temp_filename, original_message, file_name, is_video,
+                                f"🔗 Original URL: {original_url}", processing_msg
+                            )
+                            
+                            self.remember_sent_media(cache_key, sent)
+                            logger.info("File sent successfully!")
+                            break
+                            
+                        except RPCError as e:
+                            logger.warning("Upload attempt %s failed: %s", attempt + 1, e)
+                            if attempt < max_retries - 1:
+                                await asyncio.sleep(5)
+                            else:
+                                self.progress.status(processing_msg, "❌ <b>Upload failed after multiple attempts</b>")
+                                return
+                        except FloodWait as e:
+                            metrics.inc('bot_flood_waits_total', source='send_video')
+                            metrics.inc('bot_flood_wait_seconds_total', e.value, source='send_video')
+                            logger.info("FloodWait: sleeping for %s seconds", e.value)
+                            await asyncio.sleep(e.value)
+                            continue
+            
+            await self.progress.delete(processing_msg)
+            return True
+        
+        except SpoolFullError as e:
+            logger.warning("Rejected TeraBox file: %s", e)
+            self.progress.status(processing_msg, "❌ <b>Not enough disk space for this file right now</b>")
         except Exception as e:
-            logger.error(f"Error processing TeraBox file: {str(e)}")
+            logger.error("Error processing TeraBox file: %s", e)
             if processing_msg:
-                try:
-                    await processing_msg.edit_text("❌ <b>Processing failed</b>", parse_mode=ParseMode.HTML)
-                except:
-                    pass
-        finally:
-            if temp_filename and os.path.exists(temp_filename):
-                try:
-                    os.remove(temp_filename)
-                    logger.info("Temp file cleaned up")
-                except Exception as e:
-                    logger.warning(f"Failed to clean up temp file: {e}")
+                self.progress.status(processing_msg, "❌ <b>Processing failed</b>")
     
     async def process_instagram_url(self, url: str, url_type: str, message: Message):
         """Process Instagram URLs"""
         processing_msg = await message.reply_text("🔄 <b>Processing Instagram URL...</b>", parse_mode=ParseMode.HTML)
         
+        # reel and photo file_id keys only depend on the URL, so a repeat needs no resolve
+        if await self.send_cached_media(self.file_id_cache.make_key('reel', url), message, f"🔗 Original URL: {url}"):
+            await self.progress.delete(processing_msg)
+            return
+        if url_type == 'instagram_mixed' and await self.send_cached_photos(url, message):
+            await self.progress.delete(processing_msg)
+            return
+        
         if url_type in ['instagram_reel', 'instagram_mixed']:
-            data = await self.get_reel_data(url)
+            data = await self.resolve('reel', url)
             
             if data and data.get('status') == 'success':
                 await self.process_video(data, message, processing_msg, url)
                 return
             
             if url_type == 'instagram_mixed':
-                data = await self.get_photo_data(url)
+                data = await self.resolve('photo', url)
                 if data and data.get('status') == 'success':
-                    await self.process_photos(data, message, processing_msg)
+                    await self.process_photos(data, message, processing_msg, url)
                     return
         
-        await processing_msg.edit_text(
-            "❌ <b>Failed to fetch Instagram content</b>",
-            parse_mode=ParseMode.HTML
+        self.progress.status(
+            processing_msg,
+            "❌ <b>Failed to fetch Instagram content</b>"
         )
     
     async def process_video(self, data: dict, original_message: Message, processing_msg: Message, original_url: str):
         """Process and send Instagram video content"""
-        temp_filename = None
         try:
             video_url = data.get('video', '')
             if not video_url:
-                await processing_msg.edit_text("❌ <b>No video URL found</b>", parse_mode=ParseMode.HTML)
+                self.progress.status(processing_msg, "❌ <b>No video URL found</b>")
                 return
             
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            temp_filename = f"./downloads/reel_{timestamp}.mp4"
-            
-            await processing_msg.edit_text("⏬ <b>Downloading video...</b>", parse_mode=ParseMode.HTML)
+            cache_key = self.file_id_cache.make_key('reel', original_url)
+            await self.coalesce_transfer(
+                cache_key, original_message, processing_msg, f"🔗 Original URL: {original_url}",
+                lambda: self.transfer_video(video_url, original_message, processing_msg, original_url, cache_key)
+            )
+        except Exception as e:
+            logger.error("Error processing video: %s", e)
+            if processing_msg:
+                self.progress.status(processing_msg, "❌ <b>Failed to process video</b>")
+    
+    async def transfer_video(self, video_url: str, original_message: Message, processing_msg: Message,
+                             original_url: str, cache_key: str):
+        """Download and send an Instagram video, returns True once it was delivered"""
+        try:
+            content_id = hashlib.sha1(cache_key.encode()).hexdigest()[:16]
+            spool_name = f"reel_{content_id}"
+            file_name = f"{spool_name}.mp4"
             
-            success = await self.download_file_async(video_url, temp_filename, processing_msg)
+            self.progress.status(processing_msg, "⏬ <b>Downloading video...</b>")
             
-            if not success:
-                await processing_msg.edit_text("❌ <b>Failed to download video</b>", parse_mode=ParseMode.HTML)
+            plan = await self.plan_transfer(video_url, resumable=self.spool.has_partial(spool_name, '.mp4'))
+            if plan['strategy'] == 'reject':
+                self.reject_transfer(processing_msg, plan)
                 return
             
-            await processing_msg.edit_text("📤 <b>Uploading video...</b>", parse_mode=ParseMode.HTML)
-            
-            file_size = os.path.getsize(temp_filename)
-            if file_size > 2 * 1024 * 1024 * 1024:
-                await processing_msg.edit_text(
-                    f"❌ <b>File too large!</b>\n\n<b>File size:</b> {file_size/1024/1024:.1f}MB\n<b>Maximum allowed:</b> 2GB",
-                    parse_mode=ParseMode.HTML
+            if plan['strategy'] == 'stream':
+                sent = await self.stream_transfer(
+                    video_url, original_message, file_name, True,
+                    f"🔗 Original URL: {original_url}", processing_msg, info=plan
                 )
-                return
+                if sent:
+                    self.remember_sent_media(cache_key, sent)
+                    await self.progress.delete(processing_msg)
+                    return True
             
-            try:
-                await original_message.reply_video(
-                    temp_filename,
-                    caption=f"🔗 Original URL: {original_url}"
-                )
-                await processing_msg.delete()
-            except FloodWait as e:
-                await asyncio.sleep(e.value)
-                await original_message.reply_video(
-                    temp_filename,
-                    caption=f"🔗 Original URL: {original_url}"
-                )
-                await processing_msg.delete()
-            except Exception as e:
-                logger.error(f"Error sending video: {str(e)}")
-                await processing_msg.edit_text("❌ <b>Failed to send video</b>", parse_mode=ParseMode.HTML)
+            async with self.reserve_spool(spool_name, '.mp4', plan['size'], processing_msg) as lease:
+                temp_filename = lease.path
+                success = await self.download_file_async(video_url, temp_filename, processing_msg, info=plan)
+                
+                if not success:
+                    self.progress.status(processing_msg, "❌ <b>Failed to download video</b>")
+                    return
+                
+                self.progress.status(processing_msg, "📤 <b>Uploading video...</b>")
+                
+                file_size = os.path.getsize(temp_filename)
+                if file_size > self.max_file_size:
+                    self.reject_transfer(processing_msg, {'size': file_size, 'reason': 'too_large'})
+                    return
                 
-        except Exception as e:
-            logger.error(f"Error processing video: {str(e)}")
-            if processing_msg:
-                try:
-                    await processing_msg.edit_text("❌ <b>Failed to process video</b>", parse_mode=ParseMode.HTML)
-                except:
-                    pass
-        finally:
-            if temp_filename and os.path.exists(temp_filename):
                 try:
-                    os.remove(temp_filename)
-                    logger.info("Temp video file cleaned up")
+                    async with self.scheduler.stage('upload'):
+                        sent = await self.upload_from_disk(
+                            temp_filename, original_message, file_name, True,
+                            f"🔗 Original URL: {original_url}", processing_msg
+                        )
+                    self.remember_sent_media(cache_key, sent)
+                    await self.progress.delete(processing_msg)
+                    return True
+                except FloodWait as e:
+                    metrics.inc('bot_flood_waits_total', source='send_video')
+                    metrics.inc('bot_flood_wait_seconds_total', e.value, source='send_video')
+                    await asyncio.sleep(e.value)
+                    async with self.scheduler.stage('upload'):
+                        sent = await self.upload_from_disk(
+                            temp_filename, original_message, file_name, True,
+                            f"🔗 Original URL: {original_url}", processing_msg
+                        )
+                    self.remember_sent_media(cache_key, sent)
+                    await self.progress.delete(processing_msg)
+                    return True
                 except Exception as e:
-                    logger.warning(f"Failed to clean up temp video file: {e}")
+                    logger.error("Error sending video: %s", e)
+                    self.progress.status(processing_msg, "❌ <b>Failed to send video</b>")
+        
+        except SpoolFullError as e:
+            logger.warning("Rejected video: %s", e)
+            self.progress.status(processing_msg, "❌ <b>Not enough disk space for this video right now</b>")
+        except Exception as e:
+            logger.error("Error processing video: %s", e)
+            if processing_msg:
+                self.progress.status(processing_msg, "❌ <b>Failed to process video</b>")
     
-    async def process_photos(self, data: dict, original_message: Message, processing_msg: Message):
-        """Process and send Instagram photo content"""
+    async def process_photos(self, data: dict, original_message: Message, processing_msg: Message, original_url: str = ''):
+        """Process and send Instagram photo content as media groups"""
         try:
-            images = data.get('images', [])
+            images = [img_data.get('image', '') for img_data in data.get('images', [])]
+            images = [img_url for img_url in images if img_url]
             if not images:
-                await processing_msg.edit_text("❌ <b>No images found</b>", parse_mode=ParseMode.HTML)
+                self.progress.status(processing_msg, "❌ <b>No images found</b>")
                 return
             
             total_images = len(images)
-            await processing_msg.edit_text(f"📸 <b>Downloading {total_images} image(s)...</b>", parse_mode=ParseMode.HTML)
+            self.progress.status(processing_msg, f"📸 <b>Downloading {total_images} image(s)...</b>")
+            
+            async def prepare(idx: int, img_url: str):
+                cache_key = self.file_id_cache.make_key('photo', original_url or img_url, idx)
+                cached = self.file_id_cache.get(cache_key)
+                if cached and cached['media_type'] == 'photo':
+                    return cache_key, cached['file_id']
+                return cache_key, await self.download_to_memory(img_url, f"photo_{idx}.jpg")
             
-            for idx, img_data in enumerate(images, 1):
-                img_url = img_data.get('image', '')
-                if not img_url:
+            prepared = await asyncio.gather(*(prepare(idx, img_url) for idx, img_url in enumerate(images, 1)))
+            
+            media_group = []
+            cache_keys = []
+            for idx, (cache_key, media) in enumerate(prepared, 1):
+                if media is None:
+                    logger.warning("Failed to download image %s/%s", idx, total_images)
+                    continue
+                caption = f"📸 <b>Image {idx}/{total_images}</b>\n\n<b>Downloaded by Multi-Platform Bot</b>\n<b>Developer:</b> @medusaXD"
+                media_group.append(InputMediaPhoto(media, caption=caption, parse_mode=ParseMode.HTML))
+                cache_keys.append(cache_key)
+            
+            if not media_group:
+                self.progress.status(processing_msg, "❌ <b>Failed to download images</b>")
+                return
+            
+            self.progress.status(processing_msg, f"📤 <b>Uploading {len(media_group)} image(s)...</b>")
+            
+            delivered = 0
+            for start in range(0, len(media_group), self.MEDIA_GROUP_LIMIT):
+                chunk = media_group[start:start + self.MEDIA_GROUP_LIMIT]
+                try:
+                    async with self.scheduler.stage('upload'):
+                        sent = await self.send_media_group_paced(original_message, chunk)
+                except Exception as e:
+                    logger.error("Error sending photos %s-%s: %s", start + 1, start + len(chunk), e)
                     continue
                 
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                temp_filename = f"./downloads/photo_{timestamp}_{idx}.jpg"
-                
-                await processing_msg.edit_text(
-                    f"⏬ <b>Downloading image {idx}/{total_images}...</b>",
-                    parse_mode=ParseMode.HTML
-                )
-                
-                success = await self.download_file_async(img_url, temp_filename)
-                
-                if success:
-                    try:
-                        await original_message.reply_photo(
-                            temp_filename,
-                            caption=f"📸 <b>Image {idx}/{total_images}</b>\n\n<b>Downloaded by Multi-Platform Bot</b>\n<b>Developer:</b> @medusaXD",
-                            parse_mode=ParseMode.HTML
-                        )
-                    except Exception as e:
-                        logger.error(f"Error sending photo {idx}: {e}")
-                    
-                    if os.path.exists(temp_filename):
-                        os.remove(temp_filename)
-                
-                await asyncio.sleep(1)
+                for cache_key, sent_message in zip(cache_keys[start:start + len(chunk)], sent):
+                    self.remember_sent_media(cache_key, sent_message)
+                    delivered += 1
+            
+            if original_url and delivered == total_images:
+                self.file_id_cache.set(self.file_id_cache.make_key('photo', original_url, 'album'), str(total_images), 'album')
             
-            await processing_msg.delete()
+            await self.progress.delete(processing_msg)
             
         except Exception as e:
-            logger.error(f"Error processing photos: {str(e)}")
+            logger.error("Error processing photos: %s", e)
             if processing_msg:
+                self.progress.status(processing_msg, "❌ <b>Failed to process images</b>")
+    
+    def collect_metrics(self):
+        """Gauge and counter samples read from the stats of the long-lived components"""
+        samples = []
+        
+        pool = self.browser_pool.stats()
+        samples += [
+            ('bot_browser_contexts', {'state': 'in_use'}, pool['in_use']),
+            ('bot_browser_contexts', {'state': 'waiting'}, pool['waiting']),
+            ('bot_browser_contexts', {'state': 'max'}, pool['max_contexts']),
+            ('bot_browser_events_total', {'event': 'lease'}, pool['total_leases']),
+            ('bot_browser_events_total', {'event': 'saturated'}, pool['saturated_events']),
+            ('bot_browser_events_total', {'event': 'recycle'}, pool['recycles']),
+            ('bot_browser_events_total', {'event': 'crash'}, pool['crashes'])
+        ]
+        
+        caches = {
+            'resolution': self.resolution_cache,
+            'file_id': self.file_id_cache,
+            'challenge_cookies': self.challenge_cookies
+        }
+        for name, cache in caches.items():
+            lookups = cache.hits + cache.misses
+            samples += [
+                ('bot_cache_lookups_total', {'cache': name, 'result': 'hit'}, cache.hits),
+                ('bot_cache_lookups_total', {'cache': name, 'result': 'miss'}, cache.misses),
+                ('bot_cache_hit_ratio', {'cache': name}, cache.hits / lookups if lookups else 0.0)
+            ]
+        samples.append(('bot_cache_entries', {'cache': 'resolution'}, len(self.resolution_cache.backend)))
+        
+        jobs = self.scheduler.stats()
+        samples += [
+            ('bot_queue_depth', {}, jobs['depth']),
+            ('bot_active_jobs', {}, jobs['active_jobs'])
+        ]
+        for result in ('submitted', 'completed', 'failed', 'rejected'):
+            samples.append(('bot_jobs_total', {'result': result}, jobs[result]))
+        for stage, usage in jobs['stages'].items():
+            samples += [
+                ('bot_stage_workers', {'stage': stage, 'state': 'busy'}, usage['busy']),
+                ('bot_stage_workers', {'stage': stage, 'state': 'limit'}, usage['limit'])
+            ]
+        
+        progress = self.progress.stats()
+        samples += [
+            ('bot_progress_edits_total', {'result': 'sent'}, progress['edits']),
+            ('bot_progress_edits_total', {'result': 'coalesced'}, progress['coalesced'])
+        ]
+        
+        for name, upstream in self.upstreams.items():
+            stats = upstream.stats()
+            samples += [
+                ('bot_upstream_circuit_open', {'upstream': name}, 0 if stats['state'] == UpstreamGuard.CLOSED else 1),
+                ('bot_upstream_latency_p95_seconds', {'upstream': name}, stats['p95'])
+            ]
+            for event in ('calls', 'failures', 'retries', 'hedges', 'hedge_wins', 'rejected', 'opens'):
+                samples.append(('bot_upstream_events_total', {'upstream': name, 'event': event}, stats[event]))
+        
+        inflight = self.inflight.stats()
+        samples += [
+            ('bot_inflight_calls', {}, inflight['running']),
+            ('bot_inflight_calls_total', {'role': 'leader'}, inflight['leaders']),
+            ('bot_inflight_calls_total', {'role': 'follower'}, inflight['followers'])
+        ]
+        
+        spool = self.spool.stats()
+        for area in ('disk', 'tmpfs'):
+            if area in spool:
+                samples += [
+                    ('bot_spool_bytes', {'area': area, 'state': 'reserved'}, spool[area]['reserved']),
+                    ('bot_spool_bytes', {'area': area, 'state': 'free'}, spool[area]['free']),
+                    ('bot_spool_bytes', {'area': area, 'state': 'budget'}, spool[area]['budget']),
+                    ('bot_spool_leases', {'area': area}, spool[area]['leases'])
+                ]
+        samples.append(('bot_spool_waiting', {}, spool['waiting']))
+        for result in ('admitted', 'rejected'):
+            samples.append(('bot_spool_admissions_total', {'result': result}, spool[result]))
+        
+        if self.supervisor:
+            supervisor = self.supervisor.stats()
+            samples += [
+                ('bot_workers', {'state': 'alive'}, supervisor['alive']),
+                ('bot_workers', {'state': 'configured'}, supervisor['workers']),
+                ('bot_worker_restarts_total', {}, supervisor['restarts']),
+                ('bot_dispatched_jobs_total', {}, supervisor['dispatched'])
+            ]
+        return samples
+    
+    async def startup(self):
+        """Start long-lived resources shared by all requests"""
+        await self.http.start()
+        await self.scheduler.start()
+        await self.progress.start()
+        await asyncio.to_thread(self.spool.sweep)
+        self.browser_pool.warm_up()
+    
+    async def shutdown(self):
+        """Release long-lived resources"""
+        await self.scheduler.stop()
+        await self.progress.stop()
+        await self.browser_pool.stop()
+        await self.http.close()
+        if isinstance(self.resolution_cache.backend, SQLiteCacheBackend):
+            self.resolution_cache.backend.close()
+        self.file_id_cache.close()
+    
+    async def main(self):
+        """Run the client together with the bot lifecycle hooks"""
+        await self.app.start()
+        if self.metrics_server:
+            await self.metrics_server.start()
+        try:
+            if self.supervisor:
+                await self.supervisor.start()
+                logger.info("Bot is up and running with %s worker processes", self.supervisor.workers)
+            else:
+                await self.startup()
+                logger.info("Bot is up and running")
+            await idle()
+        finally:
+            if self.supervisor:
+                await self.supervisor.stop()
+            else:
+                await self.shutdown()
+            if self.metrics_server:
+                await self.metrics_server.stop()
+            await self.app.stop()
+    
+    async def worker_main(self, job_queue):
+        """Serve jobs dispatched by the supervisor until it sends the stop sentinel"""
+        await self.app.start()
+        if self.metrics_server:
+            await self.metrics_server.start()
+        try:
+            await self.startup()
+            logger.info("Worker %s is up and running", self.worker_index)
+            loop = asyncio.get_running_loop()
+            
+            while True:
+                payload = await loop.run_in_executor(None, job_queue.get)
+                if payload is None:
+                    break
+                
                 try:
-                    await processing_msg.edit_text("❌ <b>Failed to process images</b>", parse_mode=ParseMode.HTML)
-                except:
-                    pass
+                    message = await self.app.get_messages(payload['chat_id'], payload['message_id'])
+                    await self.enqueue_urls(payload['urls'], message)
+                except Exception as e:
+                    logger.error("Worker %s failed to accept job: %s", self.worker_index, e)
+            
+            while self.scheduler.depth or self.scheduler.stats()['active_jobs']:
+                await asyncio.sleep(1)
+        finally:
+            await self.shutdown()
+            if self.metrics_server:
+                await self.metrics_server.stop()
+            await self.app.stop()
     
     def run(self):
         """Start the bot with enhanced error handling"""
         try:
             logger.info("🚀 Starting Multi-Platform Downloader Bot...")
-            self.app.run()
+            self.app.run(self.main())
         except KeyboardInterrupt:
             logger.info("Bot stopped by user")
         except Exception as e:
-            logger.error(f"Bot error: {e}")
+            logger.error("Bot error: %s", e)
+
+def run_worker(index: int, job_queue):
+    """Entry point of a worker process started by WorkerSupervisor"""
+    root, ext = os.path.splitext(os.getenv('LOG_FILE', 'bot.log'))
+    stop_logging = setup_logging(f"{root}.worker{index}{ext}", worker=index)
+    worker = InstagramDownloaderBot(worker_index=index)
+    try:
+        worker.app.run(worker.worker_main(job_queue))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.error("Worker %s error: %s", index, e)
+    finally:
+        # multiprocessing children exit without running atexit hooks
+        stop_logging()
 
-bot = InstagramDownloaderBot()
 
 if __name__ == "__main__":
+    setup_logging()
+    bot = InstagramDownloaderBot()
     bot.run()
@@ -0,0 +1,202 @@
+"""Single-flight coalescing of resolves and transfers, and file_id cache hits that skip the download."""
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import MediaFileIdCache, SingleFlight
+
+
+class SingleFlightTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_concurrent_calls_share_one_flight(self):
+        flight = SingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def work():
+            calls.append(1)
+            await release.wait()
+            return 'result'
+
+        tasks = [asyncio.create_task(flight.do('key', work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, [('result', False), ('result', True), ('result', True)])
+        self.assertEqual(len(flight), 0)
+
+    async def test_failed_flight_is_shared_but_not_cached(self):
+        flight = SingleFlight()
+        calls = []
+        release = asyncio.Event()
+
+        async def failing():
+            calls.append(1)
+            await release.wait()
+            raise ValueError("upstream failed")
+
+        tasks = [asyncio.create_task(flight.do('key', failing)) for _ in range(2)]
+        await asyncio.sleep(0)
+        release.set()
+        for outcome in await asyncio.gather(*tasks, return_exceptions=True):
+            self.assertIsInstance(outcome, ValueError)
+        self.assertEqual(len(calls), 1)
+
+        async def working():
+            calls.append(1)
+            return 'ok'
+
+        self.assertEqual(await flight.do('key', working), ('ok', False))
+        self.assertEqual(len(calls), 2)
+
+    async def test_follower_takes_over_when_the_leader_is_cancelled(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        leader = asyncio.create_task(flight.do('key', work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do('key', work))
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        self.assertEqual(await follower, (2, False))
+        self.assertEqual(len(calls), 2)
+
+
+class FakeMessage:
+    """The subset of pyrogram.types.Message the delivery paths use"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, sent: list):
+        self.id = next(self._ids)
+        self.chat = SimpleNamespace(id=1)
+        self.from_user = SimpleNamespace(id=1)
+        self.sent = sent
+
+    async def reply_video(self, video, **kwargs):
+        self.sent.append(('video', video))
+        return SimpleNamespace(video=SimpleNamespace(file_id=f"file-{video}"), document=None, photo=None)
+
+    async def reply_document(self, document, **kwargs):
+        self.sent.append(('document', document))
+        return SimpleNamespace(video=None, document=SimpleNamespace(file_id=f"file-{document}"), photo=None)
+
+    async def reply_photo(self, photo, **kwargs):
+        self.sent.append(('photo', photo))
+        return SimpleNamespace(video=None, document=None, photo=SimpleNamespace(file_id=f"file-{photo}"))
+
+    async def edit_text(self, text, **kwargs):
+        return self
+
+    async def delete(self):
+        return True
+
+
+class BotCoalescingTest(unittest.IsolatedAsyncioTestCase):
+
+    SHARE = 'https://terabox.com/s/1abcDEF'
+    MIRROR = 'https://www.1024terabox.com/s/1abcDEF'
+
+    async def asyncSetUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        for name, value in (('API_ID', '1'), ('API_HASH', 'test'), ('BOT_TOKEN', '1:test')):
+            os.environ.setdefault(name, value)
+        from main import InstagramDownloaderBot
+        self.bot = InstagramDownloaderBot()
+        self.sent = []
+
+    async def asyncTearDown(self):
+        self.bot.file_id_cache.close()
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    async def test_mirror_links_share_one_resolve(self):
+        calls = []
+        release = asyncio.Event()
+
+        async def get_terabox_data(url):
+            calls.append(url)
+            await release.wait()
+            return {'status': 'success', 'file_name': 'video.mp4'}
+
+        self.bot.get_terabox_data = get_terabox_data
+        tasks = [asyncio.create_task(self.bot.resolve('terabox', url)) for url in (self.SHARE, self.MIRROR)]
+        await asyncio.sleep(0)
+        release.set()
+        first, second = await asyncio.gather(*tasks)
+
+        self.assertEqual(len(calls), 1)
+        self.assertIs(first, second)
+
+    async def test_follower_is_delivered_from_the_leaders_file_id(self):
+        cache_key = self.bot.file_id_cache.make_key('terabox', self.SHARE, 'video.mp4', '10 MB')
+        transfers = []
+        release = asyncio.Event()
+
+        async def transfer(message):
+            transfers.append(message)
+            await release.wait()
+            sent = await message.reply_video('upload')
+            self.bot.remember_sent_media(cache_key, sent)
+            return True
+
+        leader, follower = FakeMessage(self.sent), FakeMessage(self.sent)
+        tasks = [
+            asyncio.create_task(self.bot.coalesce_transfer(
+                cache_key, message, FakeMessage(self.sent), "caption", lambda message=message: transfer(message)
+            ))
+            for message in (leader, follower)
+        ]
+        await asyncio.sleep(0.01)
+        release.set()
+
+        self.assertEqual(await asyncio.gather(*tasks), [True, True])
+        self.assertEqual(transfers, [leader])
+        self.assertEqual(self.sent, [('video', 'upload'), ('video', 'file-upload')])
+
+    async def test_failed_transfer_is_not_cached(self):
+        cache_key = self.bot.file_id_cache.make_key('terabox', self.SHARE, 'video.mp4', '10 MB')
+        attempts = []
+
+        async def failing():
+            attempts.append(1)
+            return False
+
+        message = FakeMessage(self.sent)
+        self.assertFalse(await self.bot.coalesce_transfer(cache_key, message, FakeMessage(self.sent), "", failing))
+        self.assertFalse(await self.bot.coalesce_transfer(cache_key, message, FakeMessage(self.sent), "", failing))
+        self.assertEqual(len(attempts), 2)
+        self.assertIsNone(self.bot.file_id_cache.get(cache_key))
+
+    async def test_file_id_hit_on_a_mirror_skips_the_download(self):
+        data = {'file_name': 'video.mp4', 'size': '10 MB', 'direct_link': 'http://unused'}
+        self.bot.file_id_cache.set(
+            MediaFileIdCache.make_key('terabox', self.SHARE, 'video.mp4', '10 MB'), 'cached-id', 'video'
+        )
+
+        async def no_download(*args, **kwargs):
+            raise AssertionError("cached content was downloaded again")
+
+        self.bot.transfer_terabox_file = no_download
+        await self.bot.process_terabox_file(data, FakeMessage(self.sent), FakeMessage(self.sent), self.MIRROR)
+        self.assertEqual(self.sent, [('video', 'cached-id')])
+
+
+if __name__ == '__main__':
+    unittest.main()
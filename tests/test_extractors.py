@@ -0,0 +1,67 @@
+"""Page extractors on the benchmark fixtures: results and the early stop once the result is known."""
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from main import create_extractor, extract_page
+
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+CHUNK = 1024
+
+
+def fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES, name), 'rb') as f:
+        return f.read()
+
+
+def feed_in_chunks(name: str, page: bytes):
+    """Feed ``page`` like a streamed response, returns the result and how many bytes were consumed"""
+    extractor = create_extractor(name)
+    consumed = 0
+    for start in range(0, len(page), CHUNK):
+        consumed = min(start + CHUNK, len(page))
+        if extractor.feed(page[start:start + CHUNK]):
+            break
+    return extractor.close(), consumed
+
+
+class PhotoExtractorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.page = fixture('snapdownloader_photo.html')
+
+    def test_best_tier_is_returned(self):
+        links = extract_page('snapdownloader_photo', self.page)
+        self.assertEqual(len(links), 6)
+        for index, link in enumerate(links):
+            self.assertIn(f'p{index}_1080x1080.jpg', link)
+
+    def test_stops_once_the_download_box_closes(self):
+        links, consumed = feed_in_chunks('snapdownloader_photo', self.page)
+        self.assertEqual(links, extract_page('snapdownloader_photo', self.page))
+        box_end = self.page.index(b'</a></div>\n</div>') + len(b'</a></div>\n</div>')
+        self.assertLess(consumed, len(self.page))
+        self.assertLessEqual(consumed, box_end + CHUNK)
+
+    def test_page_without_buttons_reads_to_the_end(self):
+        page = self.page.replace(b'btn-download', b'btn-other')
+        links, consumed = feed_in_chunks('snapdownloader_photo', page)
+        self.assertEqual(links, [])
+        self.assertEqual(consumed, len(page))
+
+
+class ReelExtractorTest(unittest.TestCase):
+
+    def test_first_video_link_stops_the_stream(self):
+        page = fixture('snapdownloader_reel.html')
+        url, consumed = feed_in_chunks('snapdownloader_reel', page)
+        self.assertIn('.mp4', url)
+        self.assertEqual(url, extract_page('snapdownloader_reel', page))
+        self.assertLess(consumed, len(page))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+"""JobScheduler: batches run as separate jobs under the per-user active limit."""
+import asyncio
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import JobScheduler, QueueFullError
+
+
+class SubmitManyTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.scheduler = JobScheduler(workers=4, max_queue=20, per_user_active=2, per_user_queue=2)
+        await self.scheduler.start()
+
+    async def asyncTearDown(self):
+        await self.scheduler.stop()
+
+    async def test_batch_jobs_share_the_users_active_limit_and_others_interleave(self):
+        running = {'batch': 0, 'peak': 0}
+        order = []
+        release = asyncio.Event()
+
+        def batch_job(index):
+            async def job():
+                running['batch'] += 1
+                running['peak'] = max(running['peak'], running['batch'])
+                await release.wait()
+                order.append(f"batch-{index}")
+                running['batch'] -= 1
+            return job
+
+        async def other_job():
+            order.append('other')
+
+        await self.scheduler.submit_many('batcher', [batch_job(index) for index in range(6)])
+        await self.scheduler.submit('other', other_job)
+        await asyncio.sleep(0.05)
+        self.assertEqual(order, ['other'])
+        self.assertEqual(running['batch'], 2)
+
+        release.set()
+        while self.scheduler.depth or self.scheduler.stats()['active_jobs']:
+            await asyncio.sleep(0.01)
+        self.assertEqual(running['peak'], 2)
+        self.assertEqual(len(order), 7)
+
+    async def test_batch_is_admitted_whole_or_rejected(self):
+        async def job():
+            await asyncio.sleep(1)
+
+        with self.assertRaises(QueueFullError):
+            await self.scheduler.submit_many('user', [job] * 25)
+        self.assertEqual(self.scheduler.depth, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
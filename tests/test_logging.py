@@ -0,0 +1,68 @@
+"""Queued JSON logging: structured exceptions and lazily formatted sampled records."""
+import json
+import logging
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main
+
+
+class CountingArg:
+    """Counts how often a log argument is rendered"""
+
+    def __init__(self):
+        self.renders = 0
+
+    def __str__(self):
+        self.renders += 1
+        return 'arg'
+
+
+class QueuedLoggingTest(unittest.TestCase):
+
+    def setUp(self):
+        root = logging.getLogger()
+        self._saved = (root.handlers[:], root.level)
+        self._tmp = tempfile.TemporaryDirectory()
+        self.log_file = os.path.join(self._tmp.name, 'bot.log')
+        self.stop = main.setup_logging(self.log_file, worker=3)
+
+    def tearDown(self):
+        self.stop()
+        root = logging.getLogger()
+        root.handlers, level = self._saved
+        root.setLevel(level)
+        self._tmp.cleanup()
+
+    def records(self):
+        self.stop()
+        with open(self.log_file, encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+
+    def test_exception_is_kept_as_its_own_field(self):
+        try:
+            raise ValueError("bad value")
+        except ValueError:
+            main.logger.exception("Failed on %s", 'item')
+
+        record, = self.records()
+        self.assertEqual(record['msg'], 'Failed on item')
+        self.assertIn('ValueError: bad value', record['exc'])
+        self.assertEqual(record['worker'], 3)
+
+    def test_suppressed_sampled_records_are_never_formatted(self):
+        arg = CountingArg()
+        burst = next(f for f in main.sampled_logger.filters if isinstance(f, main.SamplingFilter)).burst
+        for _ in range(burst + 5):
+            main.sampled_logger.warning("hot path %s", arg)
+
+        self.assertEqual(len(self.records()), burst)
+        self.assertEqual(arg.renders, burst)
+
+
+if __name__ == '__main__':
+    unittest.main()
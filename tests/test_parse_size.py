@@ -0,0 +1,27 @@
+"""parse_size: resolver size strings into bytes."""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import parse_size
+
+
+class ParseSizeTest(unittest.TestCase):
+
+    def test_units(self):
+        self.assertEqual(parse_size("500 Bytes"), 500)
+        self.assertEqual(parse_size("1 byte"), 1)
+        self.assertEqual(parse_size("500 B"), 500)
+        self.assertEqual(parse_size("12KB"), 12 * 1024)
+        self.assertEqual(parse_size("1.5 GB"), int(1.5 * 1024 ** 3))
+        self.assertEqual(parse_size("2,048 MB"), 2048 * 1024 ** 2)
+
+    def test_unknown_is_zero(self):
+        for text in (None, "", "Unknown", "10 Bits"):
+            self.assertEqual(parse_size(text), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""SegmentedDownloader against the benchmark range server: resume, fallbacks and Content-Range checks."""
+import os
+import re
+import sys
+import tempfile
+import unittest
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from bench_segmented_download import matches_payload
+from main import HttpClient, SegmentedDownloader
+from range_server import RangeFileServer, payload_slice
+
+KB = 1024
+SIZE = 1024 * KB
+PIECE = 128 * KB
+
+
+class FaultyRangeServer(RangeFileServer):
+    """Adds endpoints that fail, cut short or mislabel range responses"""
+
+    def __init__(self, size: int):
+        super().__init__(size)
+        self.fail_from = None
+        self.truncated = set()
+        self.range_starts = []
+
+    def add_routes(self, app):
+        super().add_routes(app)
+        app.router.add_get('/flaky', self.handle_flaky)
+        app.router.add_get('/truncating', self.handle_truncating)
+        app.router.add_get('/shifted', self.handle_shifted)
+        app.router.add_get('/overlong', self.handle_overlong)
+
+    def requested_range(self, request):
+        match = re.match(r'bytes=(\d+)-(\d+)', request.headers.get('Range', ''))
+        return int(match.group(1)), int(match.group(2))
+
+    def range_response(self, start: int, end: int, content_range: str = None, body: bytes = None):
+        return web.Response(status=206, body=payload_slice(start, end) if body is None else body, headers={
+            'Content-Range': content_range or f'bytes {start}-{end}/{self.size}',
+            'Content-Type': 'application/octet-stream',
+            'ETag': '"faulty"'
+        })
+
+    async def handle_flaky(self, request):
+        start, end = self.requested_range(request)
+        if end > start:
+            self.range_starts.append(start)
+        if self.fail_from is not None and start >= self.fail_from:
+            return web.Response(status=503)
+        return self.range_response(start, end)
+
+    async def handle_truncating(self, request):
+        start, end = self.requested_range(request)
+        if end == start or start in self.truncated:
+            return self.range_response(start, end)
+        self.truncated.add(start)
+        response = web.StreamResponse(status=206, headers={
+            'Content-Length': str(end - start + 1),
+            'Content-Range': f'bytes {start}-{end}/{self.size}'
+        })
+        await response.prepare(request)
+        await response.write(payload_slice(start, start + (end - start) // 2))
+        request.transport.close()
+        return response
+
+    async def handle_shifted(self, request):
+        start, end = self.requested_range(request)
+        if end == start:
+            return self.range_response(start, end)
+        return self.range_response(start, end, content_range=f'bytes {start + 1}-{end}/{self.size}')
+
+    async def handle_overlong(self, request):
+        start, end = self.requested_range(request)
+        if end == start:
+            return self.range_response(start, end)
+        # claims the asked range but keeps sending junk after it
+        return self.range_response(start, end, body=payload_slice(start, end) + b'\xee' * PIECE)
+
+
+class SegmentedDownloadTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = await FaultyRangeServer(SIZE).start()
+        self.http = HttpClient()
+        await self.http.start()
+        self.downloader = SegmentedDownloader(
+            self.http, initial_segments=2, max_segments=4, piece_size=PIECE, min_split_size=PIECE
+        )
+        self._tmp = tempfile.TemporaryDirectory()
+        self.target = os.path.join(self._tmp.name, 'out.bin')
+
+    async def asyncTearDown(self):
+        await self.http.close()
+        await self.server.stop()
+        self._tmp.cleanup()
+
+    async def test_segmented_download_writes_the_whole_file(self):
+        self.assertTrue(await self.downloader.download(f"{self.server.url}/file", self.target))
+        self.assertTrue(matches_payload(self.target, SIZE))
+        self.assertFalse(self.downloader.has_journal(self.target))
+
+    async def test_range_ignoring_server_falls_back_to_a_single_stream(self):
+        self.assertTrue(await self.downloader.download(f"{self.server.url}/norange", self.target))
+        self.assertTrue(matches_payload(self.target, SIZE))
+        # the one-byte probe and one full download
+        self.assertEqual(self.server.requests, 2)
+
+    async def test_resume_after_failures_fetches_only_the_missing_pieces(self):
+        url = f"{self.server.url}/flaky"
+        self.server.fail_from = SIZE // 2
+        self.assertFalse(await self.downloader.download(url, self.target))
+        self.assertTrue(self.downloader.has_journal(self.target))
+
+        self.server.fail_from = None
+        self.server.range_starts.clear()
+        self.assertTrue(await self.downloader.download(url, self.target))
+        self.assertTrue(matches_payload(self.target, SIZE))
+        self.assertEqual(sorted(self.server.range_starts), list(range(SIZE // 2, SIZE, PIECE)))
+        self.assertFalse(self.downloader.has_journal(self.target))
+
+    async def test_truncated_pieces_are_retried(self):
+        self.assertTrue(await self.downloader.download(f"{self.server.url}/truncating", self.target))
+        self.assertTrue(matches_payload(self.target, SIZE))
+        self.assertEqual(len(self.server.truncated), SIZE // PIECE)
+
+    async def test_mismatched_content_range_is_rejected(self):
+        self.assertFalse(await self.downloader.download(f"{self.server.url}/shifted", self.target))
+        self.assertTrue(self.downloader.has_journal(self.target))
+
+    async def test_response_longer_than_the_range_is_rejected(self):
+        self.assertFalse(await self.downloader.download(f"{self.server.url}/overlong", self.target))
+        with open(self.target, 'rb') as f:
+            written = f.read()
+        # junk would land in the next piece, which may already be complete; every byte is either unwritten or right
+        expected = payload_slice(0, SIZE - 1)
+        self.assertTrue(all(byte in (0, want) for byte, want in zip(written, expected)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+"""SpoolManager: shared disk budget, path locks, crash sweep and resume credit."""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import SpoolFullError, SpoolManager
+
+MB = 1024 * 1024
+
+
+class SpoolTestCase(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.directory = self._tmp.name
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def make_manager(self, budget=10 * MB, wait_timeout=2.0):
+        manager = SpoolManager(self.directory, budget=budget, wait_timeout=wait_timeout)
+        manager.RECHECK_SECONDS = 0.05
+        return manager
+
+
+class SharedBudgetTest(SpoolTestCase):
+
+    async def test_reservations_of_another_manager_count_against_the_budget(self):
+        first = self.make_manager()
+        second = self.make_manager(wait_timeout=0.2)
+
+        async with first.reserve('a', '.bin', 6 * MB):
+            self.assertEqual(second.disk.reserved, 6 * MB)
+            with self.assertRaisesRegex(SpoolFullError, 'Timed out'):
+                async with second.reserve('b', '.bin', 6 * MB):
+                    pass
+            async with second.reserve('c', '.bin', 4 * MB):
+                self.assertEqual(first.disk.reserved, 10 * MB)
+
+        self.assertEqual(second.disk.reserved, 0)
+
+    async def test_waiter_is_admitted_once_the_other_manager_releases(self):
+        first = self.make_manager()
+        second = self.make_manager()
+        waits = []
+
+        async def hold():
+            async with first.reserve('a', '.bin', 8 * MB):
+                await asyncio.sleep(0.2)
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.05)
+        async with second.reserve('b', '.bin', 8 * MB, on_wait=lambda: waits.append(1)) as lease:
+            self.assertTrue(holder.done())
+            self.assertEqual(second.disk.reserved, 8 * MB)
+            self.assertTrue(lease.path.endswith('b.bin'))
+        self.assertEqual(waits, [1])
+        await holder
+
+    async def test_lock_left_by_a_dead_holder_is_not_counted(self):
+        manager = self.make_manager()
+        with open(os.path.join(self.directory, 'gone.bin.lock'), 'w') as f:
+            f.write(str(9 * MB))
+
+        self.assertEqual(manager.disk.reserved, 0)
+        async with manager.reserve('a', '.bin', 8 * MB):
+            self.assertEqual(manager.disk.reserved, 8 * MB)
+
+
+class LockTest(SpoolTestCase):
+
+    async def test_held_name_falls_back_to_a_unique_path(self):
+        first = self.make_manager()
+        second = self.make_manager()
+
+        async with first.reserve('a', '.bin', MB) as held:
+            async with second.reserve('a', '.bin', MB) as other:
+                self.assertEqual(held.path, os.path.join(self.directory, 'a.bin'))
+                self.assertNotEqual(other.path, held.path)
+                self.assertIn(f"_{os.getpid()}_", os.path.basename(other.path))
+
+    async def test_lock_of_a_crashed_job_is_reclaimed(self):
+        manager = self.make_manager()
+        with open(os.path.join(self.directory, 'a.bin.lock'), 'w') as f:
+            f.write(str(os.getpid()))
+
+        async with manager.reserve('a', '.bin', MB) as lease:
+            self.assertEqual(lease.path, os.path.join(self.directory, 'a.bin'))
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'a.bin.lock')))
+
+
+class SweepTest(SpoolTestCase):
+
+    def touch(self, name, age=0):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as f:
+            f.write(b'x')
+        if age:
+            stamp = time.time() - age
+            os.utime(path, (stamp, stamp))
+        return path
+
+    async def test_sweep_keeps_live_leases_and_recent_partials(self):
+        manager = self.make_manager()
+        manager.journal_max_age = 3600
+        orphan = self.touch('orphan.bin')
+        recent = self.touch('recent.bin')
+        recent_journal = self.touch('recent.bin.journal')
+        old = self.touch('old.bin')
+        old_journal = self.touch('old.bin.journal', age=7200)
+        stale_lock = self.touch('gone.bin.lock')
+
+        async with manager.reserve('live', '.bin', MB) as lease:
+            with open(lease.path, 'wb') as f:
+                f.write(b'x')
+            self.assertEqual(manager.sweep(), 3)
+            self.assertTrue(os.path.exists(lease.path))
+
+        for path in (recent, recent_journal):
+            self.assertTrue(os.path.exists(path))
+        for path in (orphan, old, old_journal, stale_lock):
+            self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(os.path.join(self.directory, manager.disk.LEDGER_LOCK)))
+
+
+class ResumeCreditTest(SpoolTestCase):
+
+    def make_partial(self, name, size):
+        path = os.path.join(self.directory, name)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            os.posix_fallocate(fd, 0, size)
+        finally:
+            os.close(fd)
+        with open(f"{path}.journal", 'w') as f:
+            f.write('{}')
+        return path
+
+    def tighten(self, manager, spare):
+        """Leave only ``spare`` bytes above the free-space floor"""
+        manager.disk.min_free = shutil.disk_usage(self.directory).free - spare
+
+    async def test_resume_only_needs_space_for_the_unallocated_rest(self):
+        partial = self.make_partial('r.bin', 64 * MB)
+        manager = self.make_manager(budget=0)
+        self.tighten(manager, 16 * MB)
+
+        async with manager.reserve('r', '.bin', 64 * MB) as lease:
+            self.assertEqual(lease.path, partial)
+        with self.assertRaisesRegex(SpoolFullError, 'never fit'):
+            async with manager.reserve('n', '.bin', 64 * MB):
+                pass
+
+    async def test_no_credit_when_another_job_holds_the_partial(self):
+        partial = self.make_partial('r.bin', 64 * MB)
+        first = self.make_manager(budget=0)
+        second = self.make_manager(budget=0, wait_timeout=0.2)
+        self.tighten(first, 16 * MB)
+        second.disk.min_free = first.disk.min_free
+
+        async with first.reserve('r', '.bin', 64 * MB) as held:
+            self.assertEqual(held.path, partial)
+            # the unique path starts empty, it has to wait for the full size
+            with self.assertRaisesRegex(SpoolFullError, 'Timed out'):
+                async with second.reserve('r', '.bin', 64 * MB):
+                    pass
+            self.assertEqual(second.disk.reserved, 64 * MB)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,250 @@
+"""UpstreamGuard: circuit breaker states, retries, hedged requests and the guarded TeraBox browser solve."""
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from contextlib import asynccontextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import CircuitOpenError, UpstreamError, UpstreamGuard
+
+
+class UpstreamGuardTest(unittest.IsolatedAsyncioTestCase):
+
+    def make_guard(self):
+        return UpstreamGuard('test', attempts=1, min_calls=4, window=4, cooldown=0.05, max_cooldown=1.0)
+
+    async def fail(self, guard, count):
+        async def failing():
+            raise UpstreamError("upstream down")
+
+        for _ in range(count):
+            with self.assertRaises(UpstreamError):
+                await guard.call(failing, hedge=False)
+
+    async def test_opens_after_failure_rate_and_rejects(self):
+        guard = self.make_guard()
+        await self.fail(guard, 3)
+        self.assertEqual(guard.state, guard.CLOSED)
+
+        await self.fail(guard, 1)
+        self.assertEqual(guard.state, guard.OPEN)
+        self.assertEqual(guard.opens, 1)
+
+        calls = []
+
+        async def ok():
+            calls.append(1)
+            return 'ok'
+
+        with self.assertRaises(CircuitOpenError):
+            await guard.call(ok, hedge=False)
+        self.assertEqual(calls, [])
+        self.assertEqual(guard.rejected, 1)
+
+    async def test_half_open_lets_one_probe_through_and_closes_on_success(self):
+        guard = self.make_guard()
+        await self.fail(guard, 4)
+        await asyncio.sleep(0.06)
+
+        release = asyncio.Event()
+
+        async def slow_ok():
+            await release.wait()
+            return 'ok'
+
+        probe = asyncio.create_task(guard.call(slow_ok, hedge=False))
+        await asyncio.sleep(0)
+        self.assertEqual(guard.state, guard.HALF_OPEN)
+
+        with self.assertRaises(CircuitOpenError):
+            await guard.call(slow_ok, hedge=False)
+
+        release.set()
+        self.assertEqual(await probe, 'ok')
+        self.assertEqual(guard.state, guard.CLOSED)
+        self.assertEqual(guard.cooldown, guard.base_cooldown)
+
+    async def test_failed_probe_reopens_with_longer_cooldown(self):
+        guard = self.make_guard()
+        await self.fail(guard, 4)
+        await asyncio.sleep(0.06)
+
+        await self.fail(guard, 1)
+        self.assertEqual(guard.state, guard.OPEN)
+        self.assertEqual(guard.opens, 2)
+        self.assertAlmostEqual(guard.cooldown, 0.1)
+
+    async def test_returned_none_counts_as_success(self):
+        guard = self.make_guard()
+
+        async def empty():
+            return None
+
+        for _ in range(4):
+            self.assertIsNone(await guard.call(empty, hedge=False))
+        self.assertEqual(guard.state, guard.CLOSED)
+        self.assertEqual(guard.failures, 0)
+
+
+class RetryAndHedgeTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_failures_are_retried_until_success(self):
+        guard = UpstreamGuard('test', attempts=3, backoff=0, deadline=10)
+        calls = []
+
+        async def flaky():
+            calls.append(1)
+            if len(calls) < 3:
+                raise UpstreamError("503")
+            return 'ok'
+
+        self.assertEqual(await guard.call(flaky, hedge=False), 'ok')
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(guard.retries, 2)
+        self.assertEqual(guard.failures, 2)
+
+    async def test_last_failure_is_raised_once_attempts_run_out(self):
+        guard = UpstreamGuard('test', attempts=2, backoff=0, deadline=10)
+        calls = []
+
+        async def failing():
+            calls.append(1)
+            raise UpstreamError(f"503 #{len(calls)}")
+
+        with self.assertRaisesRegex(UpstreamError, '#2'):
+            await guard.call(failing, hedge=False)
+        self.assertEqual(guard.retries, 1)
+
+    async def test_attempt_timeout_counts_as_failure(self):
+        guard = UpstreamGuard('test', attempts=1)
+
+        async def stalled():
+            await asyncio.sleep(1)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await guard.call(stalled, hedge=False, timeout=0.05)
+        self.assertEqual(guard.failures, 1)
+
+    async def test_slow_request_is_hedged_and_the_hedge_wins(self):
+        guard = UpstreamGuard('test', attempts=1, hedge_delay=0.05)
+        calls = []
+        cancelled = []
+
+        async def first_slow():
+            calls.append(1)
+            if len(calls) == 1:
+                try:
+                    await asyncio.sleep(1)
+                except asyncio.CancelledError:
+                    cancelled.append(1)
+                    raise
+                return 'slow'
+            return 'fast'
+
+        self.assertEqual(await guard.call(first_slow), 'fast')
+        self.assertEqual(guard.hedges, 1)
+        self.assertEqual(guard.hedge_wins, 1)
+        self.assertEqual(cancelled, [1])
+
+    async def test_primary_finishing_first_is_not_a_hedge_win(self):
+        guard = UpstreamGuard('test', attempts=1, hedge_delay=0.05)
+        calls = []
+
+        async def primary_first():
+            calls.append(1)
+            await asyncio.sleep(0.1 if len(calls) == 1 else 1)
+            return len(calls)
+
+        self.assertEqual(await guard.call(primary_first), 2)
+        self.assertEqual(guard.hedges, 1)
+        self.assertEqual(guard.hedge_wins, 0)
+
+    async def test_fast_request_is_not_hedged(self):
+        guard = UpstreamGuard('test', attempts=1, hedge_delay=0.2)
+
+        async def fast():
+            return 'ok'
+
+        self.assertEqual(await guard.call(fast), 'ok')
+        self.assertEqual(guard.hedges, 0)
+
+
+class FailingPage:
+    """A browser page whose navigation or challenge never succeeds"""
+
+    def __init__(self, goto_error=None):
+        self.goto_error = goto_error
+        self.gotos = 0
+        self.url = 'about:blank'
+
+    async def goto(self, url, **kwargs):
+        self.gotos += 1
+        if self.goto_error:
+            raise self.goto_error
+        return None
+
+    async def wait_for_function(self, expression, **kwargs):
+        raise TimeoutError("Timeout 15000ms exceeded")
+
+    async def content(self):
+        return "<html><body>Checking your browser...</body></html>"
+
+
+class FakeBrowserPool:
+
+    def __init__(self, page):
+        self._page = page
+
+    async def ready(self):
+        return True
+
+    @asynccontextmanager
+    async def page(self):
+        yield self._page
+
+
+class BrowserSolveBreakerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        for name, value in (('API_ID', '1'), ('API_HASH', 'test'), ('BOT_TOKEN', '1:test')):
+            os.environ.setdefault(name, value)
+        from main import InstagramDownloaderBot
+        self.bot = InstagramDownloaderBot()
+        self.guard = UpstreamGuard('fastbox', attempts=1, min_calls=2, window=2, cooldown=60)
+        self.bot.upstreams['fastbox'] = self.guard
+
+    async def asyncTearDown(self):
+        self.bot.file_id_cache.close()
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    async def test_navigation_errors_open_the_fastbox_circuit(self):
+        page = FailingPage(goto_error=TimeoutError("Timeout 30000ms exceeded"))
+        self.bot.browser_pool = FakeBrowserPool(page)
+
+        for _ in range(2):
+            self.assertIsNone(await self.bot.get_terabox_data('https://terabox.com/s/1abc'))
+        self.assertEqual(self.guard.failures, 2)
+        self.assertEqual(self.guard.state, self.guard.OPEN)
+
+        self.assertIsNone(await self.bot.get_terabox_data('https://terabox.com/s/1abc'))
+        self.assertEqual(page.gotos, 2)
+        self.assertEqual(self.guard.rejected, 1)
+
+    async def test_unsolved_challenge_counts_as_failure(self):
+        self.bot.browser_pool = FakeBrowserPool(FailingPage())
+
+        with self.assertRaisesRegex(UpstreamError, 'did not complete'):
+            await self.bot.solve_js_challenge_with_playwright('https://terabox.com/s/1abc')
+        self.assertIsNone(await self.bot.get_terabox_data('https://terabox.com/s/1abc'))
+        self.assertEqual(self.guard.failures, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
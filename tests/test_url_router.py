@@ -0,0 +1,46 @@
+"""UrlRouter: canonical keys shared by every spelling of one share."""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import UrlRouter, canonical_url
+
+
+class CanonicalKeyTest(unittest.TestCase):
+
+    def assertSameKey(self, *urls):
+        keys = {canonical_url(url) for url in urls}
+        self.assertEqual(len(keys), 1, keys)
+
+    def test_terabox_short_and_surl_links(self):
+        self.assertSameKey(
+            'https://terabox.com/s/1abcDEF',
+            'https://www.1024terabox.com/s/1abcDEF/',
+            'https://teraboxapp.com/sharing/link?surl=abcDEF',
+            'https://terabox.app/sharing/link?surl=abcDEF&from=share'
+        )
+
+    def test_reel_and_reels(self):
+        self.assertSameKey(
+            'https://www.instagram.com/reel/XYZ/',
+            'https://instagram.com/reels/XYZ',
+            'https://instagram.com/reel/XYZ/?igsh=abc'
+        )
+
+    def test_ids_stay_distinct(self):
+        self.assertNotEqual(canonical_url('https://terabox.com/s/1abc'), canonical_url('https://terabox.com/s/1abd'))
+        self.assertNotEqual(canonical_url('https://instagram.com/reel/AbC'), canonical_url('https://instagram.com/reel/abc'))
+
+    def test_routes_deduplicate_equivalent_links_and_keep_the_original_url(self):
+        routes = UrlRouter().routes(
+            "https://terabox.com/s/1abc https://nephobox.com/sharing/link?surl=abc "
+            "https://instagram.com/reels/Q https://www.instagram.com/reel/Q/"
+        )
+        self.assertEqual([route.url for route in routes], ['https://terabox.com/s/1abc', 'https://instagram.com/reels/Q'])
+        self.assertEqual([route.kind for route in routes], ['terabox', 'instagram_reel'])
+
+
+if __name__ == '__main__':
+    unittest.main()